@@ -0,0 +1,166 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        ladderCompiler.py
+#
+# Purpose:     This module will provide a compiler to convert the T-flip-flop latching
+#              relay ladder config (used by the signal PLC) to packed integer bitmasks,
+#              so all the output coils can be calculated with a few big integer bit
+#              operations instead of walking the config item by item.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2023/08/03
+# Version:     v_0.1
+# Copyright:   Copyright (c) 2023 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+""" Program Design:
+
+    The flip-flop ladder config is a list of items:
+        {'coilIdx': <src coil idx>, 'onRegIdx': (reg idx, ...), 'offRegIdx': (reg idx, ...)}
+    Output coil i (the i-th config item) is:
+        - turned off if its current coil state is on and any 'off' register is 1.
+        - turned on if its current coil state is off and any 'on' register is 1.
+        - kept in the current state for the other cases.
+    The compiler converts the config to, for every register, the list of output coils
+    bits it toggles on/off, grouped in SEG_BITS wide coils segments (segment index, bits
+    mask int). During the scan only the registers which are 1 are visited:
+        onHit  = OR(onMasks of the set registers)
+        offHit = OR(offMasks of the set registers)
+        coils' = (coils & ~offHit) | (~coils & onHit)
+    runBits() loops over the set registers (found by the bytes of the packed registers
+    int) and ORs each register's segment masks, then the last step is done with big
+    integer bit operations on all the coils at once. So the scan cost is (set registers
+    number x the register's coils segments) small int ORs + a few big int operations,
+    the config items are not visited. The run() function packs the registers/coils
+    lists to ints and unpacks the result int to a list, which are per element list
+    operations, the runBits() function can be used directly with the packed ints to
+    skip them.
+    numpy is not a dependency of the project, so the packed ints are used as the bit
+    vectors.
+"""
+
+import time
+import random
+
+BYTE_BITS = 8
+SEG_BITS = 1024     # coils segment width of the hit bits accumulation.
+
+# set bits positions of every byte value.
+BIT_POS = [tuple(i for i in range(BYTE_BITS) if val >> i & 1) for val in range(1 << BYTE_BITS)]
+# byte => '0'/'1' char table used by the bits packing, only value 1 (True) is set.
+PACK_TABLE = bytes(ord('1') if val == 1 else ord('0') for val in range(256))
+
+#-----------------------------------------------------------------------------
+def packBits(stateList):
+    """ Pack the state list to an int, bit i is 1 if stateList[i] == 1 (True)."""
+    if len(stateList) == 0: return 0
+    try:
+        return int(bytes(stateList).translate(PACK_TABLE)[::-1], 2)
+    except (ValueError, TypeError):
+        # not byte values, pack one by one.
+        result = 0
+        for i, state in enumerate(stateList):
+            if state == 1: result |= 1 << i
+        return result
+
+def unpackBits(bitsInt, bitsCount):
+    """ Unpack the int to a bool list with bitsCount elements."""
+    bitsStr = format(bitsInt, 'b').zfill(bitsCount)[::-1]
+    return [char == '1' for char in bitsStr[:bitsCount]]
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class flipFlopEngine(object):
+    """ Compiled T-flip-flop ladder, init example:
+            engine = flipFlopEngine(ffConfig, 39)
+            coilsRsl = engine.run(regsList, coilList)
+    """
+    def __init__(self, ffConfig, regsNum):
+        self.regsNum = regsNum
+        self.regsBytes = (regsNum + BYTE_BITS - 1) // BYTE_BITS
+        self.coilsNum = len(ffConfig)
+        self.coilsMask = (1 << self.coilsNum) - 1
+        self.segNum = max(1, (self.coilsNum + SEG_BITS - 1) // SEG_BITS)
+        # source coil index of each output, None if the output i reads the coil i.
+        srcIdxList = [item['coilIdx'] for item in ffConfig]
+        self.srcIdxList = None if srcIdxList == list(range(self.coilsNum)) else srcIdxList
+        self.onMasks = self._buildMasks(ffConfig, 'onRegIdx')
+        self.offMasks = self._buildMasks(ffConfig, 'offRegIdx')
+
+    def _buildMasks(self, ffConfig, regKey):
+        """ Build the [(segIdx, bits mask), ...] output coils list of each register."""
+        regMasks = [{} for _ in range(self.regsNum)]
+        for coilBit, item in enumerate(ffConfig):
+            for regIdx in item[regKey]:
+                if not 0 <= regIdx < self.regsNum:
+                    raise ValueError("flipFlopEngine: register idx %s out of range." %str(regIdx))
+                segIdx = coilBit // SEG_BITS
+                regMasks[regIdx][segIdx] = regMasks[regIdx].get(segIdx, 0) | (1 << (coilBit % SEG_BITS))
+        return [tuple(masks.items()) for masks in regMasks]
+
+    def _joinSegs(self, segs):
+        """ Join the segments hit bits to one int."""
+        if self.segNum == 1: return segs[0]
+        return int.from_bytes(b''.join(seg.to_bytes(SEG_BITS // BYTE_BITS, 'little') for seg in segs), 'little')
+
+#-----------------------------------------------------------------------------
+    def runBits(self, regsInt, coilsInt):
+        """ Calculate the output coils int from the packed registers/source coils ints."""
+        onSegs, offSegs = [0] * self.segNum, [0] * self.segNum
+        regsBytes = (regsInt & ((1 << self.regsNum) - 1)).to_bytes(self.regsBytes, 'little')
+        for byteIdx, byteVal in enumerate(regsBytes):
+            if not byteVal: continue
+            baseIdx = byteIdx * BYTE_BITS
+            for bitIdx in BIT_POS[byteVal]:
+                for segIdx, mask in self.onMasks[baseIdx + bitIdx]: onSegs[segIdx] |= mask
+                for segIdx, mask in self.offMasks[baseIdx + bitIdx]: offSegs[segIdx] |= mask
+        onHit, offHit = self._joinSegs(onSegs), self._joinSegs(offSegs)
+        return ((coilsInt & ~offHit) | (~coilsInt & onHit)) & self.coilsMask
+
+    def run(self, regsList, coilList):
+        """ Calculate the output coils state list from the registers/coils lists."""
+        if self.srcIdxList is None:
+            coilsInt = packBits(coilList[:self.coilsNum])
+        else:
+            coilsInt = packBits([coilList[idx] for idx in self.srcIdxList])
+        return unpackBits(self.runBits(packBits(regsList[:self.regsNum]), coilsInt), self.coilsNum)
+
+#-----------------------------------------------------------------------------
+def runFlipFlopRef(ffConfig, regsList, coilList):
+    """ Reference (item by item) flip-flop ladder calculation used by the test."""
+    coilsRsl = []
+    for item in ffConfig:
+        coilState = coilList[item['coilIdx']]
+        if coilState:
+            if any(regsList[i] == 1 for i in item['offRegIdx']): coilState = False
+        else:
+            if any(regsList[i] == 1 for i in item['onRegIdx']): coilState = True
+        coilsRsl.append(bool(coilState))
+    return coilsRsl
+
+def testCase(coilsNum=19000, regsNum=39000, loopNum=20):
+    """ Compare the compiled engine with the reference calculation."""
+    ffConfig = [{'coilIdx': i,
+                 'onRegIdx': tuple(random.sample(range(regsNum), random.randint(1, 2))),
+                 'offRegIdx': tuple(random.sample(range(regsNum), random.randint(1, 2)))}
+                for i in range(coilsNum)]
+    engine = flipFlopEngine(ffConfig, regsNum)
+    passed = True
+    refT = engineT = 0
+    for _ in range(loopNum):
+        regsList = [1 if random.random() < 0.05 else 0 for _ in range(regsNum)]
+        coilList = [random.random() < 0.5 for _ in range(coilsNum)]
+        startT = time.perf_counter()
+        refRsl = runFlipFlopRef(ffConfig, regsList, coilList)
+        refT += time.perf_counter() - startT
+        startT = time.perf_counter()
+        rsl = engine.run(regsList, coilList)
+        engineT += time.perf_counter() - startT
+        passed = passed and rsl == refRsl
+    print(" - flipFlopEngine %s coils test passed: %s" %(str(coilsNum), str(passed)))
+    print(" - reference: %.3f ms/scan, compiled: %.3f ms/scan" %(refT/loopNum*1000, engineT/loopNum*1000))
+
+if __name__ == "__main__":
+    testCase(coilsNum=19, regsNum=39)
+    testCase()
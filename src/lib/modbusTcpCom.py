@@ -35,27 +35,234 @@
             will auto passed in the runLadderLogic() function.
         7. runLadderLogic() will return the calculated coils list result, plcDataHandler will set 
             the destination coils with the result.
+        The ladder can use the TON/TOF/TP timers and CTU/CTD counters (lib/plcTimers.py) created 
+        by addTimer()/addCounter() in initLadderInfo(), the ladder will be re-evaluated when its 
+        timers expire.
 
     - plcDataHandler: A pyModbusTcp.dataHandler module to keep one allow read white list and one 
         allow write white list to filter the client's coils or registers read and write request.
         As most of the PLC are using the input => register (memory) parameter config, they are 
         not allowed to change the input directly, we only provide the coil and holding register 
-        write functions.
+        write functions. The handler tracks the written (dirty) registers/coils ranges, the
+        updateState() only evaluates the ladders whose input ranges intersect the dirty 
+        ranges and whose input values changed since the last evaluation. The ladders are 
+        scheduled in the topological order of the dependency graph built from their source
+        and destination coils ranges (a ladder writes the coils another ladder reads), the
+        ladders in one graph level are independent from each other.
     
     - modbusTcpClient: Modbus-TCP client module to read/write holding register and coils data 
-        from/to the target PLC. 
+        from/to the target PLC. The multiple coils/registers write functions (FC15/FC16) and 
+        the batch change apply functions will group the contiguous address changes in as 
+        few modbus requests as possible.
+
+    - modbusReadPlanner: Read planner to collect all the holding registers/coils ranges the 
+        UI panels need, merge the overlapping or adjacent ranges (up to the 125 registers/2000 
+        coils per request limits) to the minimal read requests and fan the read results back 
+        out to each range subscriber.
+
+    - modbusConnMgr: Connection manager thread to open a group of modbusTcpClient concurrently
+        and reconnect the disconnected clients in background with exponential backoff + 
+        random jitter, the state transitions are reported by the state change callback.
+
+    - plcUnitRouter: A pyModbusTcp.dataHandler to route the requests to several plcDataHandler
+        by the request's modbus unit ID, so several PLCs can share one modbus server port.
 
     - modbusTcpServer: Modbus-TCP server module will be used by PLC module to handle the modbus 
         data read/set request. If the input data handler is None, the server will create and keep 
         one empt databank inside.
+
+    - modbusAsyncServer: Modbus-TCP server (FC 1/2/3/4/5/6/15/16) running all the connections
+        in one asyncio event loop instead of one thread per client, it uses the same data
+        handler interface as the modbusTcpServer. The read requests are answered directly in
+        the event loop (fast path), the write requests are executed in one writer thread (the
+        ladder update may wait for the PLC scan lock) and the connection's next request waits
+        until the write reply is sent. The memory is bounded: the connections number is limited
+        (the extra connections are closed), each connection only buffers <maxQueue> requests
+        (then stop reading the socket, the TCP flow control slows down the client) and the
+        idle connections are closed after <idleTO> (default CONN_IDLE_TO) sec.
 """
 
 import time
+import random
+import struct
+import asyncio
+import threading
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from pyModbusTCP.client import ModbusClient
 from pyModbusTCP.server import ModbusServer, DataHandler, DataBank
-from pyModbusTCP.constants import EXP_ILLEGAL_FUNCTION
+from pyModbusTCP.constants import EXP_NONE, EXP_ILLEGAL_FUNCTION, EXP_DATA_ADDRESS, \
+    EXP_DATA_VALUE, EXP_SLAVE_DEVICE_FAILURE, EXP_GATEWAY_PATH_UNAVAILABLE
+
+import plcTimers
+import ladderCompiler
+
+# Max number of items in one write request (modbus spec):
+MAX_WRITE_COILS = 1968  # FC15 write multiple coils.
+MAX_WRITE_REGS = 123    # FC16 write multiple registers.
+# Max number of items in one read request (modbus spec):
+MAX_READ_COILS = 2000   # FC1 read coils.
+MAX_READ_REGS = 125     # FC3 read holding registers.
+
+# Memory type of the read planner range.
+MEM_HREGS = 'hRegs'
+MEM_COILS = 'coils'
+
+# Modbus TCP async server config:
+MAX_CONN = 2000         # max number of the concurrent client connections.
+MAX_CONN_QUEUE = 16     # max number of the buffered requests of one connection.
+CONN_IDLE_TO = 60       # close the connection without request in 60 sec.
+MAX_ADU_SZ = 260        # max modbus TCP frame size (MBAP header 7 bytes + PDU 253 bytes).
+MBAP_HEADER = struct.Struct('>HHHB')    # transaction ID, protocol ID, length, unit ID.
+PDU_HEADER = struct.Struct('>BHH')      # function code, address, quantity/value.
+READ_FCS = {1: ('read_coils', MAX_READ_COILS), 2: ('read_d_inputs', MAX_READ_COILS),
+            3: ('read_h_regs', MAX_READ_REGS), 4: ('read_i_regs', MAX_READ_REGS)}
+WRITE_FCS = (5, 6, 15, 16)
+
+# Connection manager reconnect backoff config:
+RECONN_INIT = 0.5       # first reconnect delay (sec).
+RECONN_MAX = 30         # max reconnect delay (sec).
+RECONN_JITTER = 0.2     # +/- 20% random jitter of the delay.
+
+# Connection state reported by the connection manager.
+STATE_DISCONNECTED = 'disconnected'
+STATE_CONNECTING = 'connecting'
+STATE_CONNECTED = 'connected'
+
+#-----------------------------------------------------------------------------
+def groupChanges(changeDict, maxLen):
+    """ Group the {address: value} changes to the contiguous address runs.
+        Args:
+            changeDict (dict): {addressIdx: value}
+            maxLen (int): max run length (modbus request items limit).
+        Returns:
+            list: [(startAddressIdx, [val1, val2, ...]), ...] sorted by address.
+    """
+    runs = []
+    for addressIdx in sorted(changeDict.keys()):
+        if runs and runs[-1][0] + len(runs[-1][1]) == addressIdx and len(runs[-1][1]) < maxLen:
+            runs[-1][1].append(changeDict[addressIdx])
+        else:
+            runs.append((addressIdx, [changeDict[addressIdx]]))
+    return runs
+
+def mergeRanges(rangeList, maxLen):
+    """ Merge the overlapping or adjacent [startIdx, endIdx) ranges, the merged range
+        longer than maxLen will be split.
+        Args:
+            rangeList (list): [(startIdx, endIdx), ...]
+            maxLen (int): max range length (modbus request items limit).
+        Returns:
+            list: merged [(startIdx, endIdx), ...] sorted by startIdx.
+    """
+    merged = []
+    for startIdx, endIdx in sorted(rangeList):
+        if endIdx <= startIdx: continue
+        if merged and startIdx <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], endIdx)
+        else:
+            merged.append([startIdx, endIdx])
+    result = []
+    for startIdx, endIdx in merged:
+        for idx in range(startIdx, endIdx, maxLen):
+            result.append((idx, min(idx + maxLen, endIdx)))
+    return result
+
+def isRangeDirty(startIdx, offset, dirtyList):
+    """ Check whether the [startIdx, startIdx + offset) range intersects any of the 
+        dirty [start, end) ranges in the dirtyList.
+    """
+    if startIdx is None or offset is None: return False
+    endIdx = startIdx + offset
+    return any(start < endIdx and end > startIdx for start, end in dirtyList)
+
+def buildLadderGraph(ladderInfoList):
+    """ Build the ladders dependency graph.
+        Args:
+            ladderInfoList (list): [(srcCoilsRange, destCoilsRange), ...] in the ladders 
+                add in sequence, range is (startIdx, endIdx) or None.
+        Returns:
+            list: edges list, edges[i] is the set of ladders which must run after ladder i:
+                - ladder j reads the coils ladder i writes (data dependency).
+                - ladder j (added after i) writes the coils ladder i writes (keep the add 
+                    in sequence output overwrite priority).
+                The self dependency (latching ladder reads its own output) is not an edge.
+    """
+    def overlap(rangeA, rangeB):
+        return rangeA is not None and rangeB is not None and rangeA[0] < rangeB[1] and rangeB[0] < rangeA[1]
+    edges = [set() for _ in ladderInfoList]
+    for i, (_, destI) in enumerate(ladderInfoList):
+        for j, (srcJ, destJ) in enumerate(ladderInfoList):
+            if i == j: continue
+            if overlap(destI, srcJ) or (i < j and overlap(destI, destJ)): edges[i].add(j)
+    return edges
+
+def findGraphCycles(edges):
+    """ Return the strongly connected components with more than one node (the cycles)
+        of the graph (Tarjan's algorithm, iterative).
+    """
+    index, lowLink, onStack, stack, cycles = {}, {}, set(), [], []
+    counter = 0
+    for root in range(len(edges)):
+        if root in index: continue
+        workList = [(root, iter(sorted(edges[root])))]
+        index[root] = lowLink[root] = counter
+        counter += 1
+        stack.append(root)
+        onStack.add(root)
+        while workList:
+            node, children = workList[-1]
+            child = next(children, None)
+            if child is not None:
+                if child not in index:
+                    index[child] = lowLink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    onStack.add(child)
+                    workList.append((child, iter(sorted(edges[child]))))
+                elif child in onStack:
+                    lowLink[node] = min(lowLink[node], index[child])
+                continue
+            workList.pop()
+            if workList: lowLink[workList[-1][0]] = min(lowLink[workList[-1][0]], lowLink[node])
+            if lowLink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    onStack.discard(member)
+                    component.append(member)
+                    if member == node: break
+                if len(component) > 1: cycles.append(sorted(component))
+    return cycles
+
+def scheduleLadders(edges):
+    """ Sort the ladders graph to levels (Kahn's algorithm), every ladder in one level 
+        only depends on the ladders in the previous levels. If there is a cycle, the 
+        cycle is broken at its first added ladder (found by findGraphCycles()).
+        Returns:
+            list: [[ladder idx, ...], ...] levels list, ladders in add in sequence.
+    """
+    inDegree = [0] * len(edges)
+    for children in edges:
+        for child in children: inDegree[child] += 1
+    remaining = set(range(len(edges)))
+    cycles = None
+    levels = []
+    while remaining:
+        level = sorted(node for node in remaining if inDegree[node] == 0)
+        if not level:
+            # cycle: run the first added remaining ladder of the first cycle alone, a 
+            # ladder downstream of the cycle must still wait for the cycle's outputs.
+            if cycles is None: cycles = findGraphCycles(edges)
+            level = next([node] for cycle in cycles for node in cycle if node in remaining)
+        for node in level:
+            remaining.discard(node)
+            inDegree[node] = -1
+            for child in edges[node]:
+                if child in remaining: inDegree[child] -= 1
+        levels.append(level)
+    return levels
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -71,6 +278,8 @@ class ladderLogic(object):
         self.holdingRegsInfo = {'address': None, 'offset': None}
         self.srcCoilsInfo = {'address': None, 'offset': None}
         self.destCoilsInfo = {'address': None, 'offset': None}
+        self.timerDict = OrderedDict()
+        self.counterDict = OrderedDict()
         self.initLadderInfo()
 
     def initLadderInfo(self):
@@ -94,6 +303,33 @@ class ladderLogic(object):
     def getDestCoilsInfo(self):
         return self.destCoilsInfo
 
+    def getTimers(self):
+        return self.timerDict
+
+    def getTimer(self, timerKey):
+        return self.timerDict.get(timerKey)
+
+    def getCounter(self, counterKey):
+        return self.counterDict.get(counterKey)
+
+#-----------------------------------------------------------------------------
+    def addTimer(self, timerKey, timerType, presetT):
+        """ Create a timer function block used in runLadderLogic().
+            Args:
+                timerKey (str): timer name.
+                timerType (str): plcTimers.TON/TOF/TP
+                presetT (float): timer preset time (sec).
+            Returns:
+                plcTimers.plcTimer: the timer obj.
+        """
+        self.timerDict[timerKey] = plcTimers.plcTimer(timerType, presetT)
+        return self.timerDict[timerKey]
+
+    def addCounter(self, counterKey, counterType, presetV):
+        """ Create a counter function block (plcTimers.CTU/CTD) used in runLadderLogic()."""
+        self.counterDict[counterKey] = plcTimers.plcCounter(counterType, presetV)
+        return self.counterDict[counterKey]
+
 #-----------------------------------------------------------------------------
     def runLadderLogic(self, regsList, coilList=None):
         """ Pass in the registers state list, source coils state list and 
@@ -128,6 +364,19 @@ class plcDataHandler(DataHandler):
         self.allowWipList = allowWipList
         self.autoUpdate = False # auto update if the holding register state changed. 
         self.ladderDict = OrderedDict()
+        # written but not evaluated ranges {memType: [(startIdx, endIdx), ...]}
+        self.dirtyDict = {MEM_HREGS: [], MEM_COILS: []}
+        # memory written times counter {memType: n}, used to check the memory changes.
+        self.writeVersion = {MEM_HREGS: 0, MEM_COILS: 0}
+        self.dirtyLock = threading.Lock()
+        self.scanLock = threading.Lock()
+        # last evaluation cache {ladderKey: (regState, srcCoilState, destCoilState)}
+        self.ladderCache = {}
+        # per ladder evaluation counters {ladderKey: {'evaluated': n, 'unchanged': n, ...}}
+        self.ladderStats = OrderedDict()
+        self.scanLevels = None  # scheduled ladders levels [[ladderKey, ...], ...] cache.
+        self.ladderCycles = []  # ladders dependency cycles [[ladderKey, ...], ...]
+        self.timerBank = plcTimers.timerBank()  # ladders' timers driven by the timer wheel.
 
     def _checkAllowRead(self, ipaddress):
         """ Check whether the input IP addres is allowed to read the info."""
@@ -149,14 +398,38 @@ class plcDataHandler(DataHandler):
         self.serverInfo = serverInfo
 
     def addLadderLogic(self, ladderKey, logicObj):
-        """ Add a <ladderLogic> obj in the ladder logic, all the ladder logic will be executed 
-            in the add in sequence. So the logic execution piority will follow the add in 
-            sequence, the next logic result will over write the previous one.
+        """ Add a <ladderLogic> obj in the ladder logic, the ladders are executed in the 
+            topological order of their coils dependency graph (a ladder reading the coils 
+            written by other ladders runs after them). If several ladders write the same 
+            coils, the logic execution piority will follow the add in sequence, the next 
+            logic result will over write the previous one.
             Args:
                 ladderKey (str): ladder logic name
                 logicObj (ladderLogic): _description_
         """
         self.ladderDict[ladderKey] = logicObj
+        self.scanLevels = None
+        self.timerBank.bindTimers(ladderKey, logicObj.getTimers())
+        self.ladderCache.pop(ladderKey, None)
+        self.ladderStats[ladderKey] = {'evaluated': 0, 'unchanged': 0, 'skipped': 0, 'reapplied': 0}
+
+    def markDirty(self, memType, address, offset):
+        """ Record the written [address, address + offset) range of the memory type."""
+        with self.dirtyLock:
+            self.dirtyDict[memType].append((address, address + offset))
+            self.writeVersion[memType] += 1
+
+    def getWriteVersion(self, memType):
+        """ Return the memory type's written times counter, the counter changes after 
+            every coils/holding registers write.
+        """
+        return self.writeVersion[memType]
+
+    def _popDirty(self):
+        with self.dirtyLock:
+            dirtyDict = self.dirtyDict
+            self.dirtyDict = {MEM_HREGS: [], MEM_COILS: []}
+        return dirtyDict
 
 #-----------------------------------------------------------------------------
 # Init all the iterator read() functions.(Internal callback by <modbusTcpServer>)
@@ -213,7 +486,9 @@ class plcDataHandler(DataHandler):
         """ Write the PLC out coils."""
         try:
             if self._checkAllowWrite(srv_info.client.address):
-                return super().write_coils(address, bits_l, srv_info)
+                result = super().write_coils(address, bits_l, srv_info)
+                self.markDirty(MEM_COILS, address, len(bits_l))
+                return result
         except Exception as err:
             print("write_coils() Error: %s" %str(err))
         return DataHandler.Return(exp_code=EXP_ILLEGAL_FUNCTION)
@@ -223,6 +498,7 @@ class plcDataHandler(DataHandler):
         try:
             if self._checkAllowWrite(srv_info.client.address):
                 result = super().write_h_regs(address, words_l, srv_info)
+                self.markDirty(MEM_HREGS, address, len(words_l))
                 if self.autoUpdate: self.updateState()
                 return result
         except Exception as err:
@@ -262,8 +538,19 @@ class plcDataHandler(DataHandler):
         print("setAllowWriteIpaddresses(): the input IP list is not valid.")
         return False
 
+    def getLadderStats(self):
+        """ Return the per ladder evaluation counters: 
+            {ladderKey: {'evaluated': n, 'unchanged': n, 'skipped': n, 'reapplied': n}}
+            - evaluated: runLadderLogic() called.
+            - unchanged: input ranges written but the values are not changed.
+            - skipped: input ranges not written.
+            - reapplied: output coils overwritten, the cached result is written back.
+        """
+        return {key: dict(val) for key, val in self.ladderStats.items()}
+
     def updateOutPutCoils(self, address, bitList):
         if self.serverInfo:
+            self.markDirty(MEM_COILS, address, len(bitList))
             return super().write_coils(address, bitList, self.serverInfo)
         print("updateOutPutCoils() Error: Parent modBus server not config, call initServerInfo() first.")
         return False
@@ -271,48 +558,208 @@ class plcDataHandler(DataHandler):
     def updateHoldingRegs(self, address, bitList):
         if self.serverInfo:
             result = super().write_h_regs(address, bitList, self.serverInfo)
+            self.markDirty(MEM_HREGS, address, len(bitList))
             if self.autoUpdate: self.updateState()
             return result
         print("updateHoldingRegs() Error: Parent modBus server not config, call initServerInfo() first.")
         return False
 
-    def updateState(self):
-        """ Update the PLC state base on the input ladder logic one by one."""
-        for key, item in self.ladderDict.items():
-            print("updateState(): update ladder logic: %s" %str(key))
-            # get the ladder logic related registers state.
-            holdRegsInfo = item.getHoldingRegsInfo()
-            if holdRegsInfo['address'] is None or holdRegsInfo['offset'] is None: continue
-            regState = self.getHoldingRegState(holdRegsInfo['address'], holdRegsInfo['offset'])
-            # get the ladder logic related coils state. 
-            srcCoilState = None
-            srcCoilInfo = item.getSrcCoilsInfo()
-            if srcCoilInfo['address'] is None or srcCoilInfo['offset'] is None:
-                pass
-            else:
-                srcCoilState = self.getCoilState(srcCoilInfo['address'], srcCoilInfo['offset'])
-            # calculate the output coils state and update the coils.
-            destCoilState = item.runLadderLogic(regState, coilList=srcCoilState)
-            if destCoilState is None or len(destCoilState) == 0: continue
-            destCoidInfo = item.getDestCoilsInfo()
-            self.updateOutPutCoils(destCoidInfo['address'], destCoilState)
+    def updateHoldingRegsChanges(self, changeDict):
+        """ Write the changed holding registers by contiguous address runs, the ladder
+            logic is updated once after all the runs are written.
+            Args:
+                changeDict (dict): {addressIdx: value}
+        """
+        if self.serverInfo:
+            for address, valList in groupChanges(changeDict, max(1, len(changeDict))):
+                super().write_h_regs(address, valList, self.serverInfo)
+                self.markDirty(MEM_HREGS, address, len(valList))
+            if changeDict and self.autoUpdate: self.updateState()
+            return True
+        print("updateHoldingRegsChanges() Error: Parent modBus server not config, call initServerInfo() first.")
+        return False
+
+    def getScanLevels(self):
+        """ Return the scheduled ladders levels [[ladderKey, ...], ...], the graph is
+            rebuilt after a ladder is added.
+        """
+        if self.scanLevels is None:
+            keys = list(self.ladderDict.keys())
+            ladderInfoList = []
+            for item in self.ladderDict.values():
+                rangeList = []
+                for info in (item.getSrcCoilsInfo(), item.getDestCoilsInfo()):
+                    if info['address'] is None or info['offset'] is None:
+                        rangeList.append(None)
+                    else:
+                        rangeList.append((info['address'], info['address'] + info['offset']))
+                ladderInfoList.append(tuple(rangeList))
+            edges = buildLadderGraph(ladderInfoList)
+            self.ladderCycles = [[keys[i] for i in cycle] for cycle in findGraphCycles(edges)]
+            for cycle in self.ladderCycles:
+                print("getScanLevels() Warning: ladders dependency cycle: %s" %str(cycle))
+            self.scanLevels = [[keys[i] for i in level] for level in scheduleLadders(edges)]
+        return self.scanLevels
+
+    def getLadderCycles(self):
+        self.getScanLevels()
+        return self.ladderCycles
+
+    def tickTimers(self):
+        """ Move the ladders' timer wheel to the current time and update the PLC state
+            if any timer expired, call this function in the PLC scan cycle.
+            Returns:
+                int: the expired timers number.
+        """
+        expiredNum = self.timerBank.advance()
+        if expiredNum: self.updateState()
+        return expiredNum
+
+    def updateState(self, fullScan=False):
+        """ Update the PLC state base on the input ladder logic level by level, only the 
+            ladders whose input registers/coils ranges are written since the last update
+            and whose input values changed (or whose timers expired in tickTimers()) will 
+            be evaluated.
+            Args:
+                fullScan (bool, optional): evaluate all the ladders. Defaults to False.
+        """
+        with self.scanLock:
+            dirtyDict = self._popDirty()
+            expiredKeys = self.timerBank.popExpired()
+            scanDirtyCoils = []  # coils ranges written by the ladders in this scan.
+            for level in self.getScanLevels():
+                dirtyCoils = dirtyDict[MEM_COILS] + scanDirtyCoils
+                evalJobs, reapplyKeys = [], []
+                for key in level:
+                    item = self.ladderDict[key]
+                    holdRegsInfo = item.getHoldingRegsInfo()
+                    if holdRegsInfo['address'] is None or holdRegsInfo['offset'] is None: continue
+                    srcCoilInfo = item.getSrcCoilsInfo()
+                    cache = self.ladderCache.get(key)
+                    inputDirty = fullScan or cache is None or key in expiredKeys \
+                        or isRangeDirty(holdRegsInfo['address'], holdRegsInfo['offset'], dirtyDict[MEM_HREGS]) \
+                        or isRangeDirty(srcCoilInfo['address'], srcCoilInfo['offset'], dirtyCoils)
+                    if inputDirty:
+                        # get the ladder logic related registers and coils state.
+                        regState = self.getHoldingRegState(holdRegsInfo['address'], holdRegsInfo['offset'])
+                        srcCoilState = None
+                        if not (srcCoilInfo['address'] is None or srcCoilInfo['offset'] is None):
+                            srcCoilState = self.getCoilState(srcCoilInfo['address'], srcCoilInfo['offset'])
+                        if fullScan or cache is None or key in expiredKeys \
+                                or cache[0] != regState or cache[1] != srcCoilState:
+                            evalJobs.append((key, item, regState, srcCoilState))
+                            continue
+                        self.ladderStats[key]['unchanged'] += 1
+                    else:
+                        self.ladderStats[key]['skipped'] += 1
+                    reapplyKeys.append(key)
+                # calculate the output coils state, the ladders in one level are independent.
+                for key, item, regState, srcCoilState in evalJobs:
+                    destCoilState = item.runLadderLogic(regState, coilList=srcCoilState)
+                    print("updateState(): update ladder logic: %s" %str(key))
+                    self.ladderStats[key]['evaluated'] += 1
+                    self.ladderCache[key] = (regState, srcCoilState, destCoilState)
+                    destAddr = item.getDestCoilsInfo()['address']
+                    if self._writeDestCoils(destAddr, destCoilState):
+                        scanDirtyCoils.append((destAddr, destAddr + len(destCoilState)))
+                # the output coils are overwritten by the client or the previous ladder,
+                # write back the cached result.
+                for key in reapplyKeys:
+                    destCoilState = self.ladderCache[key][2]
+                    destAddr = self.ladderDict[key].getDestCoilsInfo()['address']
+                    if destCoilState and isRangeDirty(destAddr, len(destCoilState), dirtyCoils):
+                        if self._writeDestCoils(destAddr, destCoilState):
+                            self.ladderStats[key]['reapplied'] += 1
+                            scanDirtyCoils.append((destAddr, destAddr + len(destCoilState)))
+
+    def _writeDestCoils(self, address, destCoilState):
+        """ Write the ladder output coils if the state is changed, return True if written."""
+        if destCoilState is None or len(destCoilState) == 0: return False
+        currentState = self.getCoilState(address, len(destCoilState))
+        if currentState is not None and [bool(val) for val in currentState] == [bool(val) for val in destCoilState]:
+            return False
+        self.updateOutPutCoils(address, destCoilState)
+        return True
             
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class plcUnitRouter(DataHandler):
+    """ Data handler to route the modbus requests to the plcDataHandler registered with
+        the request's unit ID, the handler registered with unit ID None handles all
+        the unit IDs which are not registered. Init example:
+            router = plcUnitRouter()
+            router.addHandler(dataMgr1, unitID=1)
+            router.addHandler(dataMgr2, unitID=2)
+            server = modbusTcpServer(hostIp=hostIp, hostPort=hostPort, dataHandler=router)
+            router.initServerInfo(server.getServerInfo())
+    """
+    def __init__(self):
+        super().__init__(DataBank())
+        self.serverInfo = None
+        self.handlerDict = {}   # {unitID: plcDataHandler}
+
+    def initServerInfo(self, serverInfo):
+        """ Init the server information of all the registered data handlers."""
+        self.serverInfo = serverInfo
+        for handler in self.handlerDict.values():
+            handler.initServerInfo(serverInfo)
+
+    def addHandler(self, dataHandler, unitID=None):
+        """ Register the data handler with the modbus unit ID (0-255 or None)."""
+        if unitID in self.handlerDict.keys():
+            raise ValueError("plcUnitRouter: unit ID %s is already registered." %str(unitID))
+        self.handlerDict[unitID] = dataHandler
+        if self.serverInfo: dataHandler.initServerInfo(self.serverInfo)
+
+    def getHandler(self, unitID):
+        return self.handlerDict.get(unitID, self.handlerDict.get(None))
+
+    def _route(self, funcName, srv_info, *args):
+        handler = self.getHandler(srv_info.recv_frame.mbap.unit_id)
+        if handler is None: return DataHandler.Return(exp_code=EXP_GATEWAY_PATH_UNAVAILABLE)
+        return getattr(handler, funcName)(*args, srv_info)
+
+#-----------------------------------------------------------------------------
+    def read_coils(self, address, count, srv_info):
+        return self._route('read_coils', srv_info, address, count)
+
+    def read_d_inputs(self, address, count, srv_info):
+        return self._route('read_d_inputs', srv_info, address, count)
+
+    def read_h_regs(self, address, count, srv_info):
+        return self._route('read_h_regs', srv_info, address, count)
+
+    def read_i_regs(self, address, count, srv_info):
+        return self._route('read_i_regs', srv_info, address, count)
+
+    def write_coils(self, address, bits_l, srv_info):
+        return self._route('write_coils', srv_info, address, bits_l)
+
+    def write_h_regs(self, address, words_l, srv_info):
+        return self._route('write_h_regs', srv_info, address, words_l)
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class modbusTcpClient(object):
     """ Modbus-TCP client module to read/write data from/to PLC."""
-    def __init__(self, tgtIp, tgtPort=502, defaultTO=30) -> None:
+    def __init__(self, tgtIp, tgtPort=502, defaultTO=30, connect=True) -> None:
         """ Init example: client = modbusTcpCom.modbusTcpClient('127.0.0.1')
             Args:
                 tgtIp (str): target PLC ip Address. 
                 tgtPort (int, optional): modbus port. Defaults to 502.
                 defaultTO (int, optional): default time out if modbus server doesn't 
                     response. Defaults to 30 sec.
+                connect (bool, optional): try to connect to the PLC during init, set 
+                    to False to return immediately and let the <modbusConnMgr> open 
+                    the connection. Defaults to True.
         """
         self.tgtIp = tgtIp
         self.tgtPort = tgtPort
         self.client = ModbusClient(host=self.tgtIp, port=self.tgtPort, auto_open=True)
         self.client.timeout = defaultTO  # set time out.
+        # lock to serialize the requests from different threads (poller/UI) on the socket.
+        self.lock = threading.Lock()
+        if not connect: return
         # Try to connect to the PLC in 1 sec. 
         for _ in range(5):
             print('Try to login to the PLC unit: %s.' %str((self.tgtIp, self.tgtPort)))
@@ -328,6 +775,10 @@ class modbusTcpClient(object):
         """ return the last connection state."""
         return self.client.is_open
 
+    def reconnect(self):
+        """ (Re)open the TCP connection to the PLC, return True if connected."""
+        with self.lock: return self.client.open()
+
 #-----------------------------------------------------------------------------
 # Define all the get() functions here:
 # Return value type: 
@@ -338,14 +789,14 @@ class modbusTcpClient(object):
     def getCoilsBits(self, addressIdx, offset):
         """ Get the coils bit list [addressIdx: addressIdx + offset] of the PLC."""
         if self.client.is_open:
-            data = self.client.read_coils(addressIdx, offset)
+            with self.lock: data = self.client.read_coils(addressIdx, offset)
             if data: return list(data)
         return None
     
     def getHoldingRegs(self, addressIdx, offset):
         """ Get the holding register bit list [addressIdx: addressIdx + offset] of the PLC."""
         if self.client.is_open:
-            data = self.client.read_holding_registers(addressIdx, offset)
+            with self.lock: data = self.client.read_holding_registers(addressIdx, offset)
             if data: return list(data)
         return None
 
@@ -354,19 +805,225 @@ class modbusTcpClient(object):
 
     def setCoilsBit(self, addressIdx, bitVal):
         if self.client.is_open:
-            data = self.client.write_single_coil(addressIdx, bitVal)
+            with self.lock: data = self.client.write_single_coil(addressIdx, bitVal)
             return data
         return None
 
     def setHoldingRegs(self, addressIdx, bitVal):
         if self.client.is_open:
-            data = self.client.write_single_register(addressIdx, bitVal)
+            with self.lock: data = self.client.write_single_register(addressIdx, bitVal)
             return data
         return None
 
+    def setCoilsBits(self, addressIdx, bitList):
+        """ Set the coils [addressIdx: addressIdx + len(bitList)] with FC15, the list 
+            longer than MAX_WRITE_COILS will be split to several requests.
+        """
+        if self.client.is_open:
+            for i in range(0, len(bitList), MAX_WRITE_COILS):
+                subList = [bool(val) for val in bitList[i:i+MAX_WRITE_COILS]]
+                with self.lock: rst = self.client.write_multiple_coils(addressIdx+i, subList)
+                if not rst: return False
+            return True
+        return None
+
+    def setHoldingRegsList(self, addressIdx, valList):
+        """ Set the holding registers [addressIdx: addressIdx + len(valList)] with FC16, 
+            the list longer than MAX_WRITE_REGS will be split to several requests.
+        """
+        if self.client.is_open:
+            for i in range(0, len(valList), MAX_WRITE_REGS):
+                with self.lock: rst = self.client.write_multiple_registers(addressIdx+i, valList[i:i+MAX_WRITE_REGS])
+                if not rst: return False
+            return True
+        return None
+
+    def applyCoilsChanges(self, changeDict):
+        """ Apply the coils changes {addressIdx: bitVal, ...}, the contiguous addresses
+            are written in one FC15 request, the single address uses FC5.
+            Returns: True if all the changes are written, None if not connected.
+        """
+        if not self.client.is_open: return None
+        result = True
+        for addressIdx, bitList in groupChanges(changeDict, MAX_WRITE_COILS):
+            with self.lock:
+                if len(bitList) == 1:
+                    rst = self.client.write_single_coil(addressIdx, bool(bitList[0]))
+                else:
+                    rst = self.client.write_multiple_coils(addressIdx, [bool(val) for val in bitList])
+            result = result and bool(rst)
+        return result
+
+    def applyHoldingRegsChanges(self, changeDict):
+        """ Apply the holding registers changes {addressIdx: val, ...}, the contiguous 
+            addresses are written in one FC16 request, the single address uses FC6.
+            Returns: True if all the changes are written, None if not connected.
+        """
+        if not self.client.is_open: return None
+        result = True
+        for addressIdx, valList in groupChanges(changeDict, MAX_WRITE_REGS):
+            with self.lock:
+                if len(valList) == 1:
+                    rst = self.client.write_single_register(addressIdx, valList[0])
+                else:
+                    rst = self.client.write_multiple_registers(addressIdx, valList)
+            result = result and bool(rst)
+        return result
+
     def close(self):
         self.client.close()
 
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class modbusReadPlanner(object):
+    """ Read planner of one modbusTcpClient, init example:
+            planner = modbusReadPlanner(client)
+            planner.addRange('pnl-00', MEM_HREGS, 0, 15)
+            planner.addRange('pnl-01', MEM_HREGS, 15, 30, callback=onDataUpdate)
+            resultDict = planner.readAll()   # one FC3 request reads [0, 30)
+        The callback(rangeKey, dataList) is called in the readAll() caller's thread.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.rangeDict = OrderedDict()  # {rangeKey: (memType, startIdx, endIdx, callback)}
+        self.planDict = None            # {memType: [(startIdx, endIdx), ...]} cache.
+        self.lock = threading.Lock()
+
+    def addRange(self, rangeKey, memType, startIdx, endIdx, callback=None):
+        """ Add/replace a subscribed [startIdx, endIdx) range of the memory type."""
+        if not memType in (MEM_HREGS, MEM_COILS) or endIdx <= startIdx:
+            print("addRange(): the input range is not valid: %s" %str((memType, startIdx, endIdx)))
+            return False
+        with self.lock:
+            self.rangeDict[rangeKey] = (memType, startIdx, endIdx, callback)
+            self.planDict = None
+        return True
+
+    def removeRange(self, rangeKey):
+        with self.lock:
+            if self.rangeDict.pop(rangeKey, None) is None: return False
+            self.planDict = None
+        return True
+
+    def getPlan(self):
+        """ Return the read requests plan {memType: [(startIdx, endIdx), ...]}."""
+        with self.lock:
+            if self.planDict is None:
+                self.planDict = {}
+                for memType, maxLen in ((MEM_HREGS, MAX_READ_REGS), (MEM_COILS, MAX_READ_COILS)):
+                    rangeList = [(val[1], val[2]) for val in self.rangeDict.values() if val[0] == memType]
+                    self.planDict[memType] = mergeRanges(rangeList, maxLen)
+            return self.planDict
+
+    def readAll(self):
+        """ Issue the planned read requests and fan the results out to the ranges.
+            Returns:
+                dict: {rangeKey: data list or None if read failed}
+        """
+        blockDict = {}  # {memType: [(startIdx, endIdx, data list), ...]}
+        for memType, blockList in self.getPlan().items():
+            readFunc = self.client.getHoldingRegs if memType == MEM_HREGS else self.client.getCoilsBits
+            blockDict[memType] = [(startIdx, endIdx, readFunc(startIdx, endIdx - startIdx))
+                                  for startIdx, endIdx in blockList]
+        with self.lock: rangeItems = list(self.rangeDict.items())
+        resultDict = OrderedDict()
+        for rangeKey, (memType, startIdx, endIdx, callback) in rangeItems:
+            data = None
+            # a range may be split to several blocks if it is longer than the limit.
+            parts = [block for block in blockDict.get(memType, []) if block[0] < endIdx and block[1] > startIdx]
+            if parts and all(block[2] is not None for block in parts):
+                data = []
+                for blockStart, _, blockData in parts:
+                    data += blockData[max(0, startIdx - blockStart):endIdx - blockStart]
+            resultDict[rangeKey] = data
+            if callback:
+                try:
+                    callback(rangeKey, data)
+                except Exception as err:
+                    print("readAll(): range %s callback error: %s" %(rangeKey, str(err)))
+        return resultDict
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class modbusConnMgr(threading.Thread):
+    """ Connection manager thread to open all the added clients concurrently and 
+        reconnect the disconnected clients in background with exponential backoff 
+        + random jitter. Init example:
+            connMgr = modbusConnMgr(stateCallback=onStateChange)
+            connMgr.addClient('PLC-00', modbusTcpClient('127.0.0.1', connect=False))
+            connMgr.start()
+        The stateCallback(key, oldState, newState) is called in the manager thread.
+    """
+    def __init__(self, stateCallback=None, checkInt=0.5, initDelay=RECONN_INIT, maxDelay=RECONN_MAX):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.stateCallback = stateCallback
+        self.checkInt = checkInt
+        self.initDelay = initDelay
+        self.maxDelay = maxDelay
+        self.clients = OrderedDict()
+        # connection info {key: {'state': , 'failCount': , 'nextTry': , 'future': }}
+        self.connInfo = {}
+        self.stopEvent = threading.Event()
+
+    def addClient(self, key, client):
+        """ Add a modbusTcpClient, must be called before start()."""
+        self.clients[key] = client
+        self.connInfo[key] = {'state': STATE_DISCONNECTED, 'failCount': 0, 'nextTry': 0, 'future': None}
+
+    def getState(self, key):
+        return self.connInfo[key]['state'] if key in self.connInfo.keys() else None
+
+    def getBackoff(self, failCount):
+        """ Return the reconnect delay after <failCount> failed attempts."""
+        delay = min(self.maxDelay, self.initDelay * (2 ** min(failCount, 16)))
+        return delay * random.uniform(1 - RECONN_JITTER, 1 + RECONN_JITTER)
+
+    def _setState(self, key, state):
+        oldState = self.connInfo[key]['state']
+        if oldState == state: return
+        self.connInfo[key]['state'] = state
+        if self.stateCallback:
+            try:
+                self.stateCallback(key, oldState, state)
+            except Exception as err:
+                print("modbusConnMgr: state callback error: %s" %str(err))
+
+#-----------------------------------------------------------------------------
+    def run(self):
+        pool = ThreadPoolExecutor(max_workers=max(1, len(self.clients)))
+        while not self.stopEvent.is_set():
+            now = time.monotonic()
+            for key, client in self.clients.items():
+                info = self.connInfo[key]
+                future = info['future']
+                if future is not None:
+                    if not future.done(): continue
+                    info['future'] = None
+                    if future.exception() is None and future.result():
+                        info['failCount'] = 0
+                        self._setState(key, STATE_CONNECTED)
+                    else:
+                        info['nextTry'] = now + self.getBackoff(info['failCount'])
+                        info['failCount'] += 1
+                        self._setState(key, STATE_DISCONNECTED)
+                    continue
+                if client.checkConn():
+                    self._setState(key, STATE_CONNECTED)
+                    continue
+                if info['state'] == STATE_CONNECTED:
+                    # connection lost, try to reconnect immediately.
+                    info['failCount'], info['nextTry'] = 0, now
+                    self._setState(key, STATE_DISCONNECTED)
+                if now >= info['nextTry']:
+                    self._setState(key, STATE_CONNECTING)
+                    info['future'] = pool.submit(client.reconnect)
+            self.stopEvent.wait(self.checkInt)
+        pool.shutdown(wait=False)
+
+    def stop(self):
+        self.stopEvent.set()
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class modbusTcpServer(object):
@@ -409,3 +1066,252 @@ class modbusTcpServer(object):
 
     def stopServer(self):
         if self.isRunning():self.server.stop()
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class modbusConnProtocol(asyncio.Protocol):
+    """ One modbus TCP client connection of the modbusAsyncServer."""
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.buffer = bytearray()
+        self.busy = False       # a write request is running.
+        self.paused = False     # stop reading the socket.
+        self.lastActT = time.monotonic()
+        self.srvInfo = ModbusServer.ServerInfo()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if not self.server.addConn(self):
+            transport.abort()
+            return
+        peer = transport.get_extra_info('peername') or ('', 0)
+        self.srvInfo.client = ModbusServer.ClientInfo(address=peer[0], port=peer[1])
+
+    def connection_lost(self, exc):
+        self.server.removeConn(self)
+        self.buffer = bytearray()
+
+    def pause_writing(self):
+        self._setPaused(True)
+
+    def resume_writing(self):
+        self._setPaused(False)
+        self._process()
+
+    def data_received(self, data):
+        self.lastActT = time.monotonic()
+        self.buffer += data
+        self._process()
+
+#-----------------------------------------------------------------------------
+    def _setPaused(self, paused):
+        if paused == self.paused or self.transport.is_closing(): return
+        self.paused = paused
+        if paused:
+            self.transport.pause_reading()
+        else:
+            self.transport.resume_reading()
+
+    def _process(self):
+        """ Handle the complete frames in the buffer until a write request is running."""
+        while not self.busy and not self.transport.is_closing():
+            if len(self.buffer) < MBAP_HEADER.size: break
+            tid, pid, length, unitID = MBAP_HEADER.unpack_from(self.buffer)
+            if pid != 0 or not 2 <= length <= MAX_ADU_SZ - MBAP_HEADER.size + 1:
+                self.server.stats['invalid'] += 1
+                self.transport.abort()
+                return
+            frameSz = MBAP_HEADER.size - 1 + length
+            if len(self.buffer) < frameSz: break
+            pdu = bytes(self.buffer[MBAP_HEADER.size:frameSz])
+            del self.buffer[:frameSz]
+            self.srvInfo.recv_frame.mbap.transaction_id = tid
+            self.srvInfo.recv_frame.mbap.unit_id = unitID
+            reply = self.server.handlePdu(self, pdu, tid, unitID)
+            if reply is not None: self.sendReply(tid, unitID, reply)
+        # stop reading if the buffered requests reach the queue limit (or a write is
+        # running / the reply can not be sent), resume after they are handled.
+        self._setPaused(self.busy and len(self.buffer) >= self.server.maxQueue * MAX_ADU_SZ
+                        or self.transport.get_write_buffer_size() > self.server.maxQueue * MAX_ADU_SZ)
+
+    def sendReply(self, tid, unitID, pdu):
+        if self.transport.is_closing(): return
+        self.transport.write(MBAP_HEADER.pack(tid, 0, len(pdu) + 1, unitID) + pdu)
+
+    def writeDone(self, tid, unitID, reply):
+        """ Send the write request's reply and continue handling the buffered requests."""
+        self.busy = False
+        self.sendReply(tid, unitID, reply)
+        self._process()
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class modbusAsyncServer(object):
+    """ Event loop Modbus-TCP server with the same interface as the modbusTcpServer.
+        Init example:
+            dataMgr = modbusTcpCom.plcDataHandler(allowRipList=ALLOW_R_L, allowWipList=ALLOW_W_L)
+            server = modbusTcpCom.modbusAsyncServer(hostIp=hostIp, hostPort=hostPort, dataHandler=dataMgr)
+            dataMgr.initServerInfo(server.getServerInfo())
+            server.startServer()
+    """
+    def __init__(self, hostIp='localhost', hostPort=502, dataHandler=None, maxConn=MAX_CONN,
+                 maxQueue=MAX_CONN_QUEUE, idleTO=CONN_IDLE_TO, loop=None) -> None:
+        """ Args:
+                maxConn (int, optional): max number of the client connections. Defaults to MAX_CONN.
+                maxQueue (int, optional): max buffered requests of one connection. Defaults
+                    to MAX_CONN_QUEUE.
+                idleTO (float, optional): close the connection without request in idleTO
+                    sec. Defaults to CONN_IDLE_TO.
+                loop (asyncio.AbstractEventLoop, optional): event loop (running in another
+                    thread) shared with the other modules, startServer() returns immediately
+                    if set. Defaults to None, startServer() runs its own event loop.
+        """
+        self.hostIp = hostIp
+        self.hostPort = hostPort
+        self.dataHandler = DataHandler(DataBank()) if dataHandler is None else dataHandler
+        self.maxConn = maxConn
+        self.maxQueue = maxQueue
+        self.idleTO = idleTO
+        self.loop = loop
+        self.ownLoop = loop is None
+        self.server = None
+        self.sweepTask = None
+        self.serverInfo = ModbusServer.ServerInfo()
+        self.connSet = set()
+        # the writes are serialized in one thread, the ladder update may be slow.
+        self.writePool = ThreadPoolExecutor(max_workers=1)
+        self.stats = {'accepted': 0, 'rejected': 0, 'requests': 0, 'exceptions': 0,
+                      'invalid': 0, 'idleClosed': 0}
+
+    def isRunning(self):
+        return self.server is not None and self.server.is_serving()
+
+    def getServerInfo(self):
+        return self.serverInfo
+
+    def getStats(self):
+        stats = dict(self.stats)
+        stats['connections'] = len(self.connSet)
+        return stats
+
+#-----------------------------------------------------------------------------
+    def addConn(self, conn):
+        if len(self.connSet) >= self.maxConn:
+            self.stats['rejected'] += 1
+            return False
+        self.connSet.add(conn)
+        self.stats['accepted'] += 1
+        return True
+
+    def removeConn(self, conn):
+        self.connSet.discard(conn)
+
+    async def _sweepIdle(self):
+        """ Close the idle connections."""
+        while True:
+            await asyncio.sleep(self.idleTO / 4)
+            crtTime = time.monotonic()
+            for conn in list(self.connSet):
+                if crtTime - conn.lastActT > self.idleTO and not conn.busy:
+                    self.stats['idleClosed'] += 1
+                    conn.transport.close()
+
+#-----------------------------------------------------------------------------
+    def _exception(self, fc, expCode):
+        self.stats['exceptions'] += 1
+        return bytes((fc | 0x80, expCode))
+
+    def handlePdu(self, conn, pdu, tid, unitID):
+        """ Handle the request PDU, returns the reply PDU or None if the write request
+            is running in the writer thread (conn.writeDone() will send the reply).
+        """
+        self.stats['requests'] += 1
+        fc = pdu[0]
+        if fc in READ_FCS.keys():
+            # read fast path: answered in the event loop.
+            if len(pdu) != PDU_HEADER.size: return self._exception(fc, EXP_DATA_VALUE)
+            _, address, count = PDU_HEADER.unpack(pdu)
+            funcName, maxCount = READ_FCS[fc]
+            if not 1 <= count <= maxCount: return self._exception(fc, EXP_DATA_VALUE)
+            if address + count > 0x10000: return self._exception(fc, EXP_DATA_ADDRESS)
+            result = getattr(self.dataHandler, funcName)(address, count, conn.srvInfo)
+            if result.exp_code != EXP_NONE: return self._exception(fc, result.exp_code)
+            if fc <= 2:
+                data = ladderCompiler.packBits(result.data).to_bytes((count + 7) // 8, 'little')
+            else:
+                data = struct.pack('>%dH' % count, *result.data)
+            return bytes((fc, len(data))) + data
+        if fc not in WRITE_FCS: return self._exception(fc, EXP_ILLEGAL_FUNCTION)
+        request = self._parseWrite(pdu)
+        if isinstance(request, bytes): return request
+        conn.busy = True
+        future = self.writePool.submit(self._handleWrite, conn.srvInfo, fc, *request)
+        future.add_done_callback(lambda f: self.loop.call_soon_threadsafe(
+            conn.writeDone, tid, unitID, f.result() if not f.exception() else self._exception(fc, EXP_SLAVE_DEVICE_FAILURE)))
+        return None
+
+    def _parseWrite(self, pdu):
+        """ Parse the write request to (address, valueList, replyPDU), return the
+            exception reply PDU if the request is invalid.
+        """
+        fc = pdu[0]
+        if len(pdu) < PDU_HEADER.size: return self._exception(fc, EXP_DATA_VALUE)
+        _, address, value = PDU_HEADER.unpack_from(pdu)
+        if fc == 5:
+            if value not in (0xFF00, 0x0000) or len(pdu) != PDU_HEADER.size:
+                return self._exception(fc, EXP_DATA_VALUE)
+            return (address, [value == 0xFF00], pdu)
+        if fc == 6:
+            if len(pdu) != PDU_HEADER.size: return self._exception(fc, EXP_DATA_VALUE)
+            return (address, [value], pdu)
+        count, byteCount, data = value, pdu[PDU_HEADER.size] if len(pdu) > PDU_HEADER.size else -1, pdu[PDU_HEADER.size+1:]
+        maxCount, expectBytes = (MAX_WRITE_COILS, (count + 7) // 8) if fc == 15 else (MAX_WRITE_REGS, count * 2)
+        if not 1 <= count <= maxCount or byteCount != expectBytes or len(data) != expectBytes:
+            return self._exception(fc, EXP_DATA_VALUE)
+        if address + count > 0x10000: return self._exception(fc, EXP_DATA_ADDRESS)
+        if fc == 15:
+            valList = ladderCompiler.unpackBits(int.from_bytes(data, 'little'), count)
+        else:
+            valList = list(struct.unpack('>%dH' % count, data))
+        return (address, valList, pdu[:PDU_HEADER.size])
+
+    def _handleWrite(self, srvInfo, fc, address, valList, reply):
+        """ Writer thread: write the coils/holding registers by the data handler."""
+        if fc in (5, 15):
+            result = self.dataHandler.write_coils(address, valList, srvInfo)
+        else:
+            result = self.dataHandler.write_h_regs(address, valList, srvInfo)
+        if result.exp_code != EXP_NONE: return self._exception(fc, result.exp_code)
+        return reply
+
+#-----------------------------------------------------------------------------
+    async def _startAsync(self):
+        self.server = await self.loop.create_server(lambda: modbusConnProtocol(self),
+                                                    host=self.hostIp, port=self.hostPort,
+                                                    reuse_address=True, backlog=1024)
+        self.sweepTask = self.loop.create_task(self._sweepIdle())
+
+    def startServer(self):
+        """ Start the server, block and run the event loop if the server owns it."""
+        print("Start to run the Modbus TCP async server: (%s, %s)" %(self.hostIp, str(self.hostPort)))
+        if not self.ownLoop:
+            asyncio.run_coroutine_threadsafe(self._startAsync(), self.loop).result()
+            return
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self._startAsync())
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    async def _stopAsync(self):
+        if self.sweepTask: self.sweepTask.cancel()
+        if self.server: self.server.close()
+        for conn in list(self.connSet): conn.transport.abort()
+
+    def stopServer(self):
+        if self.loop is None or self.loop.is_closed(): return
+        future = asyncio.run_coroutine_threadsafe(self._stopAsync(), self.loop)
+        if self.ownLoop: future.add_done_callback(lambda _: self.loop.call_soon_threadsafe(self.loop.stop))
+        self.writePool.shutdown(wait=False)
@@ -12,8 +12,13 @@
 #-----------------------------------------------------------------------------
 
 import time
+import socket
 import threading
+from collections import OrderedDict
+from pyModbusTCP.client import ModbusClient
 import modbusTcpCom
+import plcTimers
+import plcSimulator
 
 class testModbusClientThread(threading.Thread):
     """
@@ -43,6 +48,18 @@ class testModbusClientThread(threading.Thread):
         setHoldingRegsTest(): Performs a unit test for setHoldingRegs() method of the
         ModbusTcpClient object. Refer to the method description for more details.
 
+        applyCoilsChangesTest(): Performs a unit test for applyCoilsChanges() method of the
+        ModbusTcpClient object. Refer to the method description for more details.
+
+        setHoldingRegsListTest(): Performs a unit test for setHoldingRegsList() method of the
+        ModbusTcpClient object. Refer to the method description for more details.
+
+        connMgrTest(): Performs a unit test for the modbusConnMgr object background connect
+        and reconnect. Refer to the method description for more details.
+
+        readPlannerTest(): Performs a unit test for the modbusReadPlanner object ranges merge 
+        and result fan out. Refer to the method description for more details.
+
         autoUpdateCoilTest(): Performs an integration test for updateState() method of the
         plcDataHandler object. Refer to the method description for more details.
     """
@@ -93,6 +110,8 @@ class testModbusClientThread(threading.Thread):
 #   - getHoldingRegs()
 #   - setCoilsBits()
 #   - setHoldingRegs()
+#   - applyCoilsChanges()
+#   - setHoldingRegsList()
 
     def getCoilBitsTest(self, readInput, expectedOutput, testID):
         """
@@ -201,6 +220,113 @@ class testModbusClientThread(threading.Thread):
         print(f"[x] Test {testID}: setHoldingRegs() passed")
         time.sleep(0.5)
 
+    def applyCoilsChangesTest(self, changeDict, readInput, expectedOutput, testID):
+        """
+        Performs a unit test for applyCoilsChanges() method of the ModbusTcpClient object.
+        It applies the coils changes (contiguous addresses in one FC15 request), retrieves 
+        the coil bit values and compares the actual output with the expected output.
+        Args:
+            changeDict (dict): The first argument representing {addressIdx: bitVal}.
+            readInput (int, int): The second argument representing addressIdx and offset.
+            expectedOutput (list): The third argument representing the expected output.
+            testID (int): The fourth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            Assumption: 
+                - Coil bits current state [1, 1, 0, 0]
+            >>> applyCoilsChangesTest({0: 0, 1: 0, 3: 1}, (0, 4), [0, 0, 0, 1], 1)
+                [x] Test 1: applyCoilsChanges() passed
+        """
+        assert self.client.applyCoilsChanges(changeDict), f"[ ] Test {testID}: applyCoilsChanges() failed"
+        actualOutput = self.client.getCoilsBits(readInput[0], readInput[1])
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: applyCoilsChanges() failed"
+        print(f"[x] Test {testID}: applyCoilsChanges() passed")
+        time.sleep(0.5)
+
+    def setHoldingRegsListTest(self, setInput, readInput, expectedOutput, testID):
+        """
+        Performs a unit test for setHoldingRegsList() method of the ModbusTcpClient object.
+        It sets the holding registers with FC16, retrieves the holding register values and
+        compares the actual output with the expected output.
+        Args:
+            setInput (int, list): The first argument representing addressIdx and valList.
+            readInput (int, int): The second argument representing addressIdx and offset.
+            expectedOutput (list): The third argument representing the expected output.
+            testID (int): The fourth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            >>> setHoldingRegsListTest((0, [0, 1, 1, 1]), (0, 4), [0, 1, 1, 1], 1)
+                [x] Test 1: setHoldingRegsList() passed
+        """
+        assert self.client.setHoldingRegsList(setInput[0], setInput[1]), f"[ ] Test {testID}: setHoldingRegsList() failed"
+        actualOutput = self.client.getHoldingRegs(readInput[0], readInput[1])
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: setHoldingRegsList() failed"
+        print(f"[x] Test {testID}: setHoldingRegsList() passed")
+        time.sleep(0.5)
+
+    def connMgrTest(self, testID):
+        """
+        Performs a unit test for the modbusConnMgr object. It adds a not connected client 
+        to the connection manager, checks the manager opens the connection in background,
+        then closes the client socket and checks the manager reconnects it.
+        Args:
+            testID (int): The first argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If the connection is not (re)opened by the manager.
+        Examples:
+            >>> connMgrTest(1)
+                [x] Test 1: modbusConnMgr() passed
+        """
+        stateList = []
+        testClient = modbusTcpCom.modbusTcpClient('127.0.0.1', connect=False)
+        assert not testClient.checkConn(), f"[ ] Test {testID}: modbusConnMgr() failed"
+        connMgr = modbusTcpCom.modbusConnMgr(stateCallback=lambda key, oldState, newState: stateList.append(newState),
+                                             checkInt=0.1)
+        connMgr.addClient('testPlc', testClient)
+        connMgr.start()
+        time.sleep(0.5)
+        assert connMgr.getState('testPlc') == modbusTcpCom.STATE_CONNECTED, f"[ ] Test {testID}: modbusConnMgr() failed"
+        testClient.close()
+        time.sleep(0.5)
+        assert testClient.getCoilsBits(0, 4) is not None, f"[ ] Test {testID}: modbusConnMgr() failed"
+        assert stateList.count(modbusTcpCom.STATE_CONNECTED) == 2, f"[ ] Test {testID}: modbusConnMgr() failed"
+        connMgr.stop()
+        testClient.close()
+        print(f"[x] Test {testID}: modbusConnMgr() passed")
+        time.sleep(0.5)
+
+    def readPlannerTest(self, rangeList, expectedPlan, expectedOutput, testID):
+        """
+        Performs a unit test for the modbusReadPlanner object. It adds the ranges, compares
+        the merged read plan and the data fanned out to each range with the expected output.
+        Args:
+            rangeList (list): The first argument representing [(rangeKey, memType, startIdx, endIdx), ...].
+            expectedPlan (dict): The second argument representing the expected read plan.
+            expectedOutput (dict): The third argument representing the expected {rangeKey: data}.
+            testID (int): The fourth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            Assumption: 
+                - Holding register current state [0, 1, 1, 1]
+            >>> readPlannerTest([('a', 'hRegs', 0, 2), ('b', 'hRegs', 1, 4)], {'hRegs': [(0, 4)], 'coils': []}, 
+                                {'a': [0, 1], 'b': [1, 1, 1]}, 1)
+                [x] Test 1: modbusReadPlanner() passed
+        """
+        callbackDict = {}
+        planner = modbusTcpCom.modbusReadPlanner(self.client)
+        for rangeKey, memType, startIdx, endIdx in rangeList:
+            planner.addRange(rangeKey, memType, startIdx, endIdx, 
+                             callback=lambda key, data: callbackDict.update({key: data}))
+        assert planner.getPlan() == expectedPlan, f"[ ] Test {testID}: modbusReadPlanner() failed"
+        actualOutput = dict(planner.readAll())
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: modbusReadPlanner() failed"
+        assert callbackDict == expectedOutput, f"[ ] Test {testID}: modbusReadPlanner() failed"
+        print(f"[x] Test {testID}: modbusReadPlanner() passed")
+        time.sleep(0.5)
+
 #---------------------------------------------------------------------------
 # Define integration test methods for the following ModbusTCPCom plcDataHandler function:
 #   - updateState()
@@ -314,6 +440,344 @@ class testModbusServerThread(threading.Thread):
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 
+class testUnitRouterThread(threading.Thread):
+    """
+    This class is a subclass that inherits from the threading.Thread class. 
+    It runs a Modbus TCP server with a modbusTcpCom.plcUnitRouter data handler which 
+    routes the requests to two PLC data handlers by the request's unit ID.
+
+    Attributes:
+        server: Represents modbusTcpServer object.
+        router: Represents the plcUnitRouter object.
+        dataMgrDict: Represents the registered plcDataHandler objects {unitID: handler}.
+
+    Methods:
+        __init__(): Initialises the testUnitRouterThread object
+        run(): Starts the Modbus server and presets the PLC data handlers' coils.
+        closeServer(): Terminates the Modbus TCP server.
+
+    Unit Test Methods:
+        unitRouteTest(): Performs a unit test for the plcUnitRouter unit ID routing. Refer 
+        to the method description for more details.
+
+        unknownUnitTest(): Performs a unit test for the plcUnitRouter exception reply of the 
+        not registered unit ID. Refer to the method description for more details.
+    """
+
+    def __init__(self, parent, threadID, name, hostPort=5020):
+        super().__init__(parent)
+        self.hostPort = hostPort
+        self.router = modbusTcpCom.plcUnitRouter()
+        self.dataMgrDict = {}
+        for unitID in (1, 2):
+            self.dataMgrDict[unitID] = modbusTcpCom.plcDataHandler(allowRipList=['127.0.0.1'], 
+                                                                   allowWipList=['127.0.0.1'])
+            self.router.addHandler(self.dataMgrDict[unitID], unitID=unitID)
+        self.server = modbusTcpCom.modbusTcpServer(hostIp='localhost', hostPort=self.hostPort, 
+                                                   dataHandler=self.router)
+
+    def run(self):
+        """
+        Overrides the run() method from the threading.Thread class. It presets the unit 1 
+        coils to [1, 0, 1, 0], the unit 2 coils to [0, 1, 0, 1] and starts the server.
+        """
+        self.router.initServerInfo(self.server.getServerInfo())
+        self.dataMgrDict[1].updateOutPutCoils(0, [1, 0, 1, 0])
+        self.dataMgrDict[2].updateOutPutCoils(0, [0, 1, 0, 1])
+        self.server.startServer()
+
+    def closeServer(self):
+        self.server.stopServer()
+
+#---------------------------------------------------------------------------
+# Define unit tests methods for the following ModbusTCPCom plcUnitRouter functions:
+#   - getHandler()
+#   - _route()
+
+    def unitRouteTest(self, unitID, readInput, expectedOutput, testID):
+        """
+        Performs a unit test for the plcUnitRouter unit ID routing. It reads the coils with 
+        the unit ID and compares the actual output with the expected output.
+        Args:
+            unitID (int): The first argument representing the request's modbus unit ID.
+            readInput (int, int): The second argument representing addressIdx and offset.
+            expectedOutput (list): The third argument representing the expected output.
+            testID (int): The fourth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            >>> unitRouteTest(2, (0, 4), [False, True, False, True], 1)
+                [x] Test 1: plcUnitRouter() passed
+        """
+        client = ModbusClient(host='127.0.0.1', port=self.hostPort, unit_id=unitID, auto_open=True)
+        actualOutput = client.read_coils(readInput[0], readInput[1])
+        client.close()
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: plcUnitRouter() failed"
+        print(f"[x] Test {testID}: plcUnitRouter() passed")
+
+    def unknownUnitTest(self, unitID, expectedOutput, testID):
+        """
+        Performs a unit test for the request of a not registered unit ID (no default 
+        handler), the router replies the exception and the read returns None.
+        Args:
+            unitID (int): The first argument representing the request's modbus unit ID.
+            expectedOutput (int): The second argument representing the expected exception code.
+            testID (int): The third argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            >>> unknownUnitTest(9, modbusTcpCom.EXP_GATEWAY_PATH_UNAVAILABLE, 1)
+                [x] Test 1: plcUnitRouter() passed
+        """
+        client = ModbusClient(host='127.0.0.1', port=self.hostPort, unit_id=unitID, auto_open=True)
+        readResult = client.read_coils(0, 4)
+        actualOutput = client.last_except
+        client.close()
+        assert readResult is None, f"[ ] Test {testID}: plcUnitRouter() failed"
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: plcUnitRouter() failed"
+        print(f"[x] Test {testID}: plcUnitRouter() passed")
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+
+class testAsyncServerThread(threading.Thread):
+    """
+    This class is a subclass that inherits from the threading.Thread class. 
+    It runs a modbusTcpCom.modbusAsyncServer and sends the raw Modbus TCP frames to it 
+    with the sockets, so the framing, the limits and the exception replies can be tested.
+
+    Attributes:
+        server: Represents modbusAsyncServer object.
+        dataMgr: Represents the slowWritePLCDataHandler object.
+
+    Methods:
+        __init__(): Initialises the testAsyncServerThread object
+        run(): Presets the holding registers [1, 2, 3, 4] and runs the server event loop.
+        closeServer(): Terminates the Modbus TCP async server.
+
+    Unit Test Methods:
+        splitFrameTest(): Performs a unit test for the MBAP framing of a request split to 
+        several TCP segments. Refer to the method description for more details.
+
+        pipelinedFrameTest(): Performs a unit test for the MBAP framing of several requests 
+        sent in one TCP segment. Refer to the method description for more details.
+
+        exceptionTest(): Performs a unit test for the exception reply of the invalid request.
+        Refer to the method description for more details.
+
+        connLimitTest(): Performs a unit test for the max connections limit. Refer to the 
+        method description for more details.
+
+        queueLimitTest(): Performs a unit test for the connection's buffered requests limit. 
+        Refer to the method description for more details.
+
+        idleCloseTest(): Performs a unit test for the idle connection close. Refer to the 
+        method description for more details.
+    """
+
+    def __init__(self, parent, threadID, name, hostPort=5021, maxConn=2, maxQueue=2, idleTO=1):
+        super().__init__(parent)
+        self.hostPort = hostPort
+        self.dataMgr = slowWritePLCDataHandler(allowRipList=['127.0.0.1'], allowWipList=['127.0.0.1'])
+        self.server = modbusTcpCom.modbusAsyncServer(hostIp='localhost', hostPort=self.hostPort, 
+                                                     dataHandler=self.dataMgr, maxConn=maxConn, 
+                                                     maxQueue=maxQueue, idleTO=idleTO)
+
+    def run(self):
+        self.dataMgr.initServerInfo(self.server.getServerInfo())
+        self.dataMgr.updateHoldingRegs(0, [1, 2, 3, 4])
+        self.server.startServer()
+
+    def closeServer(self):
+        self.server.stopServer()
+
+#-----------------------------------------------------------------------------
+# Define the raw frame functions
+
+    def _connect(self):
+        return socket.create_connection(('127.0.0.1', self.hostPort), timeout=3)
+
+    def _buildFrame(self, tid, pdu, unitID=1):
+        return modbusTcpCom.MBAP_HEADER.pack(tid, 0, len(pdu) + 1, unitID) + bytes(pdu)
+
+    def _recvAll(self, sock, size):
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk: return None
+            data += chunk
+        return data
+
+    def _recvFrame(self, sock):
+        """ Receive one reply frame, returns (transaction ID, PDU) or None if closed."""
+        header = self._recvAll(sock, modbusTcpCom.MBAP_HEADER.size)
+        if header is None: return None
+        tid, _, length, _ = modbusTcpCom.MBAP_HEADER.unpack(header)
+        pdu = self._recvAll(sock, length - 1)
+        return None if pdu is None else (tid, pdu)
+
+#---------------------------------------------------------------------------
+# Define unit tests methods for the following ModbusTCPCom modbusAsyncServer functions:
+#   - modbusConnProtocol._process()
+#   - handlePdu()
+#   - addConn()
+#   - _sweepIdle()
+
+    def splitFrameTest(self, pdu, expectedOutput, testID):
+        """
+        Performs a unit test for the MBAP framing. It sends the request frame in three TCP 
+        segments (part of the header, the rest of the header, the PDU) and compares the 
+        reply PDU with the expected output.
+        Args:
+            pdu (bytes): The first argument representing the request PDU.
+            expectedOutput (bytes): The second argument representing the expected reply PDU.
+            testID (int): The third argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            >>> splitFrameTest(bytes([3, 0, 0, 0, 2]), bytes([3, 4, 0, 1, 0, 2]), 1)
+                [x] Test 1: modbusAsyncServer() passed
+        """
+        frame = self._buildFrame(1, pdu)
+        with self._connect() as sock:
+            for part in (frame[:4], frame[4:modbusTcpCom.MBAP_HEADER.size], frame[modbusTcpCom.MBAP_HEADER.size:]):
+                sock.sendall(part)
+                time.sleep(0.1)
+            actualOutput = self._recvFrame(sock)
+        assert actualOutput == (1, expectedOutput), f"[ ] Test {testID}: modbusAsyncServer() failed"
+        print(f"[x] Test {testID}: modbusAsyncServer() passed")
+
+    def pipelinedFrameTest(self, pduList, expectedOutput, testID):
+        """
+        Performs a unit test for the MBAP framing. It sends all the request frames in one 
+        TCP segment and checks the replies are sent in the requests' sequence.
+        Args:
+            pduList (list): The first argument representing the request PDUs.
+            expectedOutput (list): The second argument representing the expected reply PDUs.
+            testID (int): The third argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            >>> pipelinedFrameTest([bytes([6, 0, 1, 0, 9]), bytes([3, 0, 0, 0, 2])], 
+                                   [bytes([6, 0, 1, 0, 9]), bytes([3, 4, 0, 1, 0, 9])], 1)
+                [x] Test 1: modbusAsyncServer() passed
+        """
+        with self._connect() as sock:
+            sock.sendall(b''.join(self._buildFrame(tid, pdu) for tid, pdu in enumerate(pduList)))
+            actualOutput = [self._recvFrame(sock) for _ in pduList]
+        assert actualOutput == list(enumerate(expectedOutput)), f"[ ] Test {testID}: modbusAsyncServer() failed"
+        print(f"[x] Test {testID}: modbusAsyncServer() passed")
+
+    def exceptionTest(self, pdu, expectedOutput, testID):
+        """
+        Performs a unit test for the exception reply of the invalid request.
+        Args:
+            pdu (bytes): The first argument representing the request PDU.
+            expectedOutput (int): The second argument representing the expected exception code.
+            testID (int): The third argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            >>> exceptionTest(bytes([3, 0, 0, 0, 200]), modbusTcpCom.EXP_DATA_VALUE, 1)
+                [x] Test 1: modbusAsyncServer() passed
+        """
+        preExceptions = self.server.getStats()['exceptions']
+        with self._connect() as sock:
+            sock.sendall(self._buildFrame(1, pdu))
+            actualOutput = self._recvFrame(sock)
+        assert actualOutput == (1, bytes((pdu[0] | 0x80, expectedOutput))), f"[ ] Test {testID}: modbusAsyncServer() failed"
+        assert self.server.getStats()['exceptions'] == preExceptions + 1, f"[ ] Test {testID}: modbusAsyncServer() failed"
+        print(f"[x] Test {testID}: modbusAsyncServer() passed")
+
+    def connLimitTest(self, testID):
+        """
+        Performs a unit test for the max connections limit. It opens maxConn + 1 connections,
+        the connections under the limit are served and the extra one is closed.
+        Args:
+            testID (int): The first argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        preRejected = self.server.getStats()['rejected']
+        sockList = [self._connect() for _ in range(self.server.maxConn + 1)]
+        actualOutput = []
+        for sock in sockList:
+            try:
+                sock.sendall(self._buildFrame(1, bytes([3, 0, 0, 0, 1])))
+                actualOutput.append(self._recvFrame(sock) is not None)
+            except OSError:
+                actualOutput.append(False)
+        for sock in sockList: sock.close()
+        time.sleep(0.2)
+        expectedOutput = [True] * self.server.maxConn + [False]
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: modbusAsyncServer() failed"
+        assert self.server.getStats()['rejected'] == preRejected + 1, f"[ ] Test {testID}: modbusAsyncServer() failed"
+        print(f"[x] Test {testID}: modbusAsyncServer() passed")
+
+    def queueLimitTest(self, reqNum, testID):
+        """
+        Performs a unit test for the connection's buffered requests limit. It sends one 
+        slow write request and <reqNum> read requests together, the server stops reading 
+        the socket while the write is running and the buffer reaches the limit, then 
+        resumes and replies all the requests in sequence.
+        Args:
+            reqNum (int): The first argument representing the read requests number.
+            testID (int): The second argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        self.dataMgr.writeDelay = 0.5
+        pduList = [bytes([6, 0, 2, 0, 7])] + [bytes([3, 0, 2, 0, 1])] * reqNum
+        with self._connect() as sock:
+            sock.sendall(b''.join(self._buildFrame(tid, pdu) for tid, pdu in enumerate(pduList)))
+            time.sleep(0.2)
+            pausedList = [conn.paused for conn in list(self.server.connSet)]
+            actualOutput = [self._recvFrame(sock) for _ in pduList]
+        self.dataMgr.writeDelay = 0
+        expectedOutput = [(0, pduList[0])] + [(tid, bytes([3, 2, 0, 7])) for tid in range(1, reqNum + 1)]
+        assert pausedList == [True], f"[ ] Test {testID}: modbusAsyncServer() failed"
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: modbusAsyncServer() failed"
+        print(f"[x] Test {testID}: modbusAsyncServer() passed")
+
+    def idleCloseTest(self, testID):
+        """
+        Performs a unit test for the idle connection close. It opens a connection without 
+        request and checks the server closes it after the server's idle time out.
+        Args:
+            testID (int): The first argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        preClosed = self.server.getStats()['idleClosed']
+        with self._connect() as sock:
+            sock.settimeout(self.server.idleTO * 3)
+            startT = time.monotonic()
+            actualOutput = sock.recv(1)
+            idleT = time.monotonic() - startT
+        assert actualOutput == b'' and idleT >= self.server.idleTO, f"[ ] Test {testID}: modbusAsyncServer() failed"
+        assert self.server.getStats()['idleClosed'] == preClosed + 1, f"[ ] Test {testID}: modbusAsyncServer() failed"
+        print(f"[x] Test {testID}: modbusAsyncServer() passed")
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+
+class slowWritePLCDataHandler(modbusTcpCom.plcDataHandler):
+    """
+    A subclass that inherits from the modbusTcpCom.plcDataHandler class, the holding 
+    registers write waits <writeDelay> sec to simulate a slow ladder update.
+    """
+
+    def __init__(self, allowRipList=None, allowWipList=None):
+        super().__init__(allowRipList=allowRipList, allowWipList=allowWipList)
+        self.writeDelay = 0
+
+    def write_h_regs(self, address, words_l, srv_info):
+        if self.writeDelay: time.sleep(self.writeDelay)
+        return super().write_h_regs(address, words_l, srv_info)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+
 class testPLCDataHandler(modbusTcpCom.plcDataHandler):
     """
     This class is a subclass that inherits from the modbusTcpCom.plcDatahandler class. 
@@ -346,11 +810,32 @@ class testPLCDataHandler(modbusTcpCom.plcDataHandler):
 
         updateHoldingRegsTest(): Performs a unit test for updateHoldingRegs() method of the
         modbusTcpCom.plcDatahandler parent class. Refer to the method description for more details.
+
+        ladderStatsTest(): Performs a unit test for the dirty range ladder evaluation counters
+        of the modbusTcpCom.plcDatahandler parent class. Refer to the method description for 
+        more details.
+
+        scheduleLaddersTest(): Performs a unit test for the ladders dependency graph scheduling.
+        Refer to the method description for more details.
+
+    Integration Test Methods:
+        timerLadderTest(): Performs an integration test for the tickTimers() method of the 
+        modbusTcpCom.plcDatahandler parent class. Refer to the method description for more details.
+
+        changeWriteTest(): Performs an integration test for the change driven holding registers
+        write of the PLC scan (plcSimulator.plcSimuInterface.updateHoldingRegs() and the 
+        modbusTcpCom.plcDatahandler parent class' updateHoldingRegsChanges()). Refer to the
+        method description for more details.
     """    
     def __init__(self, allowReadList, allowWriteList, testLadderLogic):
         super().__init__(allowRipList=allowReadList, allowWipList=allowWriteList)
         self.serverInfo = None
         self.testLadderLogic = testLadderLogic
+        self.writeLog = None    # recorded memory writes [(memType, address, offset), ...]
+
+    def markDirty(self, memType, address, offset):
+        if self.writeLog is not None: self.writeLog.append((memType, address, offset))
+        super().markDirty(memType, address, offset)
         
     def presetConfigurations(self, serverInfo):
         """
@@ -382,6 +867,7 @@ class testPLCDataHandler(modbusTcpCom.plcDataHandler):
 #   - setAllowWriteIpaddresses()
 #   - updateOutPutCoils()
 #   - updateHoldingRegs()
+#   - getLadderStats()
 
     def checkAllowReadTest(self, ipaddress, expectedOutput, testID):
         """
@@ -546,6 +1032,129 @@ class testPLCDataHandler(modbusTcpCom.plcDataHandler):
         actualOutput = client.getHoldingRegs(readInput[0], readInput[1])
         assert actualOutput == expectedOutput, f"[ ] Test {testID}: updateHoldingRegs() failed"
         print(f"[x] Test {testID}: updateHoldingRegs() passed")
+
+    def ladderStatsTest(self, setInput, expectedCount, testID):
+        """
+        Performs a unit test for the dirty range ladder evaluation of the plcDataHandler 
+        object. It writes the holding registers and compares the ladder evaluation counters 
+        change with the expected counters change.
+        Args:
+            setInput (int, list): The first argument representing addressIdx and bitList.
+            expectedCount (dict): The second argument representing the expected counters change.
+            testID (int): The third argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            Assumption: 
+                - Holding register current state [0, 0, 1, 1]
+            >>> ladderStatsTest((0, [0, 0, 1, 1]), {'evaluated': 0, 'unchanged': 1}, 1)
+                [x] Test 1: getLadderStats() passed
+        """
+        preStats = super().getLadderStats()['testLogic']
+        self.updateHoldingRegs(setInput[0], setInput[1])
+        stats = super().getLadderStats()['testLogic']
+        actualOutput = {key: stats[key] - preStats[key] for key in expectedCount.keys()}
+        assert actualOutput == expectedCount, f"[ ] Test {testID}: getLadderStats() failed"
+        print(f"[x] Test {testID}: getLadderStats() passed")
+
+    def scheduleLaddersTest(self, ladderInfoList, expectedOutput, testID):
+        """
+        Performs a unit test for the ladders dependency graph scheduling. It builds the 
+        graph from the ladders coils ranges and compares the scheduled levels and the 
+        found cycles with the expected output.
+        Args:
+            ladderInfoList (list): The first argument representing [(srcRange, destRange), ...].
+            expectedOutput (tuple): The second argument representing (levels, cycles).
+            testID (int): The third argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            >>> scheduleLaddersTest([((0, 2), (2, 4)), ((2, 4), (4, 6))], ([[0], [1]], []), 1)
+                [x] Test 1: scheduleLadders() passed
+        """
+        edges = modbusTcpCom.buildLadderGraph(ladderInfoList)
+        actualOutput = (modbusTcpCom.scheduleLadders(edges), modbusTcpCom.findGraphCycles(edges))
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: scheduleLadders() failed"
+        print(f"[x] Test {testID}: scheduleLadders() passed")
+
+#---------------------------------------------------------------------------
+# Define integration test methods for the following ModbusTCPCom plcDataHandler function:
+#   - tickTimers()
+
+    def timerLadderTest(self, client, setInput, readInput, presetT, expectedOutput, testID):
+        """
+        Performs an integration test for the timer ladder of the plcDataHandler object. It 
+        adds a TON timer ladder, sets its input holding register once, then only calls 
+        tickTimers() and checks the output coil changes to the expected output after the 
+        timer preset time.
+        Args:
+            client (modbusTcpClient): The first argument representing the modbus client.
+            setInput (int, int): The second argument representing addressIdx and bitVal.
+            readInput (int, int): The third argument representing addressIdx and offset.
+            presetT (float): The fourth argument representing the TON preset time (sec).
+            expectedOutput (list): The fifth argument representing the expected output.
+            testID (int): The sixth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            >>> timerLadderTest(client, (10, 1), (10, 1), 0.5, [True], 1)
+                [x] Test 1: tickTimers() passed
+        """
+        self.addLadderLogic('timerLogic', stubTimerLadderLogic(None, setInput[0], presetT))
+        client.setHoldingRegs(setInput[0], setInput[1])
+        startT = time.monotonic()
+        initOutput = actualOutput = client.getCoilsBits(readInput[0], readInput[1])
+        while actualOutput == initOutput and time.monotonic() - startT < presetT + 1:
+            time.sleep(0.05)
+            self.tickTimers()
+            actualOutput = client.getCoilsBits(readInput[0], readInput[1])
+        elapsedT = time.monotonic() - startT
+        assert initOutput != expectedOutput, f"[ ] Test {testID}: tickTimers() failed"
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: tickTimers() failed"
+        assert elapsedT >= presetT, f"[ ] Test {testID}: tickTimers() failed"
+        print(f"[x] Test {testID}: tickTimers() passed")
+
+    def changeWriteTest(self, plcScan, changeDict, expectedRuns, expectedCount, testID):
+        """
+        Performs an integration test for the change driven holding registers write. It 
+        changes the PLC scan's input state, runs one scan and checks only the changed 
+        contiguous registers runs are written, the holding registers write version moves
+        once per written run and the ladder evaluation counters change.
+        Args:
+            plcScan (testPlcScanState): The first argument representing the PLC scan state.
+            changeDict (dict): The second argument representing the input state changes
+                {regIdx: val}, {} means an idle scan.
+            expectedRuns (list): The third argument representing the expected written 
+                runs [(address, offset), ...].
+            expectedCount (dict): The fourth argument representing the expected ladder 
+                counters change.
+            testID (int): The fifth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            Assumption: 
+                - Holding register current state [1, 0, 1, 1, 0, 0, 0, 0]
+            >>> changeWriteTest(plcScan, {1: 1, 2: 0, 7: 1}, [(1, 2), (7, 1)], {'evaluated': 1}, 1)
+                [x] Test 1: updateHoldingRegsChanges() passed
+        """
+        plcScan.setRegs(changeDict)
+        preVersion = self.getWriteVersion(modbusTcpCom.MEM_HREGS)
+        preStats = super().getLadderStats()['testLogic']
+        self.writeLog = []
+        changedNum = plcScan.scan()
+        actualRuns = [(address, offset) for memType, address, offset in self.writeLog 
+                      if memType == modbusTcpCom.MEM_HREGS]
+        self.writeLog = None
+        stats = super().getLadderStats()['testLogic']
+        actualCount = {key: stats[key] - preStats[key] for key in expectedCount.keys()}
+        assert actualRuns == expectedRuns, f"[ ] Test {testID}: updateHoldingRegsChanges() failed"
+        assert changedNum == sum(offset for _, offset in expectedRuns), f"[ ] Test {testID}: updateHoldingRegsChanges() failed"
+        assert self.getWriteVersion(modbusTcpCom.MEM_HREGS) - preVersion == len(expectedRuns), \
+            f"[ ] Test {testID}: updateHoldingRegsChanges() failed"
+        assert actualCount == expectedCount, f"[ ] Test {testID}: updateHoldingRegsChanges() failed"
+        assert self.getHoldingRegState(0, len(plcScan.appliedRegs)) == plcScan.appliedRegs, \
+            f"[ ] Test {testID}: updateHoldingRegsChanges() failed"
+        print(f"[x] Test {testID}: updateHoldingRegsChanges() passed")
     
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -607,6 +1216,61 @@ class stubLadderLogic(modbusTcpCom.ladderLogic):
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 
+class stubTimerLadderLogic(modbusTcpCom.ladderLogic):
+    """
+    A subclass that inherits from the modbusTcpCom.ladderLogic class.
+    Description:
+        This subclass represents a TON timer ladder, its output coil turns on <presetT> 
+        sec after its input holding register turns on.
+    """
+
+    def __init__(self, parent, address, presetT) -> None:
+        self.address = address
+        self.presetT = presetT
+        super().__init__(parent)
+
+    def initLadderInfo(self):
+        self.holdingRegsInfo['address'] = self.address
+        self.holdingRegsInfo['offset'] = 1
+        self.destCoilsInfo['address'] = self.address
+        self.destCoilsInfo['offset'] = 1
+        self.onTimer = self.addTimer('onDelay', plcTimers.TON, self.presetT)
+
+    def runLadderLogic(self, regsList, coilList=None):
+        return [self.onTimer.update(bool(regsList[0]))]
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+
+class testPlcScanState(object):
+    """
+    PLC scan input state with two tracks' sensors, the holding registers are written
+    by the plcSimulator.plcSimuInterface.updateHoldingRegs() (without the realworld 
+    connector), the scan runs the registers write and the timers tick as the PLC's
+    periodic().
+    """
+    updateHoldingRegs = plcSimulator.plcSimuInterface.updateHoldingRegs
+
+    def __init__(self, dataMgr, regsList, trackLen):
+        self.dataMgr = dataMgr
+        self.appliedRegs = None
+        self.regsStateRW = OrderedDict()
+        for i in range(0, len(regsList), trackLen):
+            self.regsStateRW['track%s' %str(i // trackLen)] = list(regsList[i:i+trackLen])
+        self.trackLen = trackLen
+
+    def setRegs(self, changeDict):
+        for regIdx, val in changeDict.items():
+            self.regsStateRW['track%s' %str(regIdx // self.trackLen)][regIdx % self.trackLen] = val
+
+    def scan(self):
+        changedNum = self.updateHoldingRegs()
+        self.dataMgr.tickTimers()
+        return changedNum
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+
 def createTestObjects():
     print("======================================= Creating Test Objects ========================================")
     ALLOW_R_L = ['127.0.0.1', '192.168.0.10']
@@ -631,6 +1295,13 @@ def runTestCases(client, server, dataMgr):
     client.getHoldingRegsTest((0, 4), [0, 0, 1, 1], 2)
     client.setCoilBitsTest((1, 1), (0, 4), [1, 1, 0, 0], 3)
     client.setHoldingRegsTest((1, 1), (0, 4), [0, 1, 1, 1], 4)
+    client.applyCoilsChangesTest({0: 0, 1: 0, 3: 1}, (0, 4), [0, 0, 0, 1], 5)
+    client.applyCoilsChangesTest({0: 1, 1: 1, 3: 0}, (0, 4), [1, 1, 0, 0], 6)
+    client.setHoldingRegsListTest((0, [0, 1, 1, 1]), (0, 4), [0, 1, 1, 1], 7)
+    client.connMgrTest(8)
+    client.readPlannerTest([('pnl0', 'hRegs', 0, 2), ('pnl1', 'hRegs', 1, 4), ('pnl2', 'coils', 0, 2), ('pnl3', 'coils', 2, 4)],
+                           {'hRegs': [(0, 4)], 'coils': [(0, 4)]}, 
+                           {'pnl0': [0, 1], 'pnl1': [1, 1, 1], 'pnl2': [True, False], 'pnl3': [False, False]}, 9)
     print("\n(PLC Data Handler Unit Test Cases)")
     dataMgr.checkAllowReadTest('127.0.0.1', True, 1)
     dataMgr.checkAllowReadTest('192.168.25.1', False, 2)
@@ -642,10 +1313,57 @@ def runTestCases(client, server, dataMgr):
     dataMgr.setAllowWriteIPTest(('127.0.0.1', '192.168.0.10'), "192.168.25.1", False, 8)
     dataMgr.updateOutputCoilsTest(client.getClient(), (0, [0, 0, 0, 0]), (0, 4), [0, 0, 0, 0], 9)
     dataMgr.updateHoldingRegsTest(client.getClient(), (0, [0, 0, 1, 1]), (0, 4), [0, 0, 1, 1], 10)
+    # the stub ladder's source coils are its output coils changed by test 10, so it is
+    # evaluated once more before the input state is stable.
+    dataMgr.ladderStatsTest((0, [0, 0, 1, 1]), {'evaluated': 1, 'unchanged': 0}, 11)
+    dataMgr.ladderStatsTest((0, [0, 0, 1, 1]), {'evaluated': 0, 'unchanged': 1}, 12)
+    dataMgr.ladderStatsTest((8, [1, 1]), {'evaluated': 0, 'skipped': 1}, 13)
+    dataMgr.scheduleLaddersTest([((4, 6), (6, 8)), ((0, 2), (4, 6)), ((0, 2), (4, 6))], ([[1], [2], [0]], []), 14)
+    dataMgr.scheduleLaddersTest([((0, 2), (2, 4)), ((2, 4), (0, 2)), ((8, 9), (8, 9))], ([[2], [0], [1]], [[0, 1]]), 15)
+    dataMgr.scheduleLaddersTest([((2, 4), (10, 12)), ((0, 2), (2, 4)), ((2, 4), (0, 2))], ([[1], [0, 2]], [[1, 2]]), 16)
     print("\n(Integration Test Cases)")   
     client.autoUpdateCoilTest((0, 1), (0, 4), [0, 1, 0, 0], 1) 
+    dataMgr.timerLadderTest(client.getClient(), (10, 1), (10, 1), 0.5, [True], 2)
+    print("\n(Change Driven Write Test Cases)")
+    # registers state after the integration tests: [1, 0, 1, 1] + [0]*6 + [1, 0]
+    plcScan = testPlcScanState(dataMgr, [1, 0, 1, 1, 0, 0, 0, 0, 0, 0, 1, 0], 6)
+    # the first scan writes all the registers, the stub ladder's input is not changed.
+    dataMgr.changeWriteTest(plcScan, {}, [(0, 12)], {'evaluated': 0, 'unchanged': 1}, 1)
+    dataMgr.changeWriteTest(plcScan, {1: 1, 2: 0, 7: 1}, [(1, 2), (7, 1)], {'evaluated': 1, 'unchanged': 0}, 2)
+    # idle scan: nothing written, no ladder is evaluated or checked.
+    dataMgr.changeWriteTest(plcScan, {}, [], {'evaluated': 0, 'unchanged': 0, 'skipped': 0}, 3)
+    # the input state set to the same values: nothing written.
+    dataMgr.changeWriteTest(plcScan, {1: 1, 7: 1}, [], {'evaluated': 0, 'unchanged': 0, 'skipped': 0}, 4)
+    # the stub ladder's source coils are its output coils changed by test 2, so it is 
+    # evaluated once more in the next registers update.
+    dataMgr.changeWriteTest(plcScan, {7: 0, 8: 1}, [(7, 2)], {'evaluated': 1, 'skipped': 0}, 5)
+    # the change out of the stub ladder's input range skips the ladder.
+    dataMgr.changeWriteTest(plcScan, {8: 0}, [(8, 1)], {'evaluated': 0, 'skipped': 1}, 6)
     client.closeClient()
     server.closeServer()
+    print("\n(PLC Unit Router Test Cases)")
+    router = testUnitRouterThread(None, 3, "Router Thread")
+    router.start()
+    time.sleep(0.5)
+    router.unitRouteTest(1, (0, 4), [True, False, True, False], 1)
+    router.unitRouteTest(2, (0, 4), [False, True, False, True], 2)
+    router.unknownUnitTest(9, modbusTcpCom.EXP_GATEWAY_PATH_UNAVAILABLE, 3)
+    router.closeServer()
+    print("\n(Modbus Async Server Test Cases)")
+    asyncServer = testAsyncServerThread(None, 4, "Async Server Thread")
+    asyncServer.start()
+    time.sleep(0.5)
+    asyncServer.splitFrameTest(bytes([3, 0, 0, 0, 2]), bytes([3, 4, 0, 1, 0, 2]), 1)
+    asyncServer.pipelinedFrameTest([bytes([3, 0, 0, 0, 2]), bytes([6, 0, 1, 0, 9]), bytes([3, 0, 0, 0, 2])], 
+                                   [bytes([3, 4, 0, 1, 0, 2]), bytes([6, 0, 1, 0, 9]), bytes([3, 4, 0, 1, 0, 9])], 2)
+    asyncServer.exceptionTest(bytes([43, 0, 0, 0, 1]), modbusTcpCom.EXP_ILLEGAL_FUNCTION, 3)
+    asyncServer.exceptionTest(bytes([3, 0, 0, 0, 200]), modbusTcpCom.EXP_DATA_VALUE, 4)
+    asyncServer.exceptionTest(bytes([1, 0xFF, 0xFF, 0, 5]), modbusTcpCom.EXP_DATA_ADDRESS, 5)
+    asyncServer.exceptionTest(bytes([5, 0, 0, 0x12, 0x34]), modbusTcpCom.EXP_DATA_VALUE, 6)
+    asyncServer.connLimitTest(7)
+    asyncServer.queueLimitTest(100, 8)
+    asyncServer.idleCloseTest(9)
+    asyncServer.closeServer()
 
 if __name__ == '__main__':
     client, server, dataMgr = createTestObjects()
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        plcHost.py
+#
+# Purpose:     This module will provide a host to run several PLC simulators
+#              (plcSimuInterface) in one process, the PLCs share one asyncio event
+#              loop and one UDP connection to the realworld emulator, the SCADA
+#              system's modbus requests are routed to the PLCs by the server port
+#              or the modbus unit ID.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2023/08/06
+# Version:     v_0.1
+# Copyright:   Copyright (c) 2023 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+""" Program Design:
+
+    - Realworld: the host creates one udpPipeClient and one event loop thread, every
+        PLC's RealWorldAsyncConnector logs in with its own PLC ID and sends the requests
+        by the shared client (the replies are matched by the request ID), the input
+        state push subscription uses each PLC's own socket (the pushes have no request ID).
+    - Modbus: the PLCs with the same modbus host address share one modbus TCP service,
+        its plcUnitRouter routes the request to the PLC registered with the request's
+        unit ID (the PLC registered without unit ID gets all the other unit IDs), so
+        the PLCs can use different ports or share one port with different unit IDs.
+        The modbus services run their connections in the host's shared event loop.
+    - Scan: the PLCs are split to <workerNum> worker threads, each worker runs its PLCs'
+        scan cycles in the sequence of their next scan start time.
+    Usage:
+        host = plcHost(('127.0.0.1', 3001), workerNum=2)
+        host.addPlc(signalPlcSet, 'PLC-01', {'hostaddress': ('0.0.0.0', 502)}, ladderObj1, unitID=1)
+        host.addPlc(stationPlcSet, 'PLC-02', {'hostaddress': ('0.0.0.0', 502)}, ladderObj2, unitID=2)
+        host.run()
+"""
+
+import time
+import heapq
+import asyncio
+import threading
+from collections import OrderedDict
+
+import Log
+import udpCom
+import modbusTcpCom
+import plcSimulator
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class plcHost(object):
+    """ Multi-PLC host, init example: host = plcHost(('127.0.0.1', 3001))"""
+    def __init__(self, realworldAddr=('127.0.0.1', 3001), workerNum=1):
+        self.realworldAddr = realworldAddr
+        self.workerNum = max(1, workerNum)
+        self.loop = asyncio.new_event_loop()
+        self.loopThread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loopThread.start()
+        self.rwClient = udpCom.udpPipeClient(realworldAddr)
+        self.rwClient.setTimeOut(timeoutT=plcSimulator.RQST_TO)
+        self.plcDict = OrderedDict()    # {plcID: plcSimuInterface}
+        self.routerDict = {}    # {(modbus ip, port): plcUnitRouter}
+        self.serviceDict = {}   # {(modbus ip, port): modBusService}
+        self.workers = []
+        self.stopEvent = threading.Event()
+
+    def getPlc(self, plcID):
+        return self.plcDict.get(plcID)
+
+    def getScanStats(self):
+        """ Return all the PLCs' scan statistics {plcID: stats}."""
+        return {plcID: plc.getScanStats() for plcID, plc in self.plcDict.items()}
+
+#-----------------------------------------------------------------------------
+    def addPlc(self, plcClass, plcID, addressInfoDict, ladderObj, updateInt=0.5, unitID=None):
+        """ Create a PLC simulator in the host and start serving its modbus requests.
+            Args:
+                plcClass (class): plcSimuInterface sub class.
+                plcID (str): PLC ID.
+                addressInfoDict (dict): same as plcSimuInterface, the 'realworld' address
+                    is replaced by the host's shared realworld connection.
+                ladderObj (modbusTcpCom.ladderLogic): PLC's ladder logic.
+                updateInt (float, optional): PLC scan cycle period. Defaults to 0.5.
+                unitID (int, optional): modbus unit ID routed to the PLC, None means all
+                    the not registered unit IDs of the modbus port. Defaults to None.
+            Returns:
+                plcSimuInterface: the PLC obj.
+        """
+        if plcID in self.plcDict.keys():
+            raise ValueError("plcHost: PLC %s is already added." %str(plcID))
+        addressInfoDict = dict(addressInfoDict, realworld=self.realworldAddr)
+        plc = plcClass(None, plcID, addressInfoDict, ladderObj, updateInt=updateInt,
+                       rwLoop=self.loop, rwClient=self.rwClient, startService=False)
+        hostAddr = tuple(plc.getModbusAddress())
+        if hostAddr not in self.routerDict.keys():
+            self.routerDict[hostAddr] = modbusTcpCom.plcUnitRouter()
+        self.routerDict[hostAddr].addHandler(plc.getDataHandler(), unitID=unitID)
+        if hostAddr not in self.serviceDict.keys():
+            service = plcSimulator.modBusService(self, len(self.serviceDict) + 1, self.routerDict[hostAddr],
+                                                 hostIP=hostAddr[0], hostPort=hostAddr[1], loop=self.loop)
+            service.start()
+            self.serviceDict[hostAddr] = service
+        self.plcDict[plcID] = plc
+        Log.info("plcHost: added PLC %s on modbus %s unit ID %s." %(str(plcID), str(hostAddr), str(unitID)))
+        return plc
+
+#-----------------------------------------------------------------------------
+    def _scanLoop(self, plcList):
+        """ Worker thread: run the PLCs' scan cycles by their next start time."""
+        scanHeap = [(plc.getNextScanTime(), idx) for idx, plc in enumerate(plcList)]
+        heapq.heapify(scanHeap)
+        while scanHeap and not self.stopEvent.is_set():
+            delay = scanHeap[0][0] - time.monotonic()
+            if delay > 0 and self.stopEvent.wait(delay): break
+            _, idx = heapq.heappop(scanHeap)
+            try:
+                plcList[idx].runCycle()
+            except Exception as err:
+                Log.exception("plcHost: PLC %s scan error: %s" %(str(plcList[idx].getPlcID()), str(err)))
+            heapq.heappush(scanHeap, (plcList[idx].getNextScanTime(), idx))
+
+    def run(self, block=True):
+        """ Start the scan worker threads, block until stop() if <block> is True."""
+        plcList = list(self.plcDict.values())
+        for i in range(min(self.workerNum, len(plcList))):
+            worker = threading.Thread(target=self._scanLoop, args=(plcList[i::self.workerNum],), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        if block: self.stopEvent.wait()
+
+    def stop(self):
+        self.stopEvent.set()
+        for worker in self.workers: worker.join()
+        self.workers = []
+        for plc in self.plcDict.values():
+            plc.stop()
+            plc.rwConnector.stop()
+        for service in self.serviceDict.values(): service.stop()
+        try:
+            self.rwClient.disconnect()
+        except OSError:
+            # shutdown() fails on the not connected UDP socket, close it directly.
+            if self.rwClient.client: self.rwClient.client.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
@@ -17,21 +17,54 @@
 """
 Program Design:
 
-Returns:
-    _type_: _description_
+    plcSimuInterface runs the PLC scan cycle: fetch the realworld input (input phase),
+    update the holding registers and solve the ladder logic (solve phase) then push the
+    changed coils to the realworld (output phase). The scanScheduler paces the cycles
+    with the target period under the monotonic clock: the next cycle start time is
+    always calculated from the previous planned start time (not the finish time), so
+    the I/O time doesn't drift the period. If a scan is longer than the period (overrun),
+    the missed cycles are skipped and the next cycle starts at the next period boundary.
+    In push mode (the realworld pushes the subscribed input state) the next cycle starts
+    as soon as the pushed input changes, then the period is counted from the new start.
+    The scan/phases time statistics are returned by plcSimuInterface.getScanStats().
+    The scan is change driven: the input state is compared with the holding registers 
+    state applied in the last scan and only the changed registers runs are written, the 
+    output coils are only compared/pushed if the coils were written (by the ladders or
+    the modbus clients) since the last push, so an idle scan only costs the input fetch.
+    The coils written by the modbus clients are solved by the ladders in the next scan.
+
+    RealWorldAsyncConnector sends the requests by the udpPipeClient from an asyncio event
+    loop (running in a thread or shared by several PLCs), the scan cycle fires the coils
+    push of cycle N and the input fetch of cycle N+1 together at the end of the cycle N
+    (in one batch request if the realworld supports it, else both requests are in flight
+    at the same time), so the input is ready when cycle N+1 starts. A supervisor task sends the heartbeat when the connection is idle and
+    reconnects with the exponential backoff timer after the realworld is lost. Every
+    request's round trip latency is recorded in the latency statistics.
 """
 
 import time
 import json
+import random
+import asyncio
 import threading
 from datetime import datetime
 from collections import OrderedDict
+from concurrent.futures import Future
 
 import Log
 import udpCom
 import modbusTcpCom
+import realWorldCodec
 
 RECON_INT = 30 # reconnection time interval default set 30 sec
+SUB_RENEW = 2  # realworld state subscription renew time interval (sec).
+SUB_TIMEOUT = 3 # pushed state will be treated as stale if no push received in 3 sec.
+SCAN_PHASES = ('input', 'solve', 'output')  # PLC scan cycle phases.
+HEARTBEAT_INT = 5   # async connector heartbeat interval (sec) when the connection is idle.
+RECON_INIT = 0.5    # async connector first reconnect delay (sec), doubled after each failure.
+RECON_JITTER = 0.2  # +/- 20% random jitter of the reconnect delay.
+RQST_TO = 2         # async connector request timeout (sec).
+OVERRUN_LOG_INT = 100 # log one warning every 100 scan overruns.
 
 # Define all the module local untility functions here:
 #-----------------------------------------------------------------------------
@@ -57,15 +90,32 @@ class RealWorldConnector(object):
         Args:
             object (_type_): _description_
     """
-    def __init__(self, parent, address) -> None:
+    def __init__(self, parent, address, binCodec=True) -> None:
+        """ Init example: connector = RealWorldConnector(plc, ('127.0.0.1', 3001))
+            Args:
+                address (tuple): realworld emulator UDP address.
+                binCodec (bool, optional): flag to identify whether try to negotiate 
+                    the binary message codec during login. Defaults to True.
+        """
         self.parent = parent
         self.address = address
         self.realwordInfo= {
             'ip': address[0],
             'port': address[1]
         }
-        self.rwConnector = udpCom.udpClient((self.realwordInfo['ip'], self.realwordInfo['port']))
-        self.recoonectCount = RECON_INT
+        self.rwConnector = self._createClient()
+        self.reconnectT = time.monotonic() + RECON_INT
+        self.binCodecFlg = binCodec
+        self.codec = None   # message codec negotiated with the realworld, None: text.
+        self.batchFlg = False # flag to identify whether the realworld support batch request.
+        self.subFlg = False # flag to identify whether the realworld support state push.
+        # realworld state subscriptions, key: rqstType, val: dict {'rqst': request dict, 
+        # 'data': state dict, 'seq': last push seq, 'valid': bool, 'time': last push time}
+        self.subDict = {}
+        self.subLock = threading.Lock()
+        self.subEvent = threading.Event()   # set when the pushed state changed.
+        self.subConnector = None    # separate UDP client to receive the pushed state.
+        self.subThread = None
         # Test login the real world emulator
         self.plcID = self.parent.getPlcID()
         self.realworldOnline = self._loginRealWord(plcID= self.plcID)
@@ -75,27 +125,139 @@ class RealWorldConnector(object):
     def isRealWorldOnline(self):
         return self.realworldOnline
 
+    def isBatchSupported(self):
+        return self.batchFlg
+
+    def _createClient(self):
+        """ Create the UDP client used to send the requests."""
+        return udpCom.udpClient((self.realwordInfo['ip'], self.realwordInfo['port']))
+
 #-----------------------------------------------------------------------------
+    def _loginRqst(self, plcID):
+        """ Build the login request dict."""
+        rqstDict = {'plcID': plcID}
+        if self.binCodecFlg: rqstDict['codec'] = [realWorldCodec.CODEC_BIN]
+        return rqstDict
+
     def _loginRealWord(self, plcID=None):
         """ Try to connect to the realworld emulator with the plc ID."""
         Log.info("Try to connnect to the realword [%s]..." %str(self.address))
-        rqstKey = 'GET'
-        rqstType = 'login'
-        rqstDict = {'plcID': plcID}
-        result = self._queryToRW(rqstKey, rqstType, rqstDict)
+        self.codec = None
+        result = self._queryToRW('GET', 'login', self._loginRqst(plcID))
+        return self._applyLogin(result)
+
+    def _applyLogin(self, result):
+        """ Load the realworld supported features from the login reply."""
         if result:
-            Log.info("Realworld emulator online, state: ready")
+            (_, _, respDict) = result
+            if isinstance(respDict, dict):
+                if respDict.get('codec') == realWorldCodec.CODEC_BIN: 
+                    self.codec = realWorldCodec.CODEC_BIN
+                self.batchFlg = bool(respDict.get('batch'))
+                self.subFlg = bool(respDict.get('sub'))
+            Log.info("Realworld emulator online, state: ready, codec: %s" %str(self.codec))
             return True
         return False
 
+#-----------------------------------------------------------------------------
+    def subscribe(self, rqstType, rqstDict):
+        """ Subscribe the realworld state change, the realworld emulator will push 
+            the changed state to a separate UDP socket, the listener thread merges the 
+            pushed state and renews the subscription.
+            Args:
+                rqstType (str): sensors/stations/trains
+                rqstDict (dict): {'weline': None, ...} subscribed track IDs.
+        """
+        with self.subLock:
+            self.subDict[rqstType] = {'rqst': dict(rqstDict), 'data': {}, 'seq': 0, 
+                                      'valid': False, 'time': 0}
+        if self.subThread is None:
+            self.subConnector = udpCom.udpClient((self.realwordInfo['ip'], self.realwordInfo['port']))
+            self.subConnector.setTimeOut(timeoutT=1)
+            self.subThread = threading.Thread(target=self._subListener, daemon=True)
+            self.subThread.start()
+
+    def isSubscribed(self, rqstType=None):
+        """ Check whether the pushed state (of the request type) is ready to use."""
+        with self.subLock:
+            if rqstType is None: 
+                return self.subFlg and any(v['valid'] for v in self.subDict.values())
+            record = self.subDict.get(rqstType)
+            return bool(self.subFlg and record and record['valid'] and 
+                        time.monotonic() - record['time'] < SUB_TIMEOUT)
+
+    def getSubData(self, rqstType):
+        """ Return the pushed state under the fetchRWInputData() reply format
+            ('REP', rqstType, stateDict), None if the pushed state is not valid.
+        """
+        if not self.isSubscribed(rqstType): return None
+        with self.subLock:
+            return ('REP', rqstType, dict(self.subDict[rqstType]['data']))
+
+    def waitSubUpdate(self, timeout):
+        """ Wait until the pushed state changes or time out."""
+        updated = self.subEvent.wait(timeout)
+        self.subEvent.clear()
+        return updated
+
+    def _subListener(self):
+        """ Subscription listener thread: renew the subscriptions and merge the 
+            pushed state.
+        """
+        renewT = 0
+        while True:
+            connector = self.subConnector
+            if connector is None: break
+            if self.subFlg and time.monotonic() - renewT >= SUB_RENEW:
+                renewT = time.monotonic()
+                with self.subLock:
+                    rqstList = [(k, v['rqst']) for k, v in self.subDict.items()]
+                for rqstType, rqstDict in rqstList:
+                    # ask the realworld to push in the negotiated codec.
+                    if self.codec: rqstDict = dict(rqstDict, codec=[self.codec])
+                    connector.sendMsg(';'.join(('SUB', rqstType, json.dumps(rqstDict))))
+            try:
+                msg, _ = connector.client.recvfrom(connector.bufferSize)
+                if realWorldCodec.isBinMsg(msg):
+                    k, t, pushDict = realWorldCodec.decodeMsg(msg)
+                else:
+                    k, t, data = parseIncomeMsg(msg)
+                    pushDict = json.loads(data)
+            except Exception:
+                continue # receive timeout or invalid message.
+            if k in ('REP', 'PUB') and isinstance(pushDict, dict) and 'data' in pushDict.keys():
+                self._mergeSubData(t, pushDict)
+
+    def _mergeSubData(self, rqstType, pushDict):
+        """ Merge the pushed delta in the subscribed state, if some push is lost (seq
+            not continuous) the state is invalid until the next keyframe. The subEvent 
+            is set if the merged state changed.
+        """
+        with self.subLock:
+            record = self.subDict.get(rqstType)
+            if record is None: return
+            keyframeFlg = pushDict.get('keyframe', False)
+            validFlg = record['valid']
+            if not keyframeFlg and pushDict['seq'] != record['seq'] + 1:
+                record['valid'] = False
+            record['seq'] = pushDict['seq']
+            changed = any(record['data'].get(k) != v for k, v in pushDict['data'].items())
+            if keyframeFlg: 
+                changed = changed or len(record['data']) != len(pushDict['data'])
+                record['data'] = {}
+                record['valid'] = True
+            record['data'].update(pushDict['data'])
+            record['time'] = time.monotonic()
+            changed = changed or validFlg != record['valid']
+        if changed: self.subEvent.set()
+
 #-----------------------------------------------------------------------------
     def reConnectRW(self):
         """ Try to reconnect to the real world emulator."""
-        if self.recoonectCount <= 0:
+        if time.monotonic() >= self.reconnectT:
             Log.info('Try to reconnect to the realword.')
             self.realworldOnline = self._loginRealWord(plcID=self.plcID)
-            self.recoonectCount = RECON_INT
-        self.recoonectCount -= 1
+            self.reconnectT = time.monotonic() + RECON_INT
 
 #-----------------------------------------------------------------------------
     def fetchRWInputData(self, rqstType='input', inputDict={}):
@@ -120,6 +282,18 @@ class RealWorldConnector(object):
             Log.warning("changeRWCoil(): passed in input parm needs to be a dict() type.get %s" %str(coilDict))
             return None
 
+#-----------------------------------------------------------------------------
+    def _encodeRqst(self, rqstKey, rqstType, rqstDict):
+        """ Encode the request with the negotiated codec, use the text format 
+            'GET;dataType;{json}' if the request can not be encoded in binary.
+        """
+        if self.codec == realWorldCodec.CODEC_BIN and rqstType != 'login':
+            try:
+                return realWorldCodec.encodeMsg(rqstKey, rqstType, rqstDict)
+            except ValueError as err:
+                Log.warning("_encodeRqst(): use text format: %s" %str(err))
+        return ';'.join((rqstKey, rqstType, json.dumps(rqstDict)))
+
 #-----------------------------------------------------------------------------
     def _queryToRW(self, rqstKey, rqstType, rqstDict, response=True):
         """ Query message to realword emulator
@@ -135,20 +309,12 @@ class RealWorldConnector(object):
         """
         k = t = result = None
         if rqstKey and rqstType and rqstDict:
-            rqst = ';'.join((rqstKey, rqstType, json.dumps(rqstDict)))
+            rqst = self._encodeRqst(rqstKey, rqstType, rqstDict)
             if self.rwConnector:
                 resp = self.rwConnector.sendMsg(rqst, resp=response)
                 if resp:
                     #gv.gDebugPrint('===> resp:%s' %str(resp), logType=gv.LOG_INFO)
-                    k, t, data = parseIncomeMsg(resp)
-                    if k != 'REP': Log.warning('The msg reply key %s is invalid' % k)
-                    if t != rqstType: Log.warning('The reply type doesnt match.%s' %str((rqstType, t)))
-                    try:
-                        result = json.loads(data)
-                        self.lastUpdateT = datetime.now()
-                    except Exception as err:
-                        Log.exception('Exception: %s' %str(err))
-                        return None
+                    return self._decodeResp(resp, rqstType)
                 else:
                     Log.warning("Lost connection to the server.")
                     self.realworldOnline = False
@@ -157,13 +323,202 @@ class RealWorldConnector(object):
             Log.error("queryBE: input missing: %s" %str(rqstKey, rqstType, rqstDict))
         return (k, t, result)
 
+    def _decodeResp(self, resp, rqstType):
+        """ Decode the realworld reply to (key, rqstType, resultDict), None if failed."""
+        try:
+            if realWorldCodec.isBinMsg(resp):
+                k, t, result = realWorldCodec.decodeMsg(resp)
+            else:
+                k, t, data = parseIncomeMsg(resp)
+                result = json.loads(data)
+            self.lastUpdateT = datetime.now()
+        except Exception as err:
+            Log.exception('Exception: %s' %str(err))
+            return None
+        if k != 'REP': Log.warning('The msg reply key %s is invalid' % k)
+        if t != rqstType: Log.warning('The reply type doesnt match.%s' %str((rqstType, t)))
+        return (k, t, result)
+
+    def stop(self):
+        subConnector, self.subConnector = self.subConnector, None
+        if subConnector:
+            # stop the listener, cancel the subscriptions and close the socket.
+            if self.subThread: self.subThread.join()
+            self.subThread = None
+            with self.subLock:
+                rqstTypes = list(self.subDict.keys())
+            for rqstType in rqstTypes:
+                subConnector.sendMsg(';'.join(('UNSUB', rqstType, '{}')))
+            subConnector.disconnect()
+        if self.rwConnector is None: return
+        try:
+            self.rwConnector.disconnect()
+        except OSError:
+            # shutdown() fails on the not connected UDP socket, close it directly.
+            if self.rwConnector.client: self.rwConnector.client.close()
+        self.rwConnector = None
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class RealWorldAsyncConnector(RealWorldConnector):
+    """ RealWorldConnector running the requests in an asyncio event loop, several
+        requests can be in flight at the same time. The blocking functions of the
+        RealWorldConnector are still available.
+    """
+    def __init__(self, parent, address, binCodec=True, loop=None, client=None) -> None:
+        """ Init example: connector = RealWorldAsyncConnector(plc, ('127.0.0.1', 3001))
+            Args:
+                loop (asyncio.AbstractEventLoop, optional): the event loop running in
+                    another thread used to send the requests. Defaults to None, the
+                    connector starts its own event loop thread.
+                client (udpCom.udpPipeClient, optional): UDP client shared by several
+                    connectors, it will not be closed by stop(). Defaults to None.
+        """
+        self.sharedClient = client
+        self.loop = loop
+        self.loopThread = None
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.loopThread = threading.Thread(target=self.loop.run_forever, daemon=True)
+            self.loopThread.start()
+        self.terminate = False
+        self.lastReplyT = 0
+        # request round trip latency {rqstType: {'count': n, 'errors': n, 'last': sec, 'avg': sec, 'max': sec}}
+        self.latencyDict = {}
+        self.latencyLock = threading.Lock()
+        super().__init__(parent, address, binCodec=binCodec)
+        self.superviseTask = asyncio.run_coroutine_threadsafe(self._supervise(), self.loop)
+
+    def _createClient(self):
+        if self.sharedClient is not None: return self.sharedClient
+        client = udpCom.udpPipeClient((self.realwordInfo['ip'], self.realwordInfo['port']))
+        client.setTimeOut(timeoutT=RQST_TO)
+        return client
+
+#-----------------------------------------------------------------------------
+    def _recordLatency(self, rqstType, latency):
+        """ Record the request latency (sec), None means the request failed."""
+        with self.latencyLock:
+            record = self.latencyDict.setdefault(rqstType, {'count': 0, 'errors': 0, 'last': 0, 'avg': 0, 'max': 0})
+            if latency is None:
+                record['errors'] += 1
+                return
+            record['count'] += 1
+            record['last'] = latency
+            record['max'] = max(record['max'], latency)
+            record['avg'] += (latency - record['avg']) / record['count']
+
+    def getLatencyStats(self):
+        with self.latencyLock:
+            return {key: dict(record) for key, record in self.latencyDict.items()}
+
+#-----------------------------------------------------------------------------
+    async def queryAsync(self, rqstKey, rqstType, rqstDict):
+        """ Send the request and wait for the reply without blocking the event loop.
+            Returns:
+                tuple: (key, rqstType, resultDict), None if the request failed.
+        """
+        if not (rqstKey and rqstType and rqstDict and self.rwConnector): return None
+        rqst = self._encodeRqst(rqstKey, rqstType, rqstDict)
+        startT = time.monotonic()
+        try:
+            resp = await self.rwConnector.sendRequestAsync(rqst)
+        except Exception as err:
+            self._recordLatency(rqstType, None)
+            if not self.terminate:
+                Log.warning("queryAsync(): request %s failed: %s" %(str(rqstType), str(err)))
+                self.realworldOnline = False
+            return None
+        self.lastReplyT = time.monotonic()
+        self._recordLatency(rqstType, self.lastReplyT - startT)
+        return self._decodeResp(resp, rqstType)
+
+    def submitQuery(self, rqstKey, rqstType, rqstDict):
+        """ Send the request from the other thread.
+            Returns:
+                concurrent.futures.Future: future of the queryAsync() result.
+        """
+        return asyncio.run_coroutine_threadsafe(self.queryAsync(rqstKey, rqstType, rqstDict), self.loop)
+
+    def fetchRWInputDataAsync(self, rqstType='input', inputDict={}):
+        """ Non-blocking fetchRWInputData(), returns the future of the reply."""
+        return self.submitQuery('GET', rqstType, inputDict)
+
+    def changeRWCoilAsync(self, rqstType='signals', coilDict={}):
+        """ Non-blocking changeRWCoil(), returns the future of the reply."""
+        return self.submitQuery('POST', rqstType, coilDict)
+
+    def queryBatchAsync(self, rqstList):
+        """ Send several GET/POST requests to the realworld emulator in one batch request
+            (the realworld needs to support batch, refer to isBatchSupported()).
+            Args:
+                rqstList (list): list of request tuple (rqstKey, rqstType, rqstDict).
+            Returns:
+                list: futures of every request's reply tuple (key, rqstType, resultDict) 
+                    under the same sequence as the requests, the reply is None if the 
+                    batch request failed.
+        """
+        futureList = [Future() for _ in rqstList]
+        def setReplies(batchFuture):
+            respList = None
+            if not batchFuture.cancelled() and batchFuture.exception() is None and batchFuture.result():
+                (_, _, respDict) = batchFuture.result()
+                if isinstance(respDict, dict) and len(respDict.get('batch') or []) == len(rqstList):
+                    respList = [tuple(item) for item in respDict['batch']]
+                else:
+                    Log.warning("queryBatchAsync(): invalid batch reply: %s" %str(respDict))
+            for i, future in enumerate(futureList):
+                future.set_result(respList[i] if respList else None)
+        self.submitQuery('POST', 'batch', {'batch': rqstList}).add_done_callback(setReplies)
+        return futureList
+
+#-----------------------------------------------------------------------------
+    async def _supervise(self):
+        """ Send the heartbeat if no reply in the heartbeat interval and reconnect
+            the lost realworld with the exponential backoff delay.
+        """
+        delay = RECON_INIT
+        while not self.terminate:
+            if self.realworldOnline:
+                delay = RECON_INIT
+                await asyncio.sleep(RECON_INIT)
+                if time.monotonic() - self.lastReplyT < HEARTBEAT_INT: continue
+                if await self.queryAsync('GET', 'login', self._loginRqst(self.plcID)) is None:
+                    Log.warning("RealWorldAsyncConnector: heartbeat failed, realworld lost.")
+                    self.realworldOnline = False
+            else:
+                await asyncio.sleep(delay * random.uniform(1 - RECON_JITTER, 1 + RECON_JITTER))
+                Log.info('Try to reconnect to the realword.')
+                self.codec = None
+                result = await self.queryAsync('GET', 'login', self._loginRqst(self.plcID))
+                self.realworldOnline = self._applyLogin(result)
+                delay = min(delay * 2, RECON_INT)
+
+    def reConnectRW(self):
+        """ The reconnection is handled by the supervisor task."""
+        pass
+
+    def stop(self):
+        self.terminate = True
+        self.superviseTask.cancel()
+        if self.sharedClient is not None: self.rwConnector = None
+        super().stop()
+        if self.loopThread: self.loop.call_soon_threadsafe(self.loop.stop)
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class modBusService(threading.Thread):
     """ mod bus service hold one datahandler, on databank and one Modbus server 
         to handler the SCADA system's modbus request.
     """
-    def __init__(self, parent, threadID, ladderHandler, hostIP='localhost', hostPort=502):
+    def __init__(self, parent, threadID, ladderHandler, hostIP='localhost', hostPort=502,
+                 asyncEngine=True, loop=None):
+        """ Args:
+                asyncEngine (bool, optional): use the event loop modbusAsyncServer, set False
+                    to use the thread per client modbusTcpServer. Defaults to True.
+                loop (asyncio.AbstractEventLoop, optional): running event loop shared with
+                    the other modules for the modbusAsyncServer. Defaults to None.
+        """
         threading.Thread.__init__(self)
         self.parent = parent
         self.threadID = threadID
@@ -171,9 +526,15 @@ class modBusService(threading.Thread):
         self.hostPort = hostPort
         self.ladderHandler = ladderHandler
         # Init the modbus TCP server.
-        self.server = modbusTcpCom.modbusTcpServer(hostIp=self.hostIp, 
-                                                   hostPort=self.hostPort, 
-                                                   dataHandler=self.ladderHandler)
+        if asyncEngine:
+            self.server = modbusTcpCom.modbusAsyncServer(hostIp=self.hostIp,
+                                                         hostPort=self.hostPort,
+                                                         dataHandler=self.ladderHandler,
+                                                         loop=loop)
+        else:
+            self.server = modbusTcpCom.modbusTcpServer(hostIp=self.hostIp, 
+                                                       hostPort=self.hostPort, 
+                                                       dataHandler=self.ladderHandler)
         # load the server info into the 
         serverInfo = self.server.getServerInfo()
         self.ladderHandler.initServerInfo(serverInfo)
@@ -195,6 +556,109 @@ class modBusService(threading.Thread):
     def stop(self):
         self.server.stopServer()
 
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class scanScheduler(object):
+    """ PLC scan cycle scheduler with monotonic clock drift compensation, init example:
+            scheduler = scanScheduler(0.1)
+            while True:
+                scheduler.startScan()
+                ...
+                scheduler.markPhase('input')
+                ...
+                scheduler.endScan()
+                scheduler.waitNext()
+    """
+    def __init__(self, period, phases=SCAN_PHASES):
+        self.period = period
+        self.nextT = None   # planned start time of the next scan.
+        self.scanT = None   # current scan start time.
+        self.phaseT = None  # current phase start time.
+        self.stats = {
+            'period': period,
+            'scans': 0,
+            'overruns': 0,
+            'skipped': 0,   # skipped cycles number because of the overruns.
+            'lastScan': 0,
+            'maxScan': 0,
+            'avgScan': 0,
+            'lastJitter': 0,   # start time delay to the planned start time.
+            'maxJitter': 0,
+            'wakeups': 0,   # scans started early by the input change.
+            'phases': {name: {'last': 0, 'max': 0, 'avg': 0} for name in phases}
+        }
+        self.lock = threading.Lock()
+
+    def _updateAvg(self, record, key, value, count):
+        record[key] += (value - record[key]) / count
+
+#-----------------------------------------------------------------------------
+    def startScan(self):
+        now = time.monotonic()
+        if self.nextT is None: self.nextT = now
+        jitter = max(0, now - self.nextT)
+        with self.lock:
+            self.stats['lastJitter'] = jitter
+            self.stats['maxJitter'] = max(self.stats['maxJitter'], jitter)
+        self.scanT = self.phaseT = now
+
+    def markPhase(self, name):
+        """ Record the time used by the phase <name> (from the previous mark)."""
+        now = time.monotonic()
+        phaseT, self.phaseT = now - self.phaseT, now
+        with self.lock:
+            record = self.stats['phases'].setdefault(name, {'last': 0, 'max': 0, 'avg': 0})
+            record['last'] = phaseT
+            record['max'] = max(record['max'], phaseT)
+            self._updateAvg(record, 'avg', phaseT, self.stats['scans'] + 1)
+
+    def endScan(self):
+        """ Finish the scan, calculate the next scan start time and check the overrun."""
+        now = time.monotonic()
+        scanT = now - self.scanT
+        with self.lock:
+            self.stats['scans'] += 1
+            self.stats['lastScan'] = scanT
+            self.stats['maxScan'] = max(self.stats['maxScan'], scanT)
+            self._updateAvg(self.stats, 'avgScan', scanT, self.stats['scans'])
+        self.nextT += self.period
+        if now > self.nextT:
+            # overrun: skip the missed cycles and keep the period boundary.
+            missed = int((now - self.nextT) / self.period) + 1
+            self.nextT += missed * self.period
+            with self.lock:
+                self.stats['overruns'] += 1
+                self.stats['skipped'] += missed
+                overruns = self.stats['overruns']
+            if overruns % OVERRUN_LOG_INT == 1:
+                Log.warning("scanScheduler: scan time %.3f sec overrun the period %.3f sec (%s overruns)."
+                            %(scanT, self.period, str(overruns)))
+
+    def getNextTime(self):
+        """ Return the planned start time of the next scan (monotonic clock)."""
+        return time.monotonic() if self.nextT is None else self.nextT
+
+    def wakeUp(self):
+        """ Start the next scan now (the input changed), the following scans keep the 
+            period from the new start time.
+        """
+        if self.nextT is None: return
+        self.nextT = min(self.nextT, time.monotonic())
+        with self.lock:
+            self.stats['wakeups'] += 1
+
+    def waitNext(self):
+        """ Sleep until the next scan start time."""
+        if self.nextT is None: return
+        delay = self.nextT - time.monotonic()
+        if delay > 0: time.sleep(delay)
+
+    def getStats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['phases'] = {name: dict(record) for name, record in self.stats['phases'].items()}
+        return stats
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class plcSimuInterface(object):
@@ -205,14 +669,31 @@ class plcSimuInterface(object):
             the output coils state based on the ladder logic. 
         - Send the signal setup request to the real world emulator to change the signal.
     """
-    def __init__(self, parent, plcID, addressInfoDict, ladderObj, updateInt=0.5):
+    def __init__(self, parent, plcID, addressInfoDict, ladderObj, updateInt=0.5,
+                 rwLoop=None, rwClient=None, startService=True):
+        """ Init example: plc = plcSimuInterface(None, 'PLC-01', addressInfoDict, ladderObj)
+            Args:
+                updateInt (float, optional): PLC scan cycle period (sec). Defaults to 0.5.
+                rwLoop (asyncio.AbstractEventLoop, optional): shared event loop used by the
+                    realworld connector. Defaults to None (connector's own loop).
+                rwClient (udpCom.udpPipeClient, optional): shared realworld UDP client.
+                    Defaults to None (connector's own client).
+                startService (bool, optional): start the PLC's own modbus TCP service, set
+                    False if the modbus requests are routed by the plcHost. Defaults to True.
+        """
         self.parent = parent
         self.id = plcID
         self.updateInt = updateInt
+        self.scanScheduler = scanScheduler(updateInt)
         self.realworldAddr = addressInfoDict['realworld'] if 'realworld' in addressInfoDict.keys() else ('127.0.0.1', 3001)
         self.allowReadAddr = addressInfoDict['allowread'] if 'allowread' in addressInfoDict.keys() else None
         self.allowWriteAddr = addressInfoDict['allowwrite'] if 'allowwrite' in addressInfoDict.keys() else None
         self.autoUpdate = True
+        self.prefetchInfo = None # (fetch time, input info or its future) prefetched for the next cycle.
+        self.outputFuture = None # future of the coils push in flight.
+        self.outputPending = False # coils changed (or push failed) but not pushed yet.
+        self.appliedRegs = None  # holding registers state applied in the last scan.
+        self.coilsVersion = None # handler's coils write version of the last coils check.
         # input sensors state from real world emulator:
         self.regsAddrs = (0, 1) 
         self.regs2RWmap = None
@@ -230,11 +711,15 @@ class plcSimuInterface(object):
         self.dataMgr.setAutoUpdate(self.autoUpdate)
 
         # Init the UDP connector to connect to the realworld and test the connection. 
-        self.rwConnector = RealWorldConnector(self, self.realworldAddr)
+        self.rwConnector = RealWorldAsyncConnector(self, self.realworldAddr, loop=rwLoop, client=rwClient)
+        # subscribe the input state change, poll the input if push is not available.
+        self.rwConnector.subscribe(self.regSRWfetchKey, dict.fromkeys(self.regsStateRW.keys()))
         # Init the modbus TCP service
         self.modBusAddr = addressInfoDict['hostaddress'] if 'hostaddress' in addressInfoDict.keys() else ('localhost', 502)
-        self.mbService = modBusService(self, 1, self.dataMgr, hostIP=self.modBusAddr[0], hostPort=self.modBusAddr[1])
-        self.mbService.start()
+        self.mbService = None
+        if startService:
+            self.mbService = modBusService(self, 1, self.dataMgr, hostIP=self.modBusAddr[0], hostPort=self.modBusAddr[1])
+            self.mbService.start()
         self.terminate = False
         Log.info('Finished init the PLC: %s' %str(self.id))
 
@@ -254,45 +739,120 @@ class plcSimuInterface(object):
     def getPlcID(self):
         return self.id
 
+    def getDataHandler(self):
+        return self.dataMgr
+
+    def getModbusAddress(self):
+        return self.modBusAddr
+
+    def getNextScanTime(self):
+        """ Return the monotonic time of the next scan cycle start."""
+        return self.scanScheduler.getNextTime()
+
+    def getScanStats(self):
+        """ Return the scan cycle statistics dict (time in sec), refer to <scanScheduler>,
+            the 'latency' item is the realworld requests' round trip latency.
+        """
+        stats = self.scanScheduler.getStats()
+        stats['latency'] = self.rwConnector.getLatencyStats()
+        return stats
+
 #-----------------------------------------------------------------------------
     def getRWInputInfo(self):
         """ Get sensors state from the real-world simulator. """
+        # use the pushed state if the subscription is working.
+        subInfo = self.rwConnector.getSubData(self.regSRWfetchKey)
+        if subInfo: return subInfo
+        # use the input info prefetched at the end of the last cycle if it is not older
+        # than one update interval.
+        if self.prefetchInfo:
+            (fetchT, result) = self.prefetchInfo
+            self.prefetchInfo = None
+            if isinstance(result, Future): 
+                result = None if result.cancelled() else result.result()
+            if result and time.monotonic() - fetchT <= self.updateInt: return result
         rqstDict = {}
         for key in self.regsStateRW.keys():
             rqstDict[key] = None
         reuslt = self.rwConnector.fetchRWInputData(rqstType=self.regSRWfetchKey, inputDict=rqstDict)
         return reuslt
-        
-#-----------------------------------------------------------------------------
-    def changeRWSignalCoil(self):
-        """ Set the signal state to the real-world simulator. """
-        result =  self.rwConnector.changeRWCoil(rqstType=self.coilsRWSetKey, 
-                                                coilDict= self.coilStateRW)
-        return result
-    
+
 #-----------------------------------------------------------------------------
     def periodic(self, now):
+        """ Run one PLC scan cycle: input fetch, ladder solve and output push."""
+        # the input state is pushed by the realworld, no need to fetch.
+        pushMode = self.rwConnector.isSubscribed(self.regSRWfetchKey)
         sensorInfo = self.getRWInputInfo()
+        self.scanScheduler.markPhase('input')
         if sensorInfo is None: return
         (_, _, result) = sensorInfo
-        time.sleep(0.2)
         for key in result.keys():
             self.regsStateRW[key] = result[key]
-        # Update PLC holding registers.
+        # Update the changed PLC holding registers.
         self.updateHoldingRegs()
-        time.sleep(0.2)
-        coilUpdated = self.updateCoilOutput()
+        # re-evaluate the ladders whose timers expired.
+        self.dataMgr.tickTimers()
+        coilUpdated = False
+        coilsVersion = self.dataMgr.getWriteVersion(modbusTcpCom.MEM_COILS)
+        if coilsVersion != self.coilsVersion:
+            # re-solve the ladders reading the coils written by the modbus clients (the 
+            # coils write doesn't trigger the auto update as the holding registers).
+            self.dataMgr.updateState()
+            self.coilsVersion = self.dataMgr.getWriteVersion(modbusTcpCom.MEM_COILS)
+            coilUpdated = self.updateCoilOutput()
+        self.scanScheduler.markPhase('solve')
         # update the output coils state:
-        if coilUpdated: self.changeRWSignalCoil()
-        time.sleep(self.updateInt)
+        self.changeRWSignalCoilAsync(coilUpdated, pushMode)
+        self.scanScheduler.markPhase('output')
+
+#-----------------------------------------------------------------------------
+    def changeRWSignalCoilAsync(self, coilUpdated, pushMode):
+        """ Fire the coils push and the next cycle's input fetch without waiting for
+            the replies (in one batch request if the realworld supports batch), the coils 
+            are pushed again if the last push failed. Only one coils push is in flight,
+            the coils changed during the push are sent (the latest state) after the push
+            is resolved.
+        """
+        if self.outputFuture is not None and self.outputFuture.done():
+            if self.outputFuture.cancelled() or self.outputFuture.result() is None: 
+                self.outputPending = True
+            self.outputFuture = None
+        if coilUpdated: self.outputPending = True
+        coilUpdated = self.outputPending and self.outputFuture is None
+        if coilUpdated: self.outputPending = False
+        rqstDict = dict.fromkeys(self.regsStateRW.keys())
+        if coilUpdated and not pushMode and self.rwConnector.isBatchSupported():
+            rqstList = [('POST', self.coilsRWSetKey, dict(self.coilStateRW)), 
+                        ('GET', self.regSRWfetchKey, rqstDict)]
+            self.outputFuture, fetchFuture = self.rwConnector.queryBatchAsync(rqstList)
+            self.prefetchInfo = (time.monotonic(), fetchFuture)
+            return
+        if coilUpdated:
+            self.outputFuture = self.rwConnector.changeRWCoilAsync(rqstType=self.coilsRWSetKey,
+                                                                   coilDict=dict(self.coilStateRW))
+        if not pushMode:
+            self.prefetchInfo = (time.monotonic(), 
+                                 self.rwConnector.fetchRWInputDataAsync(rqstType=self.regSRWfetchKey, 
+                                                                        inputDict=rqstDict))
         
 #-----------------------------------------------------------------------------
     def updateHoldingRegs(self):
+        """ Write the changed holding registers, return the changed registers number."""
         holdingRegs = []
         for val in self.regsStateRW.values():
             holdingRegs += val
-        Log.info("updateModBusInfo(): update holding registers: %s" %str(holdingRegs))
-        self.dataMgr.updateHoldingRegs(0, holdingRegs)
+        if holdingRegs == self.appliedRegs: return 0
+        if self.appliedRegs is None or len(holdingRegs) != len(self.appliedRegs):
+            Log.info("updateModBusInfo(): update holding registers: %s" %str(holdingRegs))
+            self.dataMgr.updateHoldingRegs(0, holdingRegs)
+            self.appliedRegs = holdingRegs
+            return len(holdingRegs)
+        changeDict = {idx: val for idx, (val, oldVal) in enumerate(zip(holdingRegs, self.appliedRegs)) 
+                      if val != oldVal}
+        Log.info("updateModBusInfo(): update holding registers: %s" %str(changeDict))
+        self.dataMgr.updateHoldingRegsChanges(changeDict)
+        self.appliedRegs = holdingRegs
+        return len(changeDict)
 
 #-----------------------------------------------------------------------------
     def updateCoilOutput(self):
@@ -306,15 +866,27 @@ class plcSimuInterface(object):
             updatedFlg = True
         return updatedFlg
 #-----------------------------------------------------------------------------
-    def run(self):
-        while not self.terminate:
-            now = time.time()
+    def runCycle(self):
+        """ Run one scan cycle and calculate the next cycle start time."""
+        now = time.time()
+        self.scanScheduler.startScan()
+        try:
             if self.rwConnector.isRealWorldOnline():
                 self.periodic(now)
-                time.sleep(0.6)
             else:
                 self.rwConnector.reConnectRW()
-                time.sleep(1)
+        finally:
+            self.scanScheduler.endScan()
+
+    def run(self):
+        while not self.terminate:
+            self.runCycle()
+            # in push mode, start the next scan as soon as the pushed input changes.
+            if self.rwConnector.isSubscribed(self.regSRWfetchKey):
+                delay = self.scanScheduler.getNextTime() - time.monotonic()
+                if self.rwConnector.waitSubUpdate(delay): self.scanScheduler.wakeUp()
+            self.scanScheduler.waitNext()
+        self.rwConnector.stop()
 
 #-----------------------------------------------------------------------------
     def stop(self):
@@ -324,5 +896,6 @@ class plcSimuInterface(object):
 #-----------------------------------------------------------------------------
 def main():
     pass
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,457 @@
+#-----------------------------------------------------------------------------
+# Name:        plcSimulatorTest.py
+#
+# Purpose:     testcase program used to test lib<plcSimulator.py>, the scan cycle
+#              scheduler is tested under a simulated monotonic clock, the realworld
+#              async connector is tested with a UDP realworld emulator stub.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2023/08/04
+# Version:     v_0.1
+# Copyright:   Copyright (c) 2023 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+
+import time
+import json
+import threading
+from collections import OrderedDict
+from unittest import mock
+
+import udpCom
+import plcSimulator
+import modbusTcpComTest
+
+RW_PORT = 3101
+
+def isClose(val, expectVal):
+    return abs(val - expectVal) < 1e-6
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class testScanScheduler(plcSimulator.scanScheduler):
+    """
+    A subclass that inherits from the plcSimulator.scanScheduler class, the time.monotonic()
+    and time.sleep() are replaced by a simulated clock so the scan time and the start
+    delay of every scan can be set by the test.
+
+    Unit Test Methods:
+        driftTest(): Checks the late start scan doesn't drift the next start time.
+        overrunTest(): Checks the overrun scan skips the missed cycles.
+        phaseStatsTest(): Checks the scan phases' time statistics.
+        wakeUpTest(): Checks the input change starts the next scan now.
+    """
+    def __init__(self, period, startT=1000.0):
+        super().__init__(period)
+        self.clock = startT
+        self.startList = []
+        self.nextList = []
+
+    def monotonic(self):
+        return self.clock
+
+    def sleep(self, delay):
+        self.clock += max(0, delay)
+
+    def patchClock(self):
+        """ Return the context manager replacing the time functions with the clock."""
+        return mock.patch.multiple(time, monotonic=self.monotonic, sleep=self.sleep)
+
+    def runScans(self, scanList):
+        """ Run the scans [(start delay, input phase time, solve phase time, output
+            phase time), ...] and record the start time and the next start time.
+        """
+        for delay, inputT, solveT, outputT in scanList:
+            self.clock += delay
+            self.startScan()
+            self.startList.append(self.clock)
+            for name, phaseT in zip(plcSimulator.SCAN_PHASES, (inputT, solveT, outputT)):
+                self.clock += phaseT
+                self.markPhase(name)
+            self.endScan()
+            self.nextList.append(self.getNextTime())
+            self.waitNext()
+
+    def driftTest(self, scanList, expectedOutput, expectedJitter, testID):
+        """
+        Performs a unit test for the endScan(), the next scan start time is planned
+        from the last planned start time instead of the real start time.
+        Args:
+            scanList (list): scans to run, refer to runScans().
+            expectedOutput (list): expected next start times of the scans.
+            expectedJitter (float): expected max start time jitter.
+            testID (int): The fourth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        self.runScans(scanList)
+        actualOutput = self.nextList[-len(scanList):]
+        assert all(isClose(val, expectVal) for val, expectVal in zip(actualOutput, expectedOutput)), \
+            f"[ ] Test {testID}: scanScheduler drift compensation failed"
+        assert isClose(self.getStats()['maxJitter'], expectedJitter), f"[ ] Test {testID}: scanScheduler drift compensation failed"
+        print(f"[x] Test {testID}: scanScheduler drift compensation passed")
+
+    def overrunTest(self, scanList, expectedNext, expectedSkipped, testID):
+        """
+        Performs a unit test for the endScan(), the overrun scan skips the missed
+        cycles and the next scan restarts at the period boundary.
+        Args:
+            scanList (list): scans to run, the first one overruns the period.
+            expectedNext (float): expected next start time of the overrun scan.
+            expectedSkipped (int): expected skipped cycles number.
+            testID (int): The fourth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        scanIdx = len(self.nextList)
+        self.runScans(scanList)
+        stats = self.getStats()
+        assert isClose(self.nextList[scanIdx], expectedNext), f"[ ] Test {testID}: scanScheduler overrun failed"
+        assert isClose(self.startList[scanIdx + 1], expectedNext), f"[ ] Test {testID}: scanScheduler overrun failed"
+        assert stats['overruns'] == 1 and stats['skipped'] == expectedSkipped, f"[ ] Test {testID}: scanScheduler overrun failed"
+        print(f"[x] Test {testID}: scanScheduler overrun passed")
+
+    def phaseStatsTest(self, expectedOutput, testID):
+        """
+        Performs a unit test for the markPhase()/getStats(), the scans and phases time
+        statistics of the scans run by the previous tests.
+        Args:
+            expectedOutput (dict): expected stats {'scans': n, 'maxScan': sec, ...,
+                'phases': {name: {'avg': sec, ...}}}.
+            testID (int): The second argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        stats = self.getStats()
+        for key, val in expectedOutput.items():
+            if key == 'phases': continue
+            assert isClose(stats[key], val), f"[ ] Test {testID}: scanScheduler phase stats {key} failed"
+        for name, record in expectedOutput.get('phases', {}).items():
+            for key, val in record.items():
+                assert isClose(stats['phases'][name][key], val), f"[ ] Test {testID}: scanScheduler phase stats {name} failed"
+        print(f"[x] Test {testID}: scanScheduler phase stats passed")
+
+    def wakeUpTest(self, changeDelay, testID):
+        """
+        Performs a unit test for the wakeUp(), the pushed input change starts the next
+        scan now (before the planned start time).
+        Args:
+            changeDelay (float): input change time after the scan end, less than the period.
+            testID (int): The second argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        wakeups = self.getStats()['wakeups']
+        self.startScan()
+        self.endScan()
+        self.clock += changeDelay
+        self.wakeUp()
+        assert isClose(self.getNextTime(), self.clock), f"[ ] Test {testID}: scanScheduler wake up failed"
+        assert self.getStats()['wakeups'] == wakeups + 1, f"[ ] Test {testID}: scanScheduler wake up failed"
+        print(f"[x] Test {testID}: scanScheduler wake up passed")
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class testRealWorldThread(threading.Thread):
+    """
+    UDP realworld emulator stub, all the requests are recorded. The server mode:
+        - 'ok': reply the login (with batch support), sensors, signals and batch requests.
+        - 'fail': reply the login with an invalid message, so the PLC's login fails.
+        - 'drop': don't reply any request.
+    """
+    def __init__(self, port):
+        super().__init__(daemon=True)
+        self.server = udpCom.udpServer(None, port)
+        self.mode = 'ok'
+        self.delayDict = {}     # reply delay of the request type {rqstType: sec}.
+        self.batchLen = None    # cut the batch reply to the length (invalid reply).
+        self.rqstLog = []       # [(receive time, rqstKey, rqstType, rqstDict), ...]
+        self.sensors = {'weline': [0, 1, 0, 1]}
+        self.signals = {'weline': [False]*4}
+
+    def run(self):
+        self.server.serverStart(handler=self.msgHandler)
+
+    def getRqsts(self, rqstType):
+        return [item for item in self.rqstLog if item[2] == rqstType]
+
+    def handleRqst(self, rqstKey, rqstType, rqstDict):
+        if rqstType == 'login':
+            return ('login', {'state': 'ready', 'batch': True, 'sub': False})
+        elif rqstKey == 'GET' and rqstType == 'sensors':
+            return ('sensors', {key: self.sensors[key] for key in rqstDict.keys() if key in self.sensors})
+        elif rqstKey == 'POST' and rqstType == 'signals':
+            self.signals.update(rqstDict)
+            return ('signals', {'result': 'success'})
+        elif rqstKey == 'POST' and rqstType == 'batch':
+            respList = [('REP',) + self.handleRqst(*item) for item in rqstDict['batch']]
+            return ('batch', {'batch': respList[:self.batchLen]})
+        return ('deny', {})
+
+    def msgHandler(self, msg):
+        if msg == b'': return None
+        (rqstKey, rqstType, rqstJsonStr) = plcSimulator.parseIncomeMsg(msg)
+        rqstDict = json.loads(rqstJsonStr)
+        self.rqstLog.append((time.monotonic(), rqstKey, rqstType, rqstDict))
+        if self.mode == 'drop': return None
+        if self.mode == 'fail' and rqstType == 'login': return 'REP;login;failed'
+        if rqstType in self.delayDict: time.sleep(self.delayDict[rqstType])
+        respType, respDict = self.handleRqst(rqstKey, rqstType, rqstDict)
+        return ';'.join(('REP', respType, json.dumps(respDict)))
+
+    def closeServer(self):
+        self.server.serverStop()
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class testPlcSimu(plcSimulator.plcSimuInterface):
+    """
+    A subclass that inherits from the plcSimulator.plcSimuInterface class with one
+    track's 4 sensors and 4 signals, the PLC's own modbus service is not started.
+
+    Unit Test Methods:
+        reconnectTest(): Checks the RealWorldAsyncConnector reconnects with the 
+            exponential backoff delay.
+        latencyTest(): Checks the RealWorldAsyncConnector's requests latency stats.
+        lostReplyTest(): Checks the lost reply is counted as an error and the connector
+            reconnects.
+        batchTest(): Checks the RealWorldAsyncConnector.queryBatchAsync() replies.
+        prefetchTest(): Checks the input prefetched in the last cycle is used by the 
+            next cycle if it is not older than the update interval.
+        pushDeferTest(): Checks the coils changed during the push in flight are sent
+            after the push is resolved.
+    """
+    def __init__(self, parent, plcID, addressInfoDict, ladderObj, updateInt=0.2):
+        super().__init__(parent, plcID, addressInfoDict, ladderObj, updateInt=updateInt, startService=False)
+
+    def initInputState(self):
+        self.regsAddrs = (0, 4)
+        self.regSRWfetchKey = 'sensors'
+        self.regs2RWmap = OrderedDict()
+        self.regs2RWmap['weline'] = (0, 4)
+        self.regsStateRW = OrderedDict()
+        self.regsStateRW['weline'] = [0]*4
+
+    def initCoilState(self):
+        self.coilsAddrs = (0, 4)
+        self.coilsRWSetKey = 'signals'
+        self.coils2RWMap = OrderedDict()
+        self.coils2RWMap['weline'] = (0, 4)
+        self.coilStateRW = OrderedDict()
+        self.coilStateRW['weline'] = [False]*4
+
+    def waitOnline(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.rwConnector.isRealWorldOnline(): return True
+            time.sleep(0.01)
+        return False
+
+    def reconnectTest(self, rwServer, testID):
+        """
+        Performs a unit test for the RealWorldAsyncConnector reconnection, the PLC is 
+        created when the realworld login fails, the reconnect delay starts from RECON_INIT
+        and is doubled after each failure (with the +/- RECON_JITTER jitter).
+        Args:
+            rwServer (testRealWorldThread): realworld emulator stub in 'fail' mode.
+            testID (int): The second argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        assert not self.rwConnector.isRealWorldOnline(), f"[ ] Test {testID}: RealWorldAsyncConnector reconnect failed"
+        deadline = time.monotonic() + plcSimulator.RECON_INIT * 3 * (1 + plcSimulator.RECON_JITTER) + 1
+        while len(rwServer.getRqsts('login')) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not self.rwConnector.isRealWorldOnline(), f"[ ] Test {testID}: RealWorldAsyncConnector reconnect failed"
+        rwServer.mode = 'ok'
+        assert self.waitOnline(plcSimulator.RECON_INIT * 4 * (1 + plcSimulator.RECON_JITTER) + 1), \
+            f"[ ] Test {testID}: RealWorldAsyncConnector reconnect failed"
+        loginTimes = [item[0] for item in rwServer.getRqsts('login')]
+        assert len(loginTimes) == 4, f"[ ] Test {testID}: RealWorldAsyncConnector reconnect failed"
+        for i, delay in enumerate((plcSimulator.RECON_INIT, plcSimulator.RECON_INIT * 2, plcSimulator.RECON_INIT * 4)):
+            actualDelay = loginTimes[i+1] - loginTimes[i]
+            assert delay * (1 - plcSimulator.RECON_JITTER) <= actualDelay <= delay * (1 + plcSimulator.RECON_JITTER) + 0.1, \
+                f"[ ] Test {testID}: RealWorldAsyncConnector reconnect delay {i} failed"
+        assert self.rwConnector.isBatchSupported(), f"[ ] Test {testID}: RealWorldAsyncConnector reconnect failed"
+        print(f"[x] Test {testID}: RealWorldAsyncConnector reconnect passed")
+
+    def latencyTest(self, rwServer, rqstNum, delay, testID):
+        """
+        Performs a unit test for the RealWorldAsyncConnector.getLatencyStats(), several
+        sensors fetch requests are in flight and the realworld replies each of them 
+        after the delay.
+        Args:
+            rwServer (testRealWorldThread): realworld emulator stub.
+            rqstNum (int): number of the requests.
+            delay (float): realworld reply delay (sec).
+            testID (int): The fourth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        preStats = self.rwConnector.getLatencyStats().get('sensors', {'count': 0, 'errors': 0})
+        rwServer.delayDict['sensors'] = delay
+        futureList = [self.rwConnector.fetchRWInputDataAsync(rqstType='sensors', inputDict={'weline': None})
+                      for _ in range(rqstNum)]
+        resultList = [future.result(timeout=plcSimulator.RQST_TO + 1) for future in futureList]
+        rwServer.delayDict.pop('sensors')
+        stats = self.rwConnector.getLatencyStats()['sensors']
+        assert resultList == [('REP', 'sensors', rwServer.sensors)]*rqstNum, f"[ ] Test {testID}: getLatencyStats() failed"
+        assert stats['count'] - preStats['count'] == rqstNum, f"[ ] Test {testID}: getLatencyStats() failed"
+        assert stats['errors'] == preStats['errors'], f"[ ] Test {testID}: getLatencyStats() failed"
+        # the stub server replies the requests one by one.
+        assert stats['max'] >= delay * rqstNum and stats['last'] >= delay, f"[ ] Test {testID}: getLatencyStats() failed"
+        assert stats['max'] >= stats['avg'] > 0, f"[ ] Test {testID}: getLatencyStats() failed"
+        print(f"[x] Test {testID}: getLatencyStats() passed")
+
+    def lostReplyTest(self, rwServer, testID):
+        """
+        Performs a unit test for the RealWorldAsyncConnector.queryAsync() request time
+        out, the lost reply is counted as an error, the realworld is marked offline and 
+        reconnected in RECON_INIT delay.
+        Args:
+            rwServer (testRealWorldThread): realworld emulator stub.
+            testID (int): The second argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        preErrors = self.rwConnector.getLatencyStats().get('sensors', {'errors': 0})['errors']
+        rwServer.mode = 'drop'
+        future = self.rwConnector.fetchRWInputDataAsync(rqstType='sensors', inputDict={'weline': None})
+        assert future.result(timeout=plcSimulator.RQST_TO + 1) is None, f"[ ] Test {testID}: queryAsync() lost reply failed"
+        assert self.rwConnector.getLatencyStats()['sensors']['errors'] == preErrors + 1, f"[ ] Test {testID}: queryAsync() lost reply failed"
+        assert not self.rwConnector.isRealWorldOnline(), f"[ ] Test {testID}: queryAsync() lost reply failed"
+        rwServer.mode = 'ok'
+        assert self.waitOnline(plcSimulator.RECON_INIT * (1 + plcSimulator.RECON_JITTER) + 0.5), \
+            f"[ ] Test {testID}: queryAsync() lost reply failed"
+        print(f"[x] Test {testID}: queryAsync() lost reply passed")
+
+    def batchTest(self, rwServer, rqstList, batchLen, expectedOutput, testID):
+        """
+        Performs a unit test for the RealWorldAsyncConnector.queryBatchAsync(), the 
+        requests are sent in one batch request and every request's future gets its reply,
+        all the futures get None if the batch reply is invalid.
+        Args:
+            rwServer (testRealWorldThread): realworld emulator stub.
+            rqstList (list): requests [(rqstKey, rqstType, rqstDict), ...].
+            batchLen (int): the realworld batch reply length, None means not cut.
+            expectedOutput (list): expected replies.
+            testID (int): The fifth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        batchNum = len(rwServer.getRqsts('batch'))
+        rwServer.batchLen = batchLen
+        futureList = self.rwConnector.queryBatchAsync(rqstList)
+        actualOutput = [future.result(timeout=plcSimulator.RQST_TO + 1) for future in futureList]
+        rwServer.batchLen = None
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: queryBatchAsync() failed"
+        assert len(rwServer.getRqsts('batch')) == batchNum + 1, f"[ ] Test {testID}: queryBatchAsync() failed"
+        print(f"[x] Test {testID}: queryBatchAsync() passed")
+
+    def prefetchTest(self, rwServer, fetchDelay, expectedFetchNum, testID):
+        """
+        Performs a unit test for the input prefetch, the changeRWSignalCoilAsync() fires
+        the next cycle's input fetch, the getRWInputInfo() uses the prefetched input if
+        it is not older than the update interval, else fetches the input again.
+        Args:
+            rwServer (testRealWorldThread): realworld emulator stub.
+            fetchDelay (float): time between the prefetch and the next cycle's input read.
+            expectedFetchNum (int): expected sensors fetch requests number.
+            testID (int): The fourth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        fetchNum = len(rwServer.getRqsts('sensors'))
+        self.changeRWSignalCoilAsync(False, False)
+        assert self.prefetchInfo is not None, f"[ ] Test {testID}: prefetch failed"
+        time.sleep(fetchDelay)
+        actualOutput = self.getRWInputInfo()
+        assert actualOutput == ('REP', 'sensors', rwServer.sensors), f"[ ] Test {testID}: prefetch failed"
+        assert self.prefetchInfo is None, f"[ ] Test {testID}: prefetch failed"
+        assert len(rwServer.getRqsts('sensors')) - fetchNum == expectedFetchNum, f"[ ] Test {testID}: prefetch failed"
+        print(f"[x] Test {testID}: prefetch passed")
+
+    def pushDeferTest(self, rwServer, coilsList, testID):
+        """
+        Performs a unit test for the changeRWSignalCoilAsync(), the realworld replies the
+        coils push slowly, the coils changes during the push in flight are not pushed,
+        the latest coils state is pushed after the push is resolved.
+        Args:
+            rwServer (testRealWorldThread): realworld emulator stub.
+            coilsList (list): coils states changed one by one during the first push.
+            testID (int): The third argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        pushNum = len(rwServer.getRqsts('signals'))
+        rwServer.delayDict['signals'] = 0.3
+        for coilState in coilsList:
+            self.coilStateRW['weline'] = list(coilState)
+            self.changeRWSignalCoilAsync(True, True)
+        outputFuture = self.outputFuture
+        assert self.outputPending and outputFuture is not None, f"[ ] Test {testID}: changeRWSignalCoilAsync() failed"
+        assert outputFuture.result(timeout=plcSimulator.RQST_TO + 1) is not None, f"[ ] Test {testID}: changeRWSignalCoilAsync() failed"
+        assert len(rwServer.getRqsts('signals')) - pushNum == 1, f"[ ] Test {testID}: changeRWSignalCoilAsync() failed"
+        # next cycle without coils change: the latest state is pushed.
+        self.changeRWSignalCoilAsync(False, True)
+        assert not self.outputPending and self.outputFuture is not outputFuture, f"[ ] Test {testID}: changeRWSignalCoilAsync() failed"
+        assert self.outputFuture.result(timeout=plcSimulator.RQST_TO + 1) is not None, f"[ ] Test {testID}: changeRWSignalCoilAsync() failed"
+        rwServer.delayDict.pop('signals')
+        pushList = [item[3] for item in rwServer.getRqsts('signals')][pushNum:]
+        assert pushList == [{'weline': coilsList[0]}, {'weline': coilsList[-1]}], f"[ ] Test {testID}: changeRWSignalCoilAsync() failed"
+        assert rwServer.signals == {'weline': coilsList[-1]}, f"[ ] Test {testID}: changeRWSignalCoilAsync() failed"
+        print(f"[x] Test {testID}: changeRWSignalCoilAsync() passed")
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def createTestObjects():
+    print("======================================= Creating Test Objects ========================================")
+    scheduler = testScanScheduler(0.1)
+    return scheduler
+
+def createPlcObjects():
+    rwServer = testRealWorldThread(RW_PORT)
+    rwServer.mode = 'fail'
+    rwServer.start()
+    addressInfoDict = {'realworld': ('127.0.0.1', RW_PORT)}
+    plc = testPlcSimu(None, 'PLC-00', addressInfoDict, modbusTcpComTest.stubLadderLogic(None))
+    return (rwServer, plc)
+
+def runTestCases(scheduler):
+    print("========================== Running Test Cases for PLC Simulator ==========================")
+    print("(Scan Scheduler Test Cases)")
+    with scheduler.patchClock():
+        # the 0.01 sec late start of scan 2 doesn't drift the next start time.
+        scheduler.driftTest([(0, 0.02, 0.01, 0.02), (0.01, 0.02, 0.01, 0.01)], [1000.1, 1000.2], 0.01, 1)
+        # scan 3 (0.25 sec) overruns the period: skip 2 cycles, restart at the boundary.
+        scheduler.overrunTest([(0, 0.02, 0.2, 0.03), (0, 0.02, 0.01, 0.01)], 1000.5, 2, 2)
+        scheduler.phaseStatsTest({'scans': 4, 'maxScan': 0.25, 'lastScan': 0.04,
+                                  'phases': {'input': {'avg': 0.02}, 'solve': {'max': 0.2, 'last': 0.01},
+                                             'output': {'avg': 0.0175}}}, 3)
+        scheduler.wakeUpTest(0.03, 4)
+
+def runPlcTestCases(rwServer, plc):
+    print("\n(Realworld Async Connector Test Cases)")
+    plc.reconnectTest(rwServer, 1)
+    plc.latencyTest(rwServer, 4, 0.05, 2)
+    plc.lostReplyTest(rwServer, 3)
+    sensorsRep = ('REP', 'sensors', rwServer.sensors)
+    rqstList = [('POST', 'signals', {'weline': [True, False, False, False]}), ('GET', 'sensors', {'weline': None})]
+    plc.batchTest(rwServer, rqstList, None, [('REP', 'signals', {'result': 'success'}), sensorsRep], 4)
+    # the batch reply with a missing entry is invalid.
+    plc.batchTest(rwServer, rqstList, 1, [None, None], 5)
+    print("\n(PLC Scan Output Test Cases)")
+    plc.prefetchTest(rwServer, 0, 1, 1)
+    # the prefetched input is older than the update interval, fetched again.
+    plc.prefetchTest(rwServer, plc.updateInt + 0.1, 2, 2)
+    plc.pushDeferTest(rwServer, [[True, False, False, False], [True, True, False, False], 
+                                 [False, True, True, False]], 3)
+    plc.rwConnector.stop()
+    rwServer.closeServer()
+
+if __name__ == '__main__':
+    scheduler = createTestObjects()
+    runTestCases(scheduler)
+    rwServer, plc = createPlcObjects()
+    runPlcTestCases(rwServer, plc)
@@ -0,0 +1,346 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        plcTimers.py
+#
+# Purpose:     This module will provide the PLC timer (TON/TOF/TP) and counter (CTU/CTD)
+#              function blocks for the ladder logic, the timers are driven by a
+#              hierarchical timer wheel so the scan cost only depends on the number of
+#              the expired timers, not the number of the running timers.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2023/08/04
+# Version:     v_0.1
+# Copyright:   Copyright (c) 2023 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+""" Program Design:
+
+    - timerWheel: WHEEL_LEVELS levels x WHEEL_SLOTS slots wheel with TICK_RES sec tick.
+        A timer expiring in n ticks is put in the level whose slots range covers n. When
+        the level 0 index wraps, the current slot of the upper level is cascaded (its
+        timers are re-put to the lower levels). Each tick only touches one level 0 slot
+        (plus the cascaded slots), start/cancel a timer is O(1). The timers later than
+        the wheel range are kept in the top level and re-put when they are cascaded.
+
+    - plcTimer: IEC 61131-3 like timer function block, call update(inState) in the
+        ladder's runLadderLogic() and use the output q:
+        - TON: q turns on <presetT> sec after the input turns on, off with the input.
+        - TOF: q turns on with the input, off <presetT> sec after the input turns off.
+        - TP: the input rising edge turns on q for <presetT> sec (pulse), the input is
+            ignored during the pulse.
+
+    - plcCounter: CTU (q = cv >= pv) / CTD (q = cv <= 0) counter function block, the
+        count input rising edge increases/decreases the current value cv.
+
+    - timerBank: The plcDataHandler's timers holder, it binds the ladders' timers with
+        the wheel and records the owner ladders of the expired timers, so the handler
+        only re-evaluates these ladders when their timers expire.
+    Usage:
+        class dwellLadder(modbusTcpCom.ladderLogic):
+            def initLadderInfo(self):
+                ...
+                self.dwellTimer = self.addTimer('dwell', plcTimers.TON, 5)
+            def runLadderLogic(self, regsList, coilList=None):
+                return [self.dwellTimer.update(regsList[0])]
+"""
+
+import time
+import random
+import threading
+
+TON = 'TON'     # on delay timer.
+TOF = 'TOF'     # off delay timer.
+TP = 'TP'       # pulse timer.
+CTU = 'CTU'     # up counter.
+CTD = 'CTD'     # down counter.
+
+TICK_RES = 0.01     # timer wheel tick resolution (sec).
+WHEEL_BITS = 6
+WHEEL_SLOTS = 1 << WHEEL_BITS   # 64 slots per level.
+WHEEL_LEVELS = 4                # 64^4 ticks (~46 hours under 10ms tick) range.
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class timerWheel(object):
+    """ Hierarchical timer wheel, the wheel entry can be any obj with the attributes
+        '_expireTick', '_slot' and the function '_expire()'. Init example:
+            wheel = timerWheel()
+            wheel.schedule(timerObj, 1.5)
+            expiredList = wheel.advance()
+    """
+    def __init__(self, tickRes=TICK_RES, startT=None):
+        self.tickRes = tickRes
+        self.startT = time.monotonic() if startT is None else startT
+        self.currentTick = 0
+        self.count = 0
+        self.slots = [[{} for _ in range(WHEEL_SLOTS)] for _ in range(WHEEL_LEVELS)]
+        self.lock = threading.RLock()
+
+    def getTick(self, now=None):
+        now = time.monotonic() if now is None else now
+        return int((now - self.startT) / self.tickRes)
+
+    def __len__(self):
+        return self.count
+
+    def _put(self, entry):
+        """ Put the entry in the slot of the level covering its expire tick."""
+        delta = max(0, entry._expireTick - self.currentTick)
+        for level in range(WHEEL_LEVELS):
+            if delta < 1 << (WHEEL_BITS * (level + 1)) or level == WHEEL_LEVELS - 1:
+                # the later than range entry is put in the top level's last slot.
+                expireTick = min(entry._expireTick, self.currentTick + (1 << (WHEEL_BITS * (level + 1))) - 1)
+                slot = self.slots[level][(expireTick >> (WHEEL_BITS * level)) & (WHEEL_SLOTS - 1)]
+                break
+        slot[entry] = None
+        entry._slot = slot
+
+#-----------------------------------------------------------------------------
+    def schedule(self, entry, delay, now=None):
+        """ Schedule the entry to expire after <delay> sec (at least one tick)."""
+        with self.lock:
+            if entry._slot is not None: self.cancel(entry)
+            entry._expireTick = max(self.getTick(now) + int(round(delay / self.tickRes)),
+                                    self.currentTick + 1)
+            self._put(entry)
+            self.count += 1
+
+    def cancel(self, entry):
+        """ Remove the entry from the wheel, O(1)."""
+        with self.lock:
+            if entry._slot is None: return
+            del entry._slot[entry]
+            entry._slot = None
+            self.count -= 1
+
+    def advance(self, now=None):
+        """ Move the wheel to the current time, call the expired entries' _expire().
+            Returns:
+                list: the expired entries.
+        """
+        expiredList = []
+        with self.lock:
+            tgtTick = self.getTick(now)
+            if self.count == 0:
+                self.currentTick = max(self.currentTick, tgtTick)
+                return expiredList
+            while self.currentTick < tgtTick:
+                self.currentTick += 1
+                # cascade the upper levels' current slots when the lower level wraps.
+                for level in range(1, WHEEL_LEVELS):
+                    if self.currentTick & ((1 << (WHEEL_BITS * level)) - 1): break
+                    idx = (self.currentTick >> (WHEEL_BITS * level)) & (WHEEL_SLOTS - 1)
+                    slot = self.slots[level][idx]
+                    self.slots[level][idx] = {}
+                    for entry in slot: self._put(entry)
+                slot = self.slots[0][self.currentTick & (WHEEL_SLOTS - 1)]
+                if not slot: continue
+                self.slots[0][self.currentTick & (WHEEL_SLOTS - 1)] = {}
+                for entry in slot:
+                    if entry._expireTick > self.currentTick:
+                        self._put(entry)    # out of range entry, re-put it.
+                        continue
+                    entry._slot = None
+                    self.count -= 1
+                    expiredList.append(entry)
+                if self.count == 0:
+                    self.currentTick = tgtTick
+                    break
+        for entry in expiredList: entry._expire()
+        return expiredList
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class plcTimer(object):
+    """ TON/TOF/TP timer function block, init example:
+            timer = plcTimer(TON, 5)
+            q = timer.update(True)
+    """
+    def __init__(self, timerType, presetT):
+        if not timerType in (TON, TOF, TP):
+            raise ValueError("plcTimer: not support timer type %s" %str(timerType))
+        self.timerType = timerType
+        self.presetT = presetT
+        self.wheel = None   # bound by the timerBank.
+        self.owner = None   # owner ladder key.
+        self.expireCallback = None
+        self.inState = False
+        self.q = False
+        self.running = False
+        self.startT = None
+        self._expireTick = 0
+        self._slot = None
+
+    def bind(self, wheel, owner=None, expireCallback=None):
+        self.wheel = wheel
+        self.owner = owner
+        self.expireCallback = expireCallback
+
+    def _start(self, now):
+        self.running = True
+        self.startT = time.monotonic() if now is None else now
+        if self.wheel is not None: self.wheel.schedule(self, self.presetT, now=now)
+
+    def _stop(self):
+        self.running = False
+        if self.wheel is not None: self.wheel.cancel(self)
+
+    def _expire(self):
+        """ Called by the timer wheel when the preset time passed."""
+        self.running = False
+        self.q = self.timerType == TON
+        if self.expireCallback: self.expireCallback(self)
+
+#-----------------------------------------------------------------------------
+    def update(self, inState, now=None):
+        """ Update the timer input state and return the output q."""
+        inState = bool(inState)
+        risingFlg, fallingFlg = inState and not self.inState, self.inState and not inState
+        self.inState = inState
+        if self.wheel is None and self.running:
+            # unbound timer: check the preset time at the update.
+            if (time.monotonic() if now is None else now) - self.startT >= self.presetT: self._expire()
+        if self.timerType == TON:
+            if risingFlg: self._start(now)
+            elif fallingFlg:
+                self._stop()
+                self.q = False
+        elif self.timerType == TOF:
+            if risingFlg:
+                self._stop()
+                self.q = True
+            elif fallingFlg: self._start(now)
+        elif risingFlg and not self.running:
+            self.q = True
+            self._start(now)
+        return self.q
+
+    def getElapsedTime(self, now=None):
+        """ Return the elapsed time (sec) of the running timer, the preset time if
+            finished and 0 if not started.
+        """
+        if self.running:
+            return min(self.presetT, (time.monotonic() if now is None else now) - self.startT)
+        return self.presetT if self.startT is not None else 0
+
+    def reset(self):
+        self._stop()
+        self.inState = self.q = False
+        self.startT = None
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class plcCounter(object):
+    """ CTU/CTD counter function block, init example:
+            counter = plcCounter(CTU, 3)
+            q = counter.update(countIn)
+    """
+    def __init__(self, counterType, presetV):
+        if not counterType in (CTU, CTD):
+            raise ValueError("plcCounter: not support counter type %s" %str(counterType))
+        self.counterType = counterType
+        self.presetV = presetV
+        self.cv = 0 if counterType == CTU else presetV
+        self.countIn = False
+        self.q = self._getQ()
+
+    def _getQ(self):
+        return self.cv >= self.presetV if self.counterType == CTU else self.cv <= 0
+
+    def update(self, countIn, reset=False):
+        """ Count at the count input rising edge and return the output q. The reset
+            flag clears the CTU to 0 and loads the preset value to the CTD.
+        """
+        countIn = bool(countIn)
+        if reset:
+            self.cv = 0 if self.counterType == CTU else self.presetV
+        elif countIn and not self.countIn:
+            self.cv += 1 if self.counterType == CTU else -1
+        self.countIn = countIn
+        self.q = self._getQ()
+        return self.q
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class timerBank(object):
+    """ The timers holder of the plcDataHandler, init example:
+            bank = timerBank()
+            bank.bindTimers('ladder01', ladderObj.getTimers())
+            bank.advance()
+            expiredOwners = bank.popExpired()
+    """
+    def __init__(self, tickRes=TICK_RES):
+        self.wheel = timerWheel(tickRes=tickRes)
+        self.timerDict = {}     # {ownerKey: {timerKey: timerObj}}
+        self.expiredOwners = set()
+        self.lock = threading.Lock()
+
+    def bindTimers(self, ownerKey, timerDict):
+        """ Bind the owner's timers {timerKey: plcTimer} with the timer wheel."""
+        self.timerDict[ownerKey] = timerDict
+        for timer in timerDict.values():
+            timer.bind(self.wheel, owner=ownerKey, expireCallback=self._onExpire)
+
+    def _onExpire(self, timer):
+        with self.lock:
+            self.expiredOwners.add(timer.owner)
+
+    def advance(self, now=None):
+        """ Move the timer wheel to the current time, return the expired timers number."""
+        return len(self.wheel.advance(now=now))
+
+    def popExpired(self):
+        """ Return and clear the owner keys set of the expired timers."""
+        with self.lock:
+            expiredOwners, self.expiredOwners = self.expiredOwners, set()
+        return expiredOwners
+
+    def getRunningCount(self):
+        return len(self.wheel)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase(timerNum=10000, loopNum=500):
+    """ Timer wheel and function blocks test under the simulated time."""
+    startT = 1000.0
+    wheel = timerWheel(startT=startT)
+    timers = [plcTimer(TON, round(random.uniform(0.01, 2000), 2)) for _ in range(timerNum)]
+    for timer in timers: timer.bind(wheel)
+    for timer in timers: timer.update(True, now=startT)
+    expectDict = {id(timer): timer.presetT for timer in timers}
+    passed = True
+    now, costT, expiredNum = startT, 0, 0
+    for _ in range(loopNum):
+        now += 5
+        scanT = time.perf_counter()
+        expiredList = wheel.advance(now=now)
+        costT += time.perf_counter() - scanT
+        expiredNum += len(expiredList)
+        for timer in expiredList:
+            # expire in the current scan (5 sec), not earlier than the preset time.
+            delay = now - startT
+            passed = passed and timer.q and expectDict[id(timer)] <= delay + TICK_RES \
+                and delay - expectDict[id(timer)] < 5 + TICK_RES
+    passed = passed and expiredNum == timerNum and len(wheel) == 0
+    print(" - timerWheel %s timers test passed: %s" %(str(timerNum), str(passed)))
+    print(" - advance cost: %.3f ms/scan" %(costT / loopNum * 1000))
+    # function blocks test.
+    wheel = timerWheel(startT=0)
+    tonT, tofT, tpT = plcTimer(TON, 1), plcTimer(TOF, 1), plcTimer(TP, 1)
+    for timer in (tonT, tofT, tpT): timer.bind(wheel)
+    result = []
+    for now, inState in ((0, True), (0.5, True), (1.2, True), (1.5, False), (2.0, True), (2.6, False), (4.0, False)):
+        wheel.advance(now=now)
+        result.append((tonT.update(inState, now=now), tofT.update(inState, now=now), tpT.update(inState, now=now)))
+    expectList = [(False, True, True), (False, True, True), (True, True, False), (False, True, False),
+                  (False, True, True), (False, True, True), (False, False, False)]
+    print(" - TON/TOF/TP test passed: %s" %str(result == expectList))
+    ctu, ctd = plcCounter(CTU, 2), plcCounter(CTD, 2)
+    result = [(ctu.update(state), ctd.update(state)) for state in (1, 0, 1, 1, 0)]
+    result.append((ctu.update(0, reset=True), ctd.update(0, reset=True)))
+    expectList = [(False, False), (False, False), (True, True), (True, True), (True, True), (False, False)]
+    print(" - CTU/CTD test passed: %s" %str(result == expectList))
+
+if __name__ == "__main__":
+    testCase()
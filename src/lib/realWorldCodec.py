@@ -0,0 +1,254 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        realWorldCodec.py
+#
+# Purpose:     This module will provide a compact binary codec for the PLC <=>
+#              realworld emulator GET/POST/REP messages, it can be used to replace
+#              the text message 'GET;sensors;{json}' after the binary codec is
+#              negotiated during the PLC login.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2023/07/28
+# Version:     v_0.1
+# Copyright:   Copyright (c) 2023 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+""" Program Design:
+
+    The realworld emulator's components state are lists of 0/1 ints under track ID
+    keys, for example: {'weline': [0, 1, 0, ...], 'nsline': [...], ...}, the text
+    message needs json encode/decode and use 3~4 bytes for one bit. The binary message
+    format is:
+        byte 0: message type byte = 0x80 | (reqKey << 4) | reqType, the highest bit
+            is always set, so a binary message will never be mixed with a text message.
+        byte 1: result state byte (1: success, 0: failed).
+        byte 2: number of entries N.
+        N entries: track ID byte + uint16 bits count (0xFFFF means None value) + the
+            bit-packed state list.
+    Example:
+        - PLC send GET sensors request {'weline': None, 'nsline': None},
+        - Realworld reply REP sensors {'weline': [0, 1, ...], 'nsline': [...]}.
+        - PLC send POST signals request {'weline': [True, False, ...], ...}.
+        - Realworld reply REP signals {'result': 'success'} (without entry)
+
+    Push message: the subscription state push (and the SUB request's keyframe reply)
+    {'seq': n, 'keyframe': bool, 'data': {'weline': [...], ...}} sets the PUSH_FLG (and 
+    KEYFRAME_FLG) bit in the result state byte, the uint32 seq is put between the 
+    header and the entries of the data dict.
+
+    Batch message: several GET/POST requests (or their REP replies) can be carried in 
+    one 'batch' message {'batch': [(reqKey, reqType, dataDict), ...]}, the batch entries 
+    count is put in the entries count byte and each entry is a uint16 length + the 
+    encoded sub message.
+
+    The codec is negotiated during the login: the PLC adds 'codec': [CODEC_BIN] in the
+    login request dict, if the realworld emulator support it, the login reply will
+    contain 'codec': CODEC_BIN. The text message format is always supported.
+"""
+
+import struct
+
+CODEC_BIN = 'bin'       # codec name used in the login negotiation.
+BIN_FLG = 0x80          # highest bit of the binary message type byte.
+
+REQ_KEYS = ('GET', 'POST', 'REP', 'SUB', 'PUB')
+REQ_TYPES = ('login', 'sensors', 'stations', 'trains', 'signals', 'batch')
+TRACK_IDS = ('weline', 'nsline', 'ccline', 'mtline', 'config')
+
+NONE_LEN = 0xFFFF       # bits count to identify the None value.
+MSG_HEADER = struct.Struct('!BBB')  # message type, result state, entries count.
+ENTRY_HEADER = struct.Struct('!BH') # track ID, bits count.
+BATCH_HEADER = struct.Struct('!H')  # batch sub message length.
+PUSH_SEQ = struct.Struct('!I')      # push message sequence number.
+PUSH_KEYS = {'seq', 'keyframe', 'data'} # push message dict keys.
+PUSH_FLG = 0x02         # result state byte flag of the push message.
+KEYFRAME_FLG = 0x04     # result state byte flag of the full state keyframe push.
+
+#-----------------------------------------------------------------------------
+def isBinMsg(msg):
+    """ Check whether the income message is a binary codec message."""
+    return isinstance(msg, (bytes, bytearray)) and len(msg) >= MSG_HEADER.size and bool(msg[0] & BIN_FLG)
+
+#-----------------------------------------------------------------------------
+def packBits(stateList):
+    """ Pack the 0/1 state list to bytes, bit i of the list is the bit (i % 8) of
+        byte (i // 8).
+    """
+    result = bytearray((len(stateList) + 7) // 8)
+    for i, state in enumerate(stateList):
+        if state: result[i >> 3] |= 1 << (i & 7)
+    return bytes(result)
+
+def unpackBits(data, bitsCount, boolFlg=False):
+    """ Unpack the bytes to a state list with bitsCount elements."""
+    if boolFlg: return [bool(data[i >> 3] >> (i & 7) & 1) for i in range(bitsCount)]
+    return [data[i >> 3] >> (i & 7) & 1 for i in range(bitsCount)]
+
+#-----------------------------------------------------------------------------
+def encodeMsg(reqKey, reqType, dataDict):
+    """ Encode the message to the binary format.
+        Args:
+            reqKey (str): GET/POST/REP
+            reqType (str): sensors/stations/trains/signals
+            dataDict (dict): message data dict, the value must be None or a list
+                of 0/1 (bool), {'result': 'success'/'failed'} is used for the result.
+        Raises:
+            ValueError: the message can not be encoded in the binary format, the
+                caller should use the text format.
+        Returns:
+            bytes: binary message.
+    """
+    if not reqKey in REQ_KEYS or not reqType in REQ_TYPES:
+        raise ValueError("encodeMsg(): not support message type %s" %str((reqKey, reqType)))
+    msgType = BIN_FLG | (REQ_KEYS.index(reqKey) << 4) | REQ_TYPES.index(reqType)
+    if reqType == 'batch': return _encodeBatch(msgType, dataDict)
+    if set(dataDict.keys()) == PUSH_KEYS:
+        _, entriesCount, entries = _encodeEntries(dataDict['data'])
+        flags = 1 | PUSH_FLG | (KEYFRAME_FLG if dataDict['keyframe'] else 0)
+        return MSG_HEADER.pack(msgType, flags, entriesCount) + PUSH_SEQ.pack(dataDict['seq'] & 0xFFFFFFFF) + entries
+    result, entriesCount, entries = _encodeEntries(dataDict)
+    return MSG_HEADER.pack(msgType, result, entriesCount) + entries
+
+def _encodeEntries(dataDict):
+    """ Encode the track state entries, returns (result state, entries count, bytes)."""
+    result = 1
+    entries = []
+    for key, val in dataDict.items():
+        if key == 'result':
+            result = 1 if val == 'success' else 0
+            continue
+        if not key in TRACK_IDS:
+            raise ValueError("encodeMsg(): not support track ID %s" %str(key))
+        if val is None:
+            entries.append(ENTRY_HEADER.pack(TRACK_IDS.index(key), NONE_LEN))
+            continue
+        if len(val) >= NONE_LEN or any(not state in (0, 1) for state in val):
+            raise ValueError("encodeMsg(): the state list is not a bits list: %s" %str(val))
+        entries.append(ENTRY_HEADER.pack(TRACK_IDS.index(key), len(val)))
+        entries.append(packBits(val))
+    entriesCount = len(dataDict) - (1 if 'result' in dataDict.keys() else 0)
+    if entriesCount > 0xFF:
+        raise ValueError("encodeMsg(): too many entries.")
+    return (result, entriesCount, b''.join(entries))
+
+def _encodeBatch(msgType, dataDict):
+    """ Encode the batch message's sub messages."""
+    subMsgs = []
+    for (reqKey, reqType, subDict) in dataDict['batch']:
+        if reqType == 'batch': raise ValueError("encodeMsg(): nested batch message.")
+        subMsg = encodeMsg(reqKey, reqType, subDict)
+        subMsgs.append(BATCH_HEADER.pack(len(subMsg)))
+        subMsgs.append(subMsg)
+    if len(dataDict['batch']) > 0xFF:
+        raise ValueError("encodeMsg(): too many batch entries.")
+    return MSG_HEADER.pack(msgType, 1, len(dataDict['batch'])) + b''.join(subMsgs)
+
+#-----------------------------------------------------------------------------
+def decodeMsg(msg):
+    """ Decode the binary message.
+        Args:
+            msg (bytes): binary message.
+        Raises:
+            ValueError: the message is truncated or has an unknown type/track ID.
+        Returns:
+            tuple: (reqKey, reqType, dataDict), the POST request's state will be
+                decoded to bool and the others will be decoded to int.
+    """
+    _checkSize(msg, 0, MSG_HEADER.size)
+    msgType, result, entriesCount = MSG_HEADER.unpack_from(msg)
+    reqKey = _getItem(REQ_KEYS, (msgType >> 4) & 0x07, 'message key')
+    reqType = _getItem(REQ_TYPES, msgType & 0x0F, 'message type')
+    boolFlg = reqKey == 'POST'
+    dataDict = {}
+    pos = MSG_HEADER.size
+    if reqType == 'batch':
+        dataDict['batch'] = []
+        for _ in range(entriesCount):
+            _checkSize(msg, pos, BATCH_HEADER.size)
+            (subLen,) = BATCH_HEADER.unpack_from(msg, pos)
+            pos += BATCH_HEADER.size
+            _checkSize(msg, pos, subLen)
+            subMsg = msg[pos:pos+subLen]
+            if not isBinMsg(subMsg) or subMsg[0] & 0x0F == REQ_TYPES.index('batch'):
+                raise ValueError("decodeMsg(): invalid batch sub message.")
+            dataDict['batch'].append(decodeMsg(subMsg))
+            pos += subLen
+        return (reqKey, reqType, dataDict)
+    pushFlg = bool(result & PUSH_FLG)
+    if pushFlg:
+        _checkSize(msg, pos, PUSH_SEQ.size)
+        (seq,) = PUSH_SEQ.unpack_from(msg, pos)
+        pos += PUSH_SEQ.size
+    for _ in range(entriesCount):
+        _checkSize(msg, pos, ENTRY_HEADER.size)
+        trackIdx, bitsCount = ENTRY_HEADER.unpack_from(msg, pos)
+        pos += ENTRY_HEADER.size
+        trackID = _getItem(TRACK_IDS, trackIdx, 'track ID')
+        if bitsCount == NONE_LEN:
+            dataDict[trackID] = None
+            continue
+        bytesCount = (bitsCount + 7) // 8
+        _checkSize(msg, pos, bytesCount)
+        dataDict[trackID] = unpackBits(msg[pos:pos+bytesCount], bitsCount, boolFlg=boolFlg)
+        pos += bytesCount
+    if pushFlg:
+        return (reqKey, reqType, {'seq': seq, 'keyframe': bool(result & KEYFRAME_FLG), 'data': dataDict})
+    if reqKey == 'REP' and (entriesCount == 0 or not result):
+        dataDict['result'] = 'success' if result else 'failed'
+    return (reqKey, reqType, dataDict)
+
+def _checkSize(msg, pos, size):
+    """ Raise ValueError if the message doesn't have <size> bytes from <pos>."""
+    if len(msg) < pos + size:
+        raise ValueError("decodeMsg(): message truncated at byte %s." %str(len(msg)))
+
+def _getItem(items, idx, name):
+    """ Return the items[idx], raise ValueError if the index is out of range."""
+    if idx >= len(items):
+        raise ValueError("decodeMsg(): unknown %s index %s." %(name, str(idx)))
+    return items[idx]
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase():
+    """ Encode/decode test."""
+    testData = [
+        ('GET', 'sensors', {'weline': None, 'nsline': None, 'ccline': None}),
+        ('REP', 'sensors', {'weline': [0, 1, 1, 0, 0, 0, 0, 0, 1], 'nsline': [], 'ccline': [1]*8}),
+        ('POST', 'signals', {'weline': [True, False, True], 'config': [True]}),
+        ('REP', 'signals', {'result': 'success'}),
+        ('REP', 'trains', {'result': 'failed'}),
+        ('POST', 'batch', {'batch': [('POST', 'signals', {'weline': [True]}), ('GET', 'sensors', {'weline': None})]}),
+        ('REP', 'batch', {'batch': [('REP', 'signals', {'result': 'success'}), ('REP', 'sensors', {'weline': [1, 0]})]}),
+        ('PUB', 'sensors', {'seq': 12, 'keyframe': False, 'data': {'weline': [0, 1, 1], 'nsline': [1]}}),
+        ('REP', 'trains', {'seq': 1, 'keyframe': True, 'data': {'ccline': [1, 0] * 9}})
+    ]
+    for reqKey, reqType, dataDict in testData:
+        msg = encodeMsg(reqKey, reqType, dataDict)
+        rst = decodeMsg(msg)
+        assert rst == (reqKey, reqType, dataDict) and isBinMsg(msg)
+        print(" - %s %s test passed: True" %(reqKey, reqType))
+    try:
+        encodeMsg('REP', 'trains', {'weline': [0, 78, 100]})
+        assert False, "the not bits list is encoded."
+    except ValueError:
+        print(" - Not bits list test passed: True")
+    # malformed messages: truncated header/entry/bits/batch, unknown type/key/track.
+    goodMsg = encodeMsg('REP', 'sensors', {'weline': [1] * 20})
+    batchMsg = encodeMsg('POST', 'batch', {'batch': [('GET', 'sensors', {'weline': None})]})
+    badMsgs = [goodMsg[:2], goodMsg[:4], goodMsg[:-1], batchMsg[:-2],
+               bytes([BIN_FLG | 0x0F, 1, 0]), bytes([BIN_FLG | 0x70, 1, 0]),
+               bytes([BIN_FLG | 0x21, 1, 1, len(TRACK_IDS), 0, 1, 1]),
+               encodeMsg('PUB', 'sensors', {'seq': 1, 'keyframe': True, 'data': {}})[:5],
+               bytes([BIN_FLG | 0x15, 1, 1, 0, 3]) + bytes([BIN_FLG | 0x15, 1, 0])]
+    for i, msg in enumerate(badMsgs):
+        try:
+            decodeMsg(msg)
+            assert False, "malformed message %s is decoded." %str(i)
+        except ValueError:
+            pass
+    print(" - Malformed message test passed: True")
+
+if __name__ == "__main__":
+    testCase()
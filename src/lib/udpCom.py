@@ -22,30 +22,488 @@
             function return value, the value will be send back to the client side.
 
     If the message/data size is bigger than the MAX/pre-configured UDP socket buffer 
-    size, it will be split to several chunks, each chunk will be buffer size - 1 bytes.
+    size, it will be split to several chunks, each chunk will be buffer size - 8 bytes.
     Then the chunk will be send to destination under splitted sequence. The data transfer 
     will follow below steps:
-        1. Send b'BM;Send;<messageSize>' to the server side.
-        2. Send every thrunk in a loop.
-        3. Send b'BM;Sent;Finish' to identify finished and trigger the response.
-    The server's reply Big message will follow step 1 & 2.
+        1. Send b'BM;Send;<messageSize>;<transferID>;<chunkSize>' to the server side.
+        2. Send every thrunk in a loop, each chunk starts with a 8 bytes header 
+            (transferID, chunk sequence number).
+        3. Send b'BM;Sent;Finish;<transferID>' to identify finished and trigger the response.
+    The server's reply Big message follows the same 3 steps.
+    Lost chunks recovery (selective repeat): if some chunks are missing when the finish
+    flag arrives (or no chunk arrives in NACK_WAIT sec as fallback if the finish flag
+    is lost), the receiver sends b'BM;Nack;<transferID>;<idx0>,<idx1>...' and the 
+    sender only resends the missing chunks followed by the finish flag again. After 
+    NACK_RETRY times the receiver will give up the transfer and send 
+    b'BM;Fail;<transferID>' back (to the finish flag). The sender which doesn't wait 
+    for a response sends b'BM;Sent;Finish;<transferID>;Ack', the receiver confirms the
+    complete transfer with b'BM;Ack;<transferID>' so the sender returns at once (the 
+    sender only waits the full NACK_WAIT sec if the receiver doesn't support the Ack).
+    The receiver keeps a reassembly table keyed by (sender address, transferID), every 
+    chunk is placed in a preallocated buffer by its sequence number, so several senders
+    can transfer big messages at the same time and the chunks can arrive out of order.
+    The old 3 fields header b'BM;Send;<messageSize>' (chunks without header, received 
+    in sequence) is still accepted.
+    Chunk size probe: the client sends b'BM;Probe;<probeSize>;<bufferSize>;<codecs>;' 
+    datagrams padded to several probe sizes, the receiver replies 
+    b'BM;ProbeAck;<probeSize>;<receivedSize>;<codecs>' for each probe, the client uses 
+    the biggest fully received size as the chunk datagram size and the server uses the
+    biggest received probe (limited by the client's buffer size) for its reply chunks.
+    Compression: if the peer advertises the codec 'z' in the probe, the big message 
+    bigger than the compress threshold is zlib compressed, the header adds the 6th
+    codec field: b'BM;Send;<compressedSize>;<transferID>;<chunkSize>;z'.
+    Zero-copy: the chunks are memoryview slices of the message sent together with their
+    header by sendmsg() scatter-gather (joined only if sendmsg() is not available, such
+    as Windows), the chunks are received by recvfrom_into() a reusable buffer and copied
+    once into the transfer's preallocated buffer.
 
     Usage: 
     - server: the server side will have a loop to keep fetching data from the buffer,
             so it will good to package it in a threading class running parallel with 
             your main program thread.(As shown in the <udpComTest.py>)
+    - worker pool: udpServer(None, port, workerNum=N) runs the handler in N worker 
+            threads, the receive loop keeps draining the socket and puts the request 
+            in the worker queue selected by the client address hash (replies to one
+            client are in order), getStats() shows the queue depth and drop count.
+    - async server: udpAsyncServer has the same handler contract as udpServer, but it 
+            is driven by an asyncio event loop, the big message chunks are buffered per 
+            client address and the handler is executed in a thread pool, so one slow 
+            client or handler will not block the other clients.
     - client: client = udpClient((<ip address>, <port>))
+    - server push: serverStart(handler, withAddr=True) passes the client address to 
+            the handler, then pushMsg(msg, address) can send message to the client 
+            without request from any thread.
+    - pipeline client: udpPipeClient keeps several requests in flight, each request is
+            sent with a request ID header b'\x00ID<uint32 requestID>' and the server puts
+            the same header in front of the reply (or the big message reply's 'BM;Send'
+            header), a receiver thread matches the replies to the requests' futures.
 """
 
 import time
+import random
 import socket
+import zlib
+import struct
+import asyncio
+import queue
+import itertools
+import threading
 from math import ceil
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 
 BUFFER_SZ = 4096        # Default socket buffer size. Set to value smaller than MTU will increase small message transfer throughput.
 BUFFER_SZ_MAX = 65507   # UDP maximum buffer size.
 RESP_TIME = 0.01
 BIG_MSG_FLG = 'BM'      # Flag to identify big size message.      
 CODE_FMT = 'utf-8'      # default str <-> bytes encode/decode format.
+CHUNK_HEADER = struct.Struct('!II') # big message chunk header: transferID, chunk sequence number.
+TRANSFER_TO = 30        # Unfinished big message transfer will be removed after 30 sec.
+NACK_WAIT = 0.5         # Wait time(sec) for the next chunk before asking the missing chunks again.
+NACK_RETRY = 3          # Max number of NACK of one big message transfer.
+NACK_MAX_IDX = 256      # Max number of missing chunks' index in one NACK message.
+SEND_CACHE_SZ = 64      # Number of sent big messages kept for the chunks resend.
+RID_FLG = b'\x00ID'     # Flag to identify the request ID header.
+RID_HEADER = struct.Struct('!3sI')  # request ID header: RID_FLG, requestID.
+MAX_INFLIGHT = 16       # Default max number of the pipeline client's outstanding requests.
+PROBE_SIZES = (65507, 32768, 16384, 8972, 8192, 4096, 1472, 1024, 512)  # chunk size probe datagram sizes.
+PEER_CACHE_SZ = 256     # Number of the clients' probe result kept by the server.
+CODEC_ZLIB = 'z'        # big message zlib compression codec flag.
+COMPRESS_SZ = 1024      # Default compress the big message bigger than 1KB if the peer supports.
+WORKER_QUEUE_SZ = 64    # Default max number of the waiting requests of one handler worker.
+WORKER_STOP_TO = 5      # Max wait time(sec) for the handler workers to finish when the server stops.
+
+# Define all the module local untility functions here:
+#-----------------------------------------------------------------------------
+def newTransferID():
+    """ Create a random big message transfer ID, the highest bit is always set so 
+        the first byte of a chunk will never be a printable char of a normal message.
+    """
+    return random.getrandbits(31) | 0x80000000
+
+def buildChunkParts(message, transferID, chunkSize):
+    """ Split the message to chunks without copying the message data.
+        Returns:
+            list(tuple): the chunks list, each chunk is (chunk header bytes, memoryview
+                of the message slice).
+    """
+    if not isinstance(message, (bytes, bytearray)): message = str(message).encode(CODE_FMT)
+    view = memoryview(message)
+    return [(CHUNK_HEADER.pack(transferID, seq), view[i:i+chunkSize])
+            for seq, i in enumerate(range(0, len(message), chunkSize))]
+
+def buildChunks(message, transferID, chunkSize):
+    """ Split the message to chunks with the chunk header.
+        Returns:
+            list(bytes): the chunks list.
+    """
+    return [b''.join(parts) for parts in buildChunkParts(message, transferID, chunkSize)]
+
+def sendParts(sock, parts, address):
+    """ Send the datagram parts (chunk header + payload view) by scatter-gather 
+        sendmsg(), join the parts if the socket doesn't support sendmsg().
+    """
+    if hasattr(sock, 'sendmsg'): return sock.sendmsg(parts, (), 0, address)
+    return sock.sendto(b''.join(parts), address)
+
+def recvView(sock, recvBuf, bufferSize):
+    """ Receive a datagram into the reusable buffer.
+        Returns:
+            tuple: (memoryview of the received data, sender address), the view is only
+                valid before the next receive.
+    """
+    nbytes, address = sock.recvfrom_into(recvBuf, bufferSize)
+    return (memoryview(recvBuf)[:nbytes], address)
+
+def isReusePortSupported():
+    """ Check whether the OS supports SO_REUSEPORT (several sockets/processes bind
+        the same UDP port and the kernel distributes the datagrams), not on Windows.
+    """
+    return hasattr(socket, 'SO_REUSEPORT')
+
+def isChunkView(view):
+    """ Check whether the received data may be a chunk with header (the transferID's
+        highest bit is set).
+    """
+    return len(view) >= CHUNK_HEADER.size and bool(view[0] & 0x80)
+
+def buildBigMsgHeader(messageSZ, transferID, chunkSize, codec=None):
+    """ Build the big message header: b'BM;Send;<messageSize>;<transferID>;<chunkSize>[;<codec>]'"""
+    fields = [BIG_MSG_FLG, 'Send', str(messageSZ), str(transferID), str(chunkSize)]
+    if codec: fields.append(codec)
+    return ';'.join(fields).encode(CODE_FMT)
+
+def parseBigMsgHeader(data):
+    """ Parse the big message header. 
+        Args:
+            data (bytes): b'BM;Send;<messageSize>;<transferID>;<chunkSize>[;<codec>]' 
+                or the old format b'BM;Send;<messageSize>'
+        Returns:
+            tuple: (messageSize, transferID, chunkSize, codec), transferID and chunkSize
+                will be None if the header is the old format, codec is None if the 
+                message is not compressed.
+    """
+    fields = data.decode(CODE_FMT).split(';')
+    if len(fields) >= 5: 
+        codec = fields[5] if len(fields) > 5 and fields[5] else None
+        return (int(fields[2]), int(fields[3]), int(fields[4]), codec)
+    return (int(fields[2]), None, None, None)
+
+def compressMsg(message, codecs, compressSize):
+    """ Compress the message if the peer supports the zlib codec and the message is 
+        bigger than the compressSize.
+        Returns:
+            tuple: (message bytes to send, codec), codec is None if not compressed.
+    """
+    if compressSize is None or len(message) < compressSize or not CODEC_ZLIB in codecs:
+        return (message, None)
+    compressed = zlib.compress(message)
+    if len(compressed) >= len(message): return (message, None)
+    return (compressed, CODEC_ZLIB)
+
+def buildProbeMsg(probeSize, bufferSize, codecs=(CODEC_ZLIB,)):
+    """ Build the chunk size probe datagram padded to the probeSize."""
+    header = ';'.join((BIG_MSG_FLG, 'Probe', str(probeSize), str(bufferSize), ','.join(codecs), '')).encode(CODE_FMT)
+    return header + bytes(max(0, probeSize - len(header)))
+
+def parseProbeAck(data):
+    """ Parse b'BM;ProbeAck;<probeSize>;<receivedSize>;<codecs>'.
+        Returns:
+            tuple: (probeSize, receivedSize, codecs list)
+    """
+    fields = data.decode(CODE_FMT).split(';')
+    return (int(fields[2]), int(fields[3]), [c for c in fields[4].split(',') if c])
+
+def addReqID(msg, reqID):
+    """ Put the request ID header in front of the message if the reqID is not None."""
+    if reqID is None: return msg
+    return RID_HEADER.pack(RID_FLG, reqID) + msg
+
+def splitReqID(data):
+    """ Split the request ID header from the data.
+        Returns:
+            tuple: (requestID, data without header), requestID is None if the data 
+                doesn't have the request ID header.
+    """
+    if data.startswith(RID_FLG) and len(data) >= RID_HEADER.size:
+        _, reqID = RID_HEADER.unpack_from(data)
+        return (reqID, data[RID_HEADER.size:])
+    return (None, data)
+
+def buildNackMsg(transferID, missingList):
+    """ Build the missing chunks resend request: b'BM;Nack;<transferID>;<idx0>,<idx1>...'"""
+    idxStr = ','.join([str(idx) for idx in missingList[:NACK_MAX_IDX]])
+    return ';'.join((BIG_MSG_FLG, 'Nack', str(transferID), idxStr)).encode(CODE_FMT)
+
+def buildFinishMsg(transferID, ack=False):
+    """ Build the big message finish flag: b'BM;Sent;Finish;<transferID>[;Ack]', the
+        'Ack' field asks the receiver to confirm the complete transfer.
+    """
+    fields = [BIG_MSG_FLG, 'Sent', 'Finish', str(transferID)]
+    if ack: fields.append('Ack')
+    return ';'.join(fields).encode(CODE_FMT)
+
+def parseFinishMsg(data):
+    """ Parse the big message finish flag.
+        Returns:
+            tuple: (transferID, ack flag), transferID is None if the finish flag is 
+                the old format.
+    """
+    fields = bytes(data).decode(CODE_FMT).split(';')
+    transferID = int(fields[3]) if len(fields) > 3 else None
+    return (transferID, len(fields) > 4 and fields[4] == 'Ack')
+
+def parseNackMsg(data):
+    """ Parse the NACK message.
+        Returns:
+            tuple: (transferID, list of missing chunks' index)
+    """
+    _, _, transferID, idxStr = data.decode(CODE_FMT).split(';', 3)
+    return (int(transferID), [int(idx) for idx in idxStr.split(',') if idx])
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class bigMsgAssembler(object):
+    """ Big message reassembly table, each transfer is keyed by (sender address, 
+        transferID), the chunks are placed into a preallocated bytearray based on 
+        their sequence number, so the chunks of different senders/transfers will not
+        mix together and the chunks can arrive out of order.
+    """
+    def __init__(self, timeout=TRANSFER_TO):
+        self.timeout = timeout
+        self.transfers = {}     # key: (address, transferID), val: transfer record dict.
+        self.addrTransfers = {} # key: address, val: the address's opened transferID set.
+
+#--bigMsgAssembler-------------------------------------------------------------
+    def openTransfer(self, address, messageSZ, transferID=None, chunkSize=None, codec=None):
+        """ Add a new transfer in the table, transferID None means the old format 
+            transfer which chunks have no header and received in sequence, codec is 
+            the message compression codec.
+        """
+        self.cleanExpired()
+        key = (address, transferID)
+        chunkCount = ceil(messageSZ/chunkSize) if chunkSize else 0
+        self.transfers[key] = {
+            'size': messageSZ,
+            'chunkSize': chunkSize,
+            'buffer': bytearray(messageSZ),
+            'received': bytearray(chunkCount),  # received flag of each chunk.
+            'count': chunkCount,
+            'recvCount': 0,
+            'recvBytes': 0,
+            'nackCount': 0,
+            'codec': codec,
+            'time': time.time()
+        }
+        self.addrTransfers.setdefault(address, set()).add(transferID)
+        return key
+
+#--bigMsgAssembler-------------------------------------------------------------
+    def addChunk(self, address, data):
+        """ Place the data in its transfer buffer.
+            Returns:
+                key (tuple): the transfer key if the data is a chunk of a opened 
+                    transfer, else None.
+        """
+        tidSet = self.addrTransfers.get(address)
+        if not tidSet: return None
+        if len(data) >= CHUNK_HEADER.size:
+            transferID, seq = CHUNK_HEADER.unpack_from(data)
+            if transferID in tidSet:
+                key = (address, transferID)
+                record = self.transfers[key]
+                if seq < record['count'] and not record['received'][seq]:
+                    start = seq * record['chunkSize']
+                    payload = data[CHUNK_HEADER.size:CHUNK_HEADER.size + record['size']-start]
+                    record['buffer'][start:start+len(payload)] = payload
+                    record['received'][seq] = 1
+                    record['recvCount'] += 1
+                return key
+        if None in tidSet:
+            # old format transfer, append the data in sequence.
+            key = (address, None)
+            record = self.transfers[key]
+            start = record['recvBytes']
+            payload = data[:record['size']-start]
+            record['buffer'][start:start+len(payload)] = payload
+            record['recvBytes'] += len(payload)
+            return key
+        return None
+
+#--bigMsgAssembler-------------------------------------------------------------
+    def isComplete(self, key):
+        record = self.transfers.get(key)
+        if record is None: return False
+        return self._isRecordComplete(key, record)
+
+    def _isRecordComplete(self, key, record):
+        if key[1] is None: return record['recvBytes'] >= record['size']
+        return record['recvCount'] >= record['count']
+
+#--bigMsgAssembler-------------------------------------------------------------
+    def getMissing(self, key):
+        """ Return the list of the missing chunks' sequence number of the transfer."""
+        record = self.transfers.get(key)
+        if record is None or key[1] is None: return []
+        return [seq for seq, flg in enumerate(record['received']) if not flg]
+
+#--bigMsgAssembler-------------------------------------------------------------
+    def nackMissing(self, key):
+        """ Build the NACK message of the transfer's missing chunks.
+            Returns:
+                bytes: NACK message, None if the transfer is not exist, complete or 
+                    the NACK retry budget is used up.
+        """
+        missingList = self.getMissing(key)
+        if not missingList: return None
+        record = self.transfers[key]
+        if record['nackCount'] >= NACK_RETRY: return None
+        record['nackCount'] += 1
+        record['time'] = time.time()
+        return buildNackMsg(key[1], missingList)
+
+#--bigMsgAssembler-------------------------------------------------------------
+    def popMessage(self, key):
+        """ Remove the transfer from the table and return the assembled message."""
+        record = self.transfers.pop(key, None)
+        if record is None: return None
+        address, transferID = key
+        tidSet = self.addrTransfers.get(address)
+        if tidSet is not None:
+            tidSet.discard(transferID)
+            if not tidSet: self.addrTransfers.pop(address)
+        if not self._isRecordComplete(key, record):
+            print("bigMsgAssembler: Data transfer error, some data missing.")
+        if record['codec'] == CODEC_ZLIB:
+            try:
+                return zlib.decompress(record['buffer'])
+            except zlib.error as err:
+                print("bigMsgAssembler: decompress error: %s" %str(err))
+                return None
+        return bytes(record['buffer'])
+
+#--bigMsgAssembler-------------------------------------------------------------
+    def handleDatagram(self, data, address):
+        """ Handle the big message transfer datagram (header, chunk or finish flag).
+            Returns:
+                (bool, bytes, bytes): (flag to identify whether the data is a big message 
+                    datagram, the assembled message if the transfer is finished, the 
+                    control message(NACK/Fail/Ack) needs to send back to the sender.)
+        """
+        if data.startswith(b'BM;Send'):
+            try:
+                messageSZ, transferID, chunkSize, codec = parseBigMsgHeader(data)
+                self.openTransfer(address, messageSZ, transferID=transferID,
+                                  chunkSize=chunkSize, codec=codec)
+            except Exception as err:
+                print("Invalid big message header: %s" %str(err))
+            return (True, None, None)
+        if data.startswith(b'BM;Sent;Finish'):
+            transferID, ack = parseFinishMsg(data)
+            key = (address, transferID)
+            if transferID is None or self.isComplete(key):
+                ackMsg = ';'.join((BIG_MSG_FLG, 'Ack', str(transferID))).encode(CODE_FMT) if ack else None
+                return (True, self.popMessage(key), ackMsg)
+            if not key in self.transfers.keys(): return (True, None, None)
+            # ask the sender to resend the missing chunks.
+            nackMsg = self.nackMissing(key)
+            if nackMsg: return (True, None, nackMsg)
+            self.popMessage(key)
+            return (True, None, ';'.join((BIG_MSG_FLG, 'Fail', str(transferID))).encode(CODE_FMT))
+        if self.addChunk(address, data): return (True, None, None)
+        return (False, None, None)
+
+#--bigMsgAssembler-------------------------------------------------------------
+    def cleanExpired(self):
+        """ Remove the unfinished transfers which are time out."""
+        crtTime = time.time()
+        for key in [k for k, v in self.transfers.items() if crtTime - v['time'] > self.timeout]:
+            print("bigMsgAssembler: Transfer %s time out, removed." %str(key))
+            self.popMessage(key)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class bigMsgSendCache(object):
+    """ Cache of the recent sent big messages' chunks, used to resend the chunks 
+        which are requested by the receiver's NACK.
+    """
+    def __init__(self, cacheSize=SEND_CACHE_SZ):
+        self.cacheSize = cacheSize
+        self.chunksDict = OrderedDict() # key: (address, transferID), val: chunks list.
+        self.lock = threading.Lock()    # the server's handler workers may add in parallel.
+
+    def addTransfer(self, address, transferID, chunks):
+        """ Cache the transfer's chunks (list of the chunk parts tuple)."""
+        with self.lock:
+            self.chunksDict[(address, transferID)] = chunks
+            while len(self.chunksDict) > self.cacheSize:
+                self.chunksDict.popitem(last=False)
+
+    def getChunks(self, address, nackMsg):
+        """ Return the chunks (parts tuples) requested by the NACK message."""
+        try:
+            transferID, missingList = parseNackMsg(nackMsg)
+        except Exception as err:
+            print("Invalid NACK message: %s" %str(err))
+            return []
+        with self.lock:
+            chunks = self.chunksDict.get((address, transferID))
+        if chunks is None: return []
+        return [chunks[idx] for idx in missingList if idx < len(chunks)]
+
+    def getFinishMsg(self, address, nackMsg):
+        """ Return the finish flag sent after the resent chunks, None if the NACK is 
+            invalid or the transfer is not in the cache.
+        """
+        try:
+            transferID, _ = parseNackMsg(nackMsg)
+        except Exception:
+            return None
+        with self.lock:
+            if not (address, transferID) in self.chunksDict: return None
+        return buildFinishMsg(transferID)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class peerTable(object):
+    """ Server side table of the clients' chunk size probe result, key: client 
+        address, val: {'chunkSize': reply chunk size, 'codecs': supported codecs}.
+    """
+    def __init__(self, cacheSize=PEER_CACHE_SZ):
+        self.cacheSize = cacheSize
+        self.peerDict = OrderedDict()
+
+    def handleProbe(self, data, address, recvSize):
+        """ Record the probe result and build the probe ack message.
+            Args:
+                data (bytes): probe message (may be truncated by the receive buffer).
+                recvSize (int): received datagram size.
+            Returns:
+                bytes: ack message.
+        """
+        try:
+            _, _, probeSize, bufferSize, codecStr, _ = data[:128].decode(CODE_FMT, 'ignore').split(';', 5)
+            probeSize, bufferSize = int(probeSize), int(bufferSize)
+        except Exception as err:
+            print("Invalid probe message: %s" %str(err))
+            return None
+        record = self.peerDict.setdefault(address, {'chunkSize': 0, 'codecs': []})
+        self.peerDict.move_to_end(address)
+        record['codecs'] = [c for c in codecStr.split(',') if c]
+        if recvSize == probeSize:
+            chunkSize = min(probeSize, bufferSize) - CHUNK_HEADER.size
+            record['chunkSize'] = max(record['chunkSize'], chunkSize)
+        while len(self.peerDict) > self.cacheSize:
+            self.peerDict.popitem(last=False)
+        return ';'.join((BIG_MSG_FLG, 'ProbeAck', str(probeSize), str(recvSize), CODEC_ZLIB)).encode(CODE_FMT)
+
+    def getChunkSize(self, address, default):
+        record = self.peerDict.get(address)
+        return record['chunkSize'] if record and record['chunkSize'] > 0 else default
+
+    def getCodecs(self, address):
+        record = self.peerDict.get(address)
+        return record['codecs'] if record else []
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -60,27 +518,54 @@ class udpClient(object):
         self.ipAddr = ipAddr
         self.bufferSize = BUFFER_SZ
         self.chunkSize = max(1, self.bufferSize - 8) # make the chunk size 1 byte smaller than the bugger to send big message.
+        self.peerCodecs = []  # codecs supported by the server (got by the probe).
+        self.compressSize = COMPRESS_SZ
         self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.recvBuf = bytearray(BUFFER_SZ_MAX) # reusable buffer to receive the chunks.
         self.setTimeOut()
 
 #--udpClient-------------------------------------------------------------------
-    def receiveChunk(self, messageSZ):
+    def receiveChunk(self, messageSZ, transferID=None, chunkSize=None, codec=None):
         """ recieve the chunks based on the data type
             Args:
                 messageSZ (int): the whole message size
+                transferID (int): big message transfer ID, None for old format transfer.
+                chunkSize (int): sender's chunk size.
+                codec (str): message compression codec.
             Returns:
                 bytes: the whole data chunks.
         """
-        receiveCount = ceil(messageSZ*1.0/self.chunkSize) # after python3 no need to *1.0
-        data = b''
+        assembler = bigMsgAssembler()
+        key = assembler.openTransfer(self.ipAddr, messageSZ, transferID=transferID, 
+                                     chunkSize=chunkSize, codec=codec)
+        timeout = self.client.gettimeout()
+        # Only wait NACK_WAIT sec for the next chunk if the sender support the resend.
+        if not transferID is None: self.client.settimeout(NACK_WAIT)
         try:
-            for _ in range(receiveCount):
-                subData, _ = self.client.recvfrom(self.bufferSize)
-                data += subData
+            while not assembler.isComplete(key):
+                try:
+                    subData, _ = recvView(self.client, self.recvBuf, self.bufferSize)
+                except socket.timeout as err:
+                    nackMsg = assembler.nackMissing(key)
+                    if nackMsg is None: raise err
+                    self.client.sendto(nackMsg, self.ipAddr)
+                    continue
+                if subData[:14] == b'BM;Sent;Finish':
+                    # ask the missing chunks as soon as the sender finished sending.
+                    if parseFinishMsg(subData)[0] == transferID:
+                        nackMsg = assembler.nackMissing(key)
+                        if nackMsg: self.client.sendto(nackMsg, self.ipAddr)
+                    continue
+                # chunks from other transfer(late reply) will be ignored.
+                assembler.addChunk(self.ipAddr, subData)
         except Exception as err:
             print("udpClient;receiveChunk(): Data transfer error, some data missing.")
             print("Error: %s" %str(err))
-        return data
+            assembler.popMessage(key)
+            return None
+        finally:
+            self.client.settimeout(timeout)
+        return assembler.popMessage(key)
 
 #--udpClient-------------------------------------------------------------------
     def sendMsg(self, msg, resp=False, ipAddr=None):
@@ -96,9 +581,14 @@ class udpClient(object):
         if resp:
             try:
                 data, _ = self.client.recvfrom(self.bufferSize)
-                if b'BM;Send' in data:
-                    _, _, messageSZ = data.decode(CODE_FMT).split(';') 
-                    data = self.receiveChunk(int(messageSZ))
+                # ignore the late control message and finish flag of the previous big message.
+                while data.startswith((b'BM;Ack', b'BM;Sent;Finish')) or \
+                        (data.startswith(b'BM;Nack') and not msg.startswith(b'BM;Sent')):
+                    data, _ = self.client.recvfrom(self.bufferSize)
+                if data.startswith(b'BM;Send'):
+                    messageSZ, transferID, chunkSize, codec = parseBigMsgHeader(data)
+                    data = self.receiveChunk(messageSZ, transferID=transferID, 
+                                             chunkSize=chunkSize, codec=codec)
                 return data
             except Exception as error:
                 print("udpClient;sendMsg(): Can not connect to the server!")
@@ -114,21 +604,121 @@ class udpClient(object):
                 message (str/bytes): _description_
                 resp (bool, optional): _description_. Defaults to False.
             Returns:
-                _type_: server's response.
+                _type_: server's response. If <resp> is False, the client waits for 
+                    the server's Ack (or NACK to resend the lost chunks) after the finish 
+                    flag, returns True if the server doesn't report the data missing in 
+                    NACK_WAIT sec, None if the transfer failed.
         """
+        if not isinstance(message, bytes): message = str(message).encode(CODE_FMT)
+        message, codec = compressMsg(message, self.peerCodecs, self.compressSize)
         messageSZ = len(message)
-        sendCount = ceil(messageSZ/self.chunkSize)
-        # Step 1: tell server side the whole message size: BM;Send;<dataSize>
-        msg = ';'.join((BIG_MSG_FLG, 'Send', str(messageSZ))) 
-        reply = self.sendMsg(msg, resp=False)
+        transferID = newTransferID()
+        # Step 1: tell server side the whole message size: BM;Send;<dataSize>;<transferID>;<chunkSize>[;<codec>]
+        self.sendMsg(buildBigMsgHeader(messageSZ, transferID, self.chunkSize, codec), resp=False)
         # ready to receive big size message.
-        messageChunks = [ message[i:i+self.chunkSize] for i in range(0, messageSZ, self.chunkSize) ]
-        for data in messageChunks:
-            self.sendMsg(data, resp=False)
-            # finished send all the message.
-        msg = ';'.join((BIG_MSG_FLG, 'Sent', 'Finish'))
+        chunks = buildChunkParts(message, transferID, self.chunkSize)
+        for parts in chunks:
+            sendParts(self.client, parts, self.ipAddr)
+        # finished send all the message.
+        msg = buildFinishMsg(transferID, ack=not resp)
+        reply = self._sendFinish(msg, transferID, resp)
+        # resend the missing chunks if the server reply NACK.
+        for _ in range(NACK_RETRY):
+            if reply is None or not reply.startswith(b'BM;Nack'): break
+            try:
+                _, missingList = parseNackMsg(reply)
+            except Exception as err:
+                print("udpClient;sendChunk(): Invalid NACK message: %s" %str(err))
+                return None
+            for idx in missingList:
+                if idx < len(chunks): sendParts(self.client, chunks[idx], self.ipAddr)
+            reply = self._sendFinish(msg, transferID, resp)
+        if reply and (reply.startswith(b'BM;Fail') or reply.startswith(b'BM;Nack')):
+            print("udpClient;sendChunk(): Server failed to receive the message.")
+            return None
+        return reply if resp else True
+
+    def _sendFinish(self, msg, transferID, resp):
+        """ Send the big message finish flag, return the server's response or the 
+            Ack/NACK/Fail control message if no response is expected.
+        """
         reply = self.sendMsg(msg, resp=resp)
-        return reply
+        return reply if resp else self._recvCtrlMsg(transferID)
+
+    def _recvCtrlMsg(self, transferID, timeout=NACK_WAIT):
+        """ Wait for the server's Ack/NACK/Fail message of the big message transfer,
+            the other messages are left in the socket buffer.
+            Returns:
+                bytes: the control message, None if not received in <timeout> sec.
+        """
+        sockTimeout = self.client.gettimeout()
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline:
+                self.client.settimeout(max(0.001, deadline - time.monotonic()))
+                try:
+                    data, _ = self.client.recvfrom(self.bufferSize, socket.MSG_PEEK)
+                except OSError:
+                    return None # time out
+                if not data.startswith((b'BM;Ack', b'BM;Nack', b'BM;Fail', b'BM;Sent;Finish')): return None
+                self.client.recvfrom(self.bufferSize)
+                # drop the finish flag of the previous big message reply.
+                if data.startswith(b'BM;Sent;Finish'): continue
+                fields = data.split(b';')
+                # drop the late control message of the previous transfer.
+                if len(fields) > 2 and fields[2] == str(transferID).encode(CODE_FMT): return data
+        finally:
+            self.client.settimeout(sockTimeout)
+        return None
+
+#--udpClient-------------------------------------------------------------------
+    def probeChunkSize(self, probeSizes=PROBE_SIZES, timeout=NACK_WAIT):
+        """ Probe the biggest datagram size which can get through to the server (and 
+            not truncated by the server's buffer), set it as the chunk datagram size and
+            get the server's supported codecs.
+            Returns:
+                int: the new chunk size, None if the server doesn't support the probe.
+        """
+        probeSizes = [size for size in probeSizes if size <= BUFFER_SZ_MAX]
+        for size in probeSizes:
+            try:
+                self.client.sendto(buildProbeMsg(size, self.bufferSize), self.ipAddr)
+            except OSError:
+                continue    # bigger than the local interface allowed size.
+        okSizes = []
+        for ackMsg in self._recvProbeAcks(len(probeSizes), timeout):
+            try:
+                probeSize, recvSize, codecs = parseProbeAck(ackMsg)
+            except Exception as err:
+                print("udpClient: Invalid probe ack: %s" %str(err))
+                continue
+            self.peerCodecs = codecs
+            if probeSize == recvSize: okSizes.append(probeSize)
+        if not okSizes: return None
+        self.chunkSize = max(okSizes) - CHUNK_HEADER.size
+        return self.chunkSize
+
+    def _recvProbeAcks(self, count, timeout):
+        """ Receive the probe ack messages until get <count> acks or time out."""
+        acks = []
+        sockTimeout = self.client.gettimeout()
+        deadline = time.monotonic() + timeout
+        try:
+            while len(acks) < count and time.monotonic() < deadline:
+                self.client.settimeout(max(0.001, deadline - time.monotonic()))
+                try:
+                    data, _ = self.client.recvfrom(self.bufferSize)
+                except socket.timeout:
+                    break
+                if data.startswith(b'BM;ProbeAck'): acks.append(data)
+        finally:
+            self.client.settimeout(sockTimeout)
+        return acks
+
+#--udpClient-------------------------------------------------------------------
+    def setCompress(self, compressSize=COMPRESS_SZ):
+        """ Set the big message compress threshold, None: disable the compression."""
+        self.compressSize = compressSize
 
 #--udpClient-------------------------------------------------------------------
     def setBufferSize(self, bufferSize=BUFFER_SZ):
@@ -157,65 +747,413 @@ class udpClient(object):
         # server computer is fast, this is not a problem.
 
         # Call shut down before close: https://docs.python.org/3/library/socket.html#socket.socket.shutdown
-        self.client.shutdown(socket.SHUT_RDWR)
+        try:
+            self.client.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass # shutdown() fails on the not connected UDP socket (Linux).
         self.client.close()
         self.client = None
 
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class udpPipeClient(udpClient):
+    """ Pipeline UDP client module, several requests can be sent without waiting 
+        for the previous reply, each request is tagged with a request ID and a 
+        receiver thread matches the replies (also the big message replies) to the 
+        requests' futures, so the replies can arrive out of order.
+        init example: client = udpPipeClient(('127.0.0.1', 3001), maxInflight=16)
+    """
+    def __init__(self, ipAddr, maxInflight=MAX_INFLIGHT):
+        super().__init__(ipAddr) # the request timeout is set by the setTimeOut().
+        self.client.settimeout(NACK_WAIT/5) # short timeout for the receiver thread loop.
+        self.ridIter = itertools.count(1)
+        self.pending = OrderedDict()    # key: requestID, val: [future, deadline, transferID]
+        self.lock = threading.Lock()
+        self.inflight = threading.BoundedSemaphore(maxInflight)
+        self.assembler = bigMsgAssembler()
+        self.replyTransfers = {}    # key: assembler transfer key, val: [requestID, last update time]
+        self.sendCache = bigMsgSendCache()
+        self.probeAcks = queue.Queue()
+        self.terminate = False
+        self.recvThread = threading.Thread(target=self._recvLoop, daemon=True)
+        self.recvThread.start()
+
+#--udpPipeClient---------------------------------------------------------------
+    def _newReqID(self):
+        return next(self.ridIter) & 0xFFFFFFFF
+
+#--udpPipeClient---------------------------------------------------------------
+    def sendRequest(self, msg):
+        """ Send the request to the server without waiting the reply.
+            Args:
+                msg (str/bytes): request message, the message bigger than the buffer
+                    size will be sent as a big message.
+            Returns:
+                concurrent.futures.Future: the future of the server's response bytes, 
+                    it fails with TimeoutError if the in flight window is still full 
+                    after the request timeout.
+        """
+        if not isinstance(msg, bytes): msg = str(msg).encode(CODE_FMT)
+        future = Future()
+        if self.client is None:
+            future.set_exception(ConnectionError("udpPipeClient: client disconnected."))
+            return future
+        # wait for a free in flight slot, fail the request if the window stays full.
+        if not self.inflight.acquire(timeout=self.reqTimeout):
+            future.set_exception(TimeoutError("udpPipeClient: too many requests in flight."))
+            return future
+        future.add_done_callback(lambda _: self.inflight.release())
+        reqID = self._newReqID()
+        with self.lock:
+            self.pending[reqID] = [future, time.time() + self.reqTimeout, None]
+        try:
+            if len(msg) + RID_HEADER.size < self.bufferSize:
+                self.client.sendto(addReqID(msg, reqID), self.ipAddr)
+            else:
+                self._sendChunks(msg, reqID)
+        except Exception as err:
+            self._resolve(reqID, error=err)
+        return future
+
+#--udpPipeClient---------------------------------------------------------------
+    def sendRequestAsync(self, msg):
+        """ asyncio version of sendRequest(), returns an awaitable future."""
+        return asyncio.wrap_future(self.sendRequest(msg))
+
+#--udpPipeClient---------------------------------------------------------------
+    def _sendChunks(self, message, reqID):
+        """ Send the big request, the chunks are cached for the NACK resend."""
+        transferID = newTransferID()
+        with self.lock:
+            if reqID in self.pending: self.pending[reqID][2] = transferID
+        message, codec = compressMsg(message, self.peerCodecs, self.compressSize)
+        msg = buildBigMsgHeader(len(message), transferID, self.chunkSize, codec)
+        self.client.sendto(addReqID(msg, reqID), self.ipAddr)
+        chunks = buildChunkParts(message, transferID, self.chunkSize)
+        self.sendCache.addTransfer(self.ipAddr, transferID, chunks)
+        for parts in chunks:
+            sendParts(self.client, parts, self.ipAddr)
+        self.client.sendto(self._finishMsg(transferID, reqID), self.ipAddr)
+
+    def _finishMsg(self, transferID, reqID):
+        return addReqID(buildFinishMsg(transferID), reqID)
+
+#--udpPipeClient---------------------------------------------------------------
+    def _resolve(self, reqID, result=None, error=None):
+        """ Set the request's future result (or exception) and remove it from the 
+            pending table, the message without request ID (such as the server push)
+            doesn't match any request and is dropped.
+        """
+        if reqID is None: return
+        with self.lock:
+            record = self.pending.pop(reqID, None)
+        if record is None: return # late reply of the timeout request.
+        future = record[0]
+        if future.done(): return
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+#--udpPipeClient---------------------------------------------------------------
+    def _recvLoop(self):
+        """ Receiver thread: match the replies to the pending requests."""
+        while not self.terminate:
+            try:
+                view, address = recvView(self.client, self.recvBuf, self.bufferSize)
+            except socket.timeout:
+                self._checkIdle()
+                continue
+            except Exception as err:
+                if self.terminate: break
+                print("udpPipeClient: receive error: %s" %str(err))
+                time.sleep(NACK_WAIT)
+                continue
+            # place the big message reply's chunk directly from the receive buffer.
+            key = self.assembler.addChunk(address, view) if isChunkView(view) else None
+            if key is not None:
+                self._checkChunkKey(key)
+                continue
+            reqID, data = splitReqID(bytes(view))
+            if data.startswith(b'BM;ProbeAck'):
+                self.probeAcks.put(data)
+            elif data.startswith(b'BM;Nack'):
+                self._resendChunks(reqID, data)
+            elif data.startswith(b'BM;Fail'):
+                self._resolve(reqID, error=ConnectionError("Server failed to receive the message."))
+            elif data.startswith(b'BM;Sent;Finish'):
+                self._checkFinish(address, data)
+            elif data.startswith(b'BM;Send'):
+                try:
+                    messageSZ, transferID, chunkSize, codec = parseBigMsgHeader(data)
+                    key = self.assembler.openTransfer(address, messageSZ, transferID=transferID,
+                                                      chunkSize=chunkSize, codec=codec)
+                    self.replyTransfers[key] = [reqID, time.time()]
+                except Exception as err:
+                    print("udpPipeClient: Invalid big message header: %s" %str(err))
+            else:
+                key = self.assembler.addChunk(address, data)
+                if key is None:
+                    self._resolve(reqID, result=data)
+                else:
+                    self._checkChunkKey(key)
+            self._checkTimeout()
+
+    def _checkChunkKey(self, key):
+        """ Resolve the request if its big message reply transfer is complete."""
+        if self.assembler.isComplete(key):
+            reqID, _ = self.replyTransfers.pop(key, (None, None))
+            self._resolve(reqID, result=self.assembler.popMessage(key))
+        elif key in self.replyTransfers:
+            self.replyTransfers[key][1] = time.time()
+
+    def _checkFinish(self, address, data):
+        """ NACK the missing chunks as soon as the big message reply's finish flag 
+            arrives, the idle NACK in _checkIdle() is the fallback if it is lost.
+        """
+        try:
+            transferID, _ = parseFinishMsg(data)
+        except Exception as err:
+            print("udpPipeClient: Invalid finish flag: %s" %str(err))
+            return
+        record = self.replyTransfers.get((address, transferID))
+        if record is None: return # finish flag of the completed transfer.
+        nackMsg = self.assembler.nackMissing((address, transferID))
+        if nackMsg is None: return  # let _checkIdle() fail the transfer.
+        record[1] = time.time()
+        self.client.sendto(addReqID(nackMsg, record[0]), self.ipAddr)
+
+#--udpPipeClient---------------------------------------------------------------
+    def _resendChunks(self, reqID, nackMsg):
+        """ Resend the big request's chunks which the server didn't get."""
+        for parts in self.sendCache.getChunks(self.ipAddr, nackMsg):
+            sendParts(self.client, parts, self.ipAddr)
+        try:
+            transferID, _ = parseNackMsg(nackMsg)
+            self.client.sendto(self._finishMsg(transferID, reqID), self.ipAddr)
+        except Exception as err:
+            print("udpPipeClient: Invalid NACK message: %s" %str(err))
+
+#--udpPipeClient---------------------------------------------------------------
+    def _checkIdle(self):
+        """ NACK the stalled big message replies and time out the old requests."""
+        crtTime = time.time()
+        for key, record in list(self.replyTransfers.items()):
+            if crtTime - record[1] < NACK_WAIT: continue
+            nackMsg = self.assembler.nackMissing(key) if key[1] is not None else None
+            if nackMsg is None:
+                self.replyTransfers.pop(key)
+                self.assembler.popMessage(key)
+                self._resolve(record[0], error=ConnectionError("Big message reply data missing."))
+                continue
+            record[1] = crtTime
+            self.client.sendto(addReqID(nackMsg, record[0]), self.ipAddr)
+        self._checkTimeout()
+
+    def _checkTimeout(self):
+        crtTime = time.time()
+        with self.lock:
+            timeoutList = [rid for rid, record in self.pending.items() if record[1] < crtTime]
+        for reqID in timeoutList:
+            self._resolve(reqID, error=TimeoutError("udpPipeClient: request %s time out." %str(reqID)))
+
+#--udpPipeClient---------------------------------------------------------------
+    def sendMsg(self, msg, resp=False, ipAddr=None):
+        """ Same as udpClient.sendMsg(), the response is matched by request ID."""
+        if not ipAddr is None: self.ipAddr = ipAddr
+        if self.client is None: return None
+        if not resp:
+            # no one waits the reply, the reply will be ignored by the receiver thread.
+            if not isinstance(msg, bytes): msg = str(msg).encode(CODE_FMT)
+            if len(msg) + RID_HEADER.size < self.bufferSize:
+                self.client.sendto(addReqID(msg, self._newReqID()), self.ipAddr)
+            else:
+                self._sendChunks(msg, self._newReqID())
+            return None
+        future = self.sendRequest(msg)
+        try:
+            return future.result()
+        except Exception as error:
+            print("udpPipeClient;sendMsg(): Can not get the server response!")
+            print(error)
+            return None
+
+    def sendChunk(self, message, resp=False):
+        """ Same as udpClient.sendChunk(), the NACK resend is handled by the receiver 
+            thread.
+        """
+        return self.sendMsg(message, resp=resp)
+
+#--udpPipeClient---------------------------------------------------------------
+    def _recvProbeAcks(self, count, timeout):
+        """ Get the probe acks from the receiver thread."""
+        acks = []
+        deadline = time.monotonic() + timeout
+        while len(acks) < count:
+            try:
+                acks.append(self.probeAcks.get(timeout=max(0.001, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return acks
+
+#--udpPipeClient---------------------------------------------------------------
+    def setTimeOut(self, timeoutT=20):
+        """ Set the request timeout (the socket timeout is used by the receiver thread)."""
+        if isinstance(timeoutT, int) and timeoutT > 0:
+            self.reqTimeout = timeoutT
+            return True
+        print("Error: the timeoutT must be a int x > 0 ")
+        return False
+
+#--udpPipeClient---------------------------------------------------------------
+    def disconnect(self):
+        """ Stop the receiver thread, fail the pending requests and close the socket."""
+        if self.client is None: return
+        self.terminate = True
+        self.recvThread.join()
+        with self.lock:
+            reqIDs = list(self.pending.keys())
+        for reqID in reqIDs:
+            self._resolve(reqID, error=ConnectionError("udpPipeClient: client disconnected."))
+        super().disconnect()
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class udpServer(object):
     """ UDP server module."""
-    def __init__(self, parent, port):
+    def __init__(self, parent, port, reusePort=False, workerNum=0, queueSize=WORKER_QUEUE_SZ):
         """ Create an ipv4 (AF_INET) socket object using the tcp protocol (SOCK_STREAM)
             init example: server = udpServer(None, 5005)
+            Args:
+                reusePort (bool, optional): set SO_REUSEPORT so several server processes 
+                    can bind the same port. Defaults to False.
+                workerNum (int, optional): number of the handler worker threads, 0 means 
+                    call the handler in the receive loop. Defaults to 0.
+                queueSize (int, optional): max number of waiting requests of each worker,
+                    the new request will be dropped if the queue is full.
         """
         self.bufferSize = BUFFER_SZ
         self.chunkSize = max(1, self.bufferSize-8)
         self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reusePort and isReusePortSupported():
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.server.bind(('0.0.0.0', port))
+        self.recvBuf = bytearray(BUFFER_SZ_MAX) # reusable receive buffer.
+        self.assembler = bigMsgAssembler()
+        self.sendCache = bigMsgSendCache()
+        self.peers = peerTable()    # clients' chunk size probe result.
+        self.compressSize = COMPRESS_SZ
+        # handler worker threads, the requests from one client address always go to 
+        # the same worker queue, so the replies to one client are in order.
+        self.workerNum = workerNum
+        self.workerQueues = [queue.Queue(maxsize=queueSize) for _ in range(workerNum)]
+        self.workerThreads = []
+        self.statsLock = threading.Lock()
+        self.handledCount = 0
+        self.droppedCount = 0
         self.terminate = False  # Server terminate flag.
 
 #--udpServer-------------------------------------------------------------------
-    def receiveChunk(self, messageSZ):
-        """ recieve the chunks based on the data type
-            Args:
-                messageSZ (int): the whole message size
-            Returns:
-                bytes: the whole data Chunks.
-        """
-        receiveCount = ceil(messageSZ/self.chunkSize)
-        data = b''
+    def _workerLoop(self, workerQueue, handler, withAddr):
+        """ Handler worker thread: handle the queued requests and reply."""
+        while True:
+            item = workerQueue.get()
+            if item is None: break
+            data, address, reqID = item
+            try:
+                msg = handler(data, address) if withAddr else handler(data)
+                if not msg is None: self.pushMsg(msg, address, reqID=reqID)
+            except Exception as err:
+                print("udpServer: handler error: %s" %str(err))
+            with self.statsLock:
+                self.handledCount += 1
+
+    def _dispatch(self, data, address, reqID):
+        """ Put the request in the client's worker queue, drop it if the queue is full."""
+        workerQueue = self.workerQueues[hash(address) % self.workerNum]
         try:
-            for _ in range(receiveCount):
-                subData, _ = self.server.recvfrom(self.bufferSize)
-                data += subData
-        except Exception as err:
-            print("udpServer;receiveChunk(): Data transfer error, some data missing.")
-            print("Error: %s" %str(err))
-        return data
+            workerQueue.put_nowait((data, address, reqID))
+        except queue.Full:
+            with self.statsLock:
+                self.droppedCount += 1
+
+    def getStats(self):
+        """ Return the handler workers' state: {'queueDepth': [each worker queue size], 
+            'dropped': dropped requests count, 'handled': handled requests count}
+        """
+        with self.statsLock:
+            return {'queueDepth': [q.qsize() for q in self.workerQueues],
+                    'dropped': self.droppedCount,
+                    'handled': self.handledCount}
 
 #--udpServer-------------------------------------------------------------------
-    def serverStart(self, handler=None):
-        """ Start the UDP server to handle the incomming message."""
+    def serverStart(self, handler=None, withAddr=False):
+        """ Start the UDP server to handle the incomming message.
+            Args:
+                handler (function): incoming message handler function.
+                withAddr (bool, optional): flag to identify whether the client address
+                    is passed to the handler as handler(data, address). Defaults to False.
+        """
+        if handler and self.workerNum > 0:
+            self.workerThreads = [threading.Thread(target=self._workerLoop, daemon=True, 
+                                                   args=(q, handler, withAddr)) 
+                                  for q in self.workerQueues]
+            for t in self.workerThreads: t.start()
         while not self.terminate:
-            data, address = self.server.recvfrom(self.bufferSize)
+            view, address = recvView(self.server, self.recvBuf, self.bufferSize)
+            # place the big message chunk directly from the receive buffer.
+            if isChunkView(view) and self.assembler.addChunk(address, view): continue
+            reqID, data = splitReqID(bytes(view))
+            if data.startswith(b'BM;Probe;'):
+                ackMsg = self.peers.handleProbe(data, address, len(view))
+                if ackMsg: self.server.sendto(ackMsg, address)
+                continue
+            # Resend the chunks which the client didn't get.
+            if data.startswith(b'BM;Nack'):
+                for parts in self.sendCache.getChunks(address, data):
+                    sendParts(self.server, parts, address)
+                finishMsg = self.sendCache.getFinishMsg(address, data)
+                if finishMsg: self.server.sendto(addReqID(finishMsg, reqID), address)
+                continue
             # Check whether the message is a big message
-            if b'BM;Send' in data:
-                bmMsg = data.decode(CODE_FMT)
-                _, _, size = bmMsg.split(';')
-                data = self.receiveChunk(int(size))
-                subData, _ = self.server.recvfrom(self.bufferSize)
+            bigMsgFlg, bigMsg, ctrlMsg = self.assembler.handleDatagram(data, address)
+            if ctrlMsg: self.server.sendto(addReqID(ctrlMsg, reqID), address)
+            if bigMsgFlg:
+                if bigMsg is None: continue
+                data = bigMsg
             print("Accepted connection from %s" % str(address))
-            msg = handler(data) if not handler is None else data
+            if handler and self.workerThreads:
+                self._dispatch(data, address, reqID)
+                continue
+            if handler is None:
+                msg = data
+            else:
+                msg = handler(data, address) if withAddr else handler(data)
             if not msg is None:  # don't response client if the handler feed back is None
-                if not isinstance(msg, bytes): msg = str(msg).encode(CODE_FMT)
-                if len(msg) < self.bufferSize:
-                    self.server.sendto(msg, address)
-                else:
-                    self.sendChunk(msg, address)
-        # close the server.
+                self.pushMsg(msg, address, reqID=reqID)
+        # stop the workers (after they handle the queued requests) and close the server.
+        deadline = time.monotonic() + WORKER_STOP_TO
+        for workerQueue in self.workerQueues:
+            try:
+                workerQueue.put(None, timeout=max(0.001, deadline - time.monotonic()))
+            except queue.Full:
+                print("udpServer: handler worker is busy, stop request time out.")
+        for t in self.workerThreads: 
+            t.join(max(0.001, deadline - time.monotonic()))
+        self.workerThreads = []
         self.server.close()
 
+#--udpServer-------------------------------------------------------------------
+    def pushMsg(self, msg, address, reqID=None):
+        """ Send the message to the client address (reply or the server push message),
+            the message bigger than the buffer size will be sent as big message.
+        """
+        if not isinstance(msg, bytes): msg = str(msg).encode(CODE_FMT)
+        if len(msg) + (0 if reqID is None else RID_HEADER.size) < self.bufferSize:
+            self.server.sendto(addReqID(msg, reqID), address)
+        else:
+            self.sendChunk(msg, address, reqID=reqID)
+
 #--udpClient-------------------------------------------------------------------
     def setBufferSize(self, bufferSize=BUFFER_SZ):
         if isinstance(bufferSize, int) and 1 < bufferSize < BUFFER_SZ_MAX:
@@ -226,28 +1164,199 @@ class udpServer(object):
         return False
 
 #--udpClient-------------------------------------------------------------------
-    def sendChunk(self, message, address):
+    def sendChunk(self, message, address, reqID=None):
         """ reply the message bigger than the buffer size to the client side.
             Args:
                 message (str/bytes): _description_
-                resp (bool, optional): _description_. Defaults to False.
-            Returns:
-                _type_: server's response.
+                address (tuple): client address.
+                reqID (int, optional): client's request ID. Defaults to None.
         """
-        messageSZ = len(message)
-        sendCount = ceil(messageSZ/self.chunkSize) if messageSZ > self.bufferSize else 1
-        # Step 1: tell server side the whole message size: BM;Send;<dataSize>
-        msg = ';'.join((BIG_MSG_FLG, 'Send', str(messageSZ)))
-        self.server.sendto(msg.encode(CODE_FMT), address)
+        message, codec = compressMsg(message, self.peers.getCodecs(address), self.compressSize)
+        chunkSize = self.peers.getChunkSize(address, self.chunkSize)
+        transferID = newTransferID()
+        # Step 1: tell server side the whole message size: BM;Send;<dataSize>;<transferID>;<chunkSize>[;<codec>]
+        msg = buildBigMsgHeader(len(message), transferID, chunkSize, codec)
+        self.server.sendto(addReqID(msg, reqID), address)
         # ready to receive big size message.
-        messageChunks = [ message[i:i+self.chunkSize] for i in range(0, messageSZ, self.chunkSize) ]
-        for data in messageChunks:
-            self.server.sendto(data, address)
+        chunks = buildChunkParts(message, transferID, chunkSize)
+        self.sendCache.addTransfer(address, transferID, chunks)
+        for parts in chunks:
+            sendParts(self.server, parts, address)
+        self.server.sendto(addReqID(buildFinishMsg(transferID), reqID), address)
 
 #--udpServer-------------------------------------------------------------------
     def serverStop(self):
         self.terminate = True
 
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class _udpServerProtocol(asyncio.DatagramProtocol):
+    """ asyncio datagram protocol used by <udpAsyncServer>, all the received data 
+        will be passed to the parent server obj.
+    """
+    def __init__(self, parent):
+        self.parent = parent
+
+    def connection_made(self, transport):
+        self.parent.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.parent.datagramReceived(data, addr)
+
+    def error_received(self, exc):
+        print("_udpServerProtocol: socket error: %s" %str(exc))
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class udpAsyncServer(object):
+    """ UDP server module based on asyncio, it follows the same handler contract as 
+        <udpServer>: the handler takes the incoming bytes and the (not None) return 
+        value will be send back to the client, big size reply will be send by the 
+        'BM;Send' chunks. 
+    """
+    def __init__(self, parent, port, maxWorkers=None, reusePort=False):
+        """ Init example: server = udpAsyncServer(None, 5005)
+            Args:
+                port (int): UDP port the server will listen.
+                maxWorkers (int, optional): max number of handler threads. Defaults 
+                    to None (use the ThreadPoolExecutor default number).
+                reusePort (bool, optional): set SO_REUSEPORT so several server processes 
+                    can bind the same port. Defaults to False.
+        """
+        self.port = port
+        self.reusePort = reusePort and isReusePortSupported()
+        self.bufferSize = BUFFER_SZ
+        self.chunkSize = max(1, self.bufferSize-8)
+        self.maxWorkers = maxWorkers
+        self.handler = None
+        self.withAddr = False   # flag to pass the client address to the handler.
+        self.loop = None
+        self.transport = None
+        self.executor = None
+        self.stopEvent = None
+        self.assembler = bigMsgAssembler()  # big message reassembly table.
+        self.sendCache = bigMsgSendCache()  # sent big message chunks for resend.
+        self.peers = peerTable()    # clients' chunk size probe result.
+        self.compressSize = COMPRESS_SZ
+        self.terminate = False  # Server terminate flag.
+
+#--udpAsyncServer--------------------------------------------------------------
+    def datagramReceived(self, data, address):
+        """ Handle one incoming datagram (called in the event loop thread)."""
+        recvSize = len(data)
+        reqID, data = splitReqID(data)
+        if data.startswith(b'BM;Probe;'):
+            ackMsg = self.peers.handleProbe(data, address, recvSize)
+            if ackMsg: self.transport.sendto(ackMsg, address)
+            return
+        if data.startswith(b'BM;Nack'):
+            for parts in self.sendCache.getChunks(address, data):
+                self.transport.sendto(b''.join(parts), address)
+            finishMsg = self.sendCache.getFinishMsg(address, data)
+            if finishMsg: self.transport.sendto(addReqID(finishMsg, reqID), address)
+            return
+        bigMsgFlg, bigMsg, ctrlMsg = self.assembler.handleDatagram(data, address)
+        if ctrlMsg: self.transport.sendto(addReqID(ctrlMsg, reqID), address)
+        if bigMsgFlg:
+            if not bigMsg is None: self._dispatch(bigMsg, address, reqID)
+            return
+        self._dispatch(data, address, reqID)
+
+#--udpAsyncServer--------------------------------------------------------------
+    def _dispatch(self, data, address, reqID=None):
+        """ Run the handler in the thread pool and reply when it is finished."""
+        if self.handler is None:
+            self._reply(data, address, reqID)
+            return
+        args = (data, address) if self.withAddr else (data,)
+        future = self.loop.run_in_executor(self.executor, self.handler, *args)
+        future.add_done_callback(lambda f: self._handlerDone(f, address, reqID))
+
+    def _handlerDone(self, future, address, reqID):
+        try:
+            msg = future.result()
+        except Exception as err:
+            print("udpAsyncServer: handler error: %s" %str(err))
+            return
+        if not msg is None: self._reply(msg, address, reqID)
+
+#--udpAsyncServer--------------------------------------------------------------
+    def _reply(self, msg, address, reqID=None):
+        if self.transport is None or self.transport.is_closing(): return
+        if not isinstance(msg, bytes): msg = str(msg).encode(CODE_FMT)
+        if len(msg) + (0 if reqID is None else RID_HEADER.size) < self.bufferSize:
+            self.transport.sendto(addReqID(msg, reqID), address)
+        else:
+            self.sendChunk(msg, address, reqID=reqID)
+
+#--udpAsyncServer--------------------------------------------------------------
+    def sendChunk(self, message, address, reqID=None):
+        """ reply the message bigger than the buffer size to the client side."""
+        message, codec = compressMsg(message, self.peers.getCodecs(address), self.compressSize)
+        chunkSize = self.peers.getChunkSize(address, self.chunkSize)
+        transferID = newTransferID()
+        msg = buildBigMsgHeader(len(message), transferID, chunkSize, codec)
+        self.transport.sendto(addReqID(msg, reqID), address)
+        # the asyncio transport has no scatter-gather send, the parts are joined.
+        chunks = buildChunkParts(message, transferID, chunkSize)
+        self.sendCache.addTransfer(address, transferID, chunks)
+        for parts in chunks:
+            self.transport.sendto(b''.join(parts), address)
+        self.transport.sendto(addReqID(buildFinishMsg(transferID), reqID), address)
+
+#--udpAsyncServer--------------------------------------------------------------
+    def setBufferSize(self, bufferSize=BUFFER_SZ):
+        if isinstance(bufferSize, int) and 1 < bufferSize < BUFFER_SZ_MAX:
+            self.bufferSize = bufferSize
+            self.chunkSize = max(1, self.bufferSize-8)
+            return True
+        print("Error: the input buffer size must be a int 1 < x < 65507.")
+        return False
+
+#--udpAsyncServer--------------------------------------------------------------
+    async def _serve(self):
+        """ Create the datagram endpoint and wait until the server is stopped."""
+        await self.loop.create_datagram_endpoint(lambda: _udpServerProtocol(self),
+                                                 local_addr=('0.0.0.0', self.port),
+                                                 reuse_port=self.reusePort or None)
+        await self.stopEvent.wait()
+        self.transport.close()
+
+#--udpAsyncServer--------------------------------------------------------------
+    def serverStart(self, handler=None, withAddr=False):
+        """ Start the UDP server event loop to handle the incoming message, this 
+            function will block until serverStop() is called.
+            Args:
+                handler (function): incoming message handler function.
+                withAddr (bool, optional): flag to identify whether the client address
+                    is passed to the handler as handler(data, address). Defaults to False.
+        """
+        self.handler = handler
+        self.withAddr = withAddr
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.stopEvent = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+        self.loop = loop
+        if self.terminate: self.stopEvent.set()
+        try:
+            self.loop.run_until_complete(self._serve())
+        finally:
+            self.executor.shutdown(wait=False)
+            self.loop.close()
+
+#--udpAsyncServer--------------------------------------------------------------
+    def pushMsg(self, msg, address, reqID=None):
+        """ Send the message to the client address from any thread (server push)."""
+        if self.loop is None or self.loop.is_closed(): return
+        self.loop.call_soon_threadsafe(self._reply, msg, address, reqID)
+
+#--udpAsyncServer--------------------------------------------------------------
+    def serverStop(self):
+        self.terminate = True
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopEvent.set)
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 # Use case program: udpComTest.py
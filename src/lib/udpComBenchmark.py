@@ -0,0 +1,207 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        udpComBenchmark.py
+#
+# Purpose:     This module will provide a benchmark program to measure the UDP
+#              communication module (udpCom) throughput, round trip latency and
+#              CPU cost over the loopback interface, the result is printed/saved
+#              as json so the transport changes can be compared run to run.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2023/08/01
+# Copyright:   Copyright (c) 2023 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+""" Program Design:
+
+    Each benchmark case starts a echo udpServer in a thread, the clients send the
+    messages and wait for the reply, the case result contains:
+        - msgPerSec: number of request/reply round trips per second.
+        - p50/p95/p99: round trip latency percentile in milli-second.
+        - cpuPerMsg: process CPU time (server + clients) per message in micro-second.
+    Cases:
+        - small: small messages smaller than the buffer size.
+        - chunk_<bufferSize>: big messages (sent by chunks) under several buffer size.
+        - concurrent_<N>: N clients send the small messages at the same time.
+        - loss_<pct>: big messages with <pct>% chunks dropped (recovered by NACK).
+    Usage: python udpComBenchmark.py [-n <msg count>] [-o <result json file>]
+        [-c <case name prefix> ...]
+"""
+
+import io
+import sys
+import time
+import json
+import random
+import platform
+import argparse
+import threading
+from contextlib import redirect_stdout
+
+import udpCom
+
+UDP_PORT = 5006
+SMALL_MSG_SZ = 64
+BIG_MSG_SZ = 64 * 1024
+CHUNK_BUFFER_SZS = (1024, 4096, 16384, 60000)
+CONCURRENT_CLIENTS = (2, 4, 8)
+LOSS_PCTS = (1, 5)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class randomLossSocket(object):
+    """ Socket wrapper which randomly drops the big message chunks to simulate the
+        packet loss, the control messages are not dropped.
+    """
+    def __init__(self, sock, lossRate):
+        self.sock = sock
+        self.lossRate = lossRate
+        self.dropCount = 0
+
+    def _drop(self, data):
+        if len(data) > udpCom.CHUNK_HEADER.size and data[0] & 0x80 and random.random() < self.lossRate:
+            self.dropCount += 1
+            return True
+        return False
+
+    def sendto(self, data, address):
+        if self._drop(data): return len(data)
+        return self.sock.sendto(data, address)
+
+    def sendmsg(self, buffers, ancdata, flags, address):
+        return self.sendto(b''.join(buffers), address)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class echoServerThread(threading.Thread):
+    """ Echo udpServer running in a thread."""
+    def __init__(self, bufferSize=udpCom.BUFFER_SZ, lossRate=0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.server = udpCom.udpServer(None, UDP_PORT)
+        self.server.setBufferSize(bufferSize)
+        if lossRate: self.server.server = randomLossSocket(self.server.server, lossRate)
+
+    def run(self):
+        self.server.serverStart(handler=lambda msg: msg)
+
+    def stop(self):
+        self.server.serverStop()
+        # send a empty message to bypass the recvfrom() block.
+        endClient = udpCom.udpClient(('127.0.0.1', UDP_PORT))
+        endClient.sendMsg(b'', resp=False)
+        self.join(timeout=2)
+
+#-----------------------------------------------------------------------------
+def percentile(sortedList, pct):
+    """ Return the percentile value of the sorted list."""
+    if not sortedList: return None
+    idx = min(len(sortedList) - 1, int(round(pct / 100 * (len(sortedList) - 1))))
+    return sortedList[idx]
+
+def runClient(msgList, bufferSize, lossRate, latencyList, errorList):
+    """ Send the messages one by one and record the round trip latency (sec)."""
+    client = udpCom.udpClient(('127.0.0.1', UDP_PORT))
+    client.setBufferSize(bufferSize)
+    if lossRate: client.client = randomLossSocket(client.client, lossRate)
+    for msg in msgList:
+        startT = time.perf_counter()
+        if len(msg) < bufferSize:
+            rpl = client.sendMsg(msg, resp=True)
+        else:
+            rpl = client.sendChunk(msg, resp=True)
+        latencyList.append(time.perf_counter() - startT)
+        if rpl != msg: errorList.append(len(msg))
+    client.client.close()
+
+def runCase(name, msgSize, msgCount, bufferSize=udpCom.BUFFER_SZ, clientNum=1, lossRate=0):
+    """ Run one benchmark case.
+        Returns:
+            dict: the case result.
+    """
+    servThread = echoServerThread(bufferSize=bufferSize, lossRate=lossRate)
+    servThread.start()
+    msgList = [random.randbytes(msgSize) if hasattr(random, 'randbytes')
+               else bytes(random.getrandbits(8) for _ in range(msgSize))
+               for _ in range(min(msgCount, 16))]
+    latencyList, errorList = [], []
+    perClient = max(1, msgCount // clientNum)
+    clients = [threading.Thread(target=runClient,
+                                args=([msgList[i % len(msgList)] for i in range(perClient)],
+                                      bufferSize, lossRate, latencyList, errorList))
+               for _ in range(clientNum)]
+    cpuT, wallT = time.process_time(), time.perf_counter()
+    for t in clients: t.start()
+    for t in clients: t.join()
+    wallT = time.perf_counter() - wallT
+    cpuT = time.process_time() - cpuT
+    servThread.stop()
+    msgTotal = len(latencyList)
+    latencyList.sort()
+    toMs = lambda val: None if val is None else round(val * 1000, 4)
+    return {
+        'case': name,
+        'msgSize': msgSize,
+        'bufferSize': bufferSize,
+        'clients': clientNum,
+        'lossRate': lossRate,
+        'messages': msgTotal,
+        'errors': len(errorList),
+        'msgPerSec': round(msgTotal / wallT, 2) if wallT else None,
+        'p50': toMs(percentile(latencyList, 50)),
+        'p95': toMs(percentile(latencyList, 95)),
+        'p99': toMs(percentile(latencyList, 99)),
+        'cpuPerMsg': round(cpuT / msgTotal * 1e6, 2) if msgTotal else None
+    }
+
+#-----------------------------------------------------------------------------
+def buildCases(msgCount):
+    """ Return the benchmark cases list: (name, kwargs of runCase())."""
+    cases = [('small', {'msgSize': SMALL_MSG_SZ, 'msgCount': msgCount})]
+    for bufferSize in CHUNK_BUFFER_SZS:
+        cases.append(('chunk_%s' %str(bufferSize), {'msgSize': BIG_MSG_SZ, 'bufferSize': bufferSize,
+                                                    'msgCount': max(1, msgCount // 10)}))
+    for clientNum in CONCURRENT_CLIENTS:
+        cases.append(('concurrent_%s' %str(clientNum), {'msgSize': SMALL_MSG_SZ, 'clientNum': clientNum,
+                                                        'msgCount': msgCount}))
+    for pct in LOSS_PCTS:
+        cases.append(('loss_%s' %str(pct), {'msgSize': BIG_MSG_SZ, 'lossRate': pct / 100,
+                                            'msgCount': max(1, msgCount // 20)}))
+    return cases
+
+def runBenchmark(msgCount=1000, casePrefixes=None):
+    """ Run the benchmark cases and return the result dict."""
+    result = {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cases': []
+    }
+    for name, kwargs in buildCases(msgCount):
+        if casePrefixes and not any(name.startswith(prefix) for prefix in casePrefixes): continue
+        print("Run case: %s ..." %name, file=sys.stderr)
+        # mute the server's per message print.
+        with redirect_stdout(io.StringIO()):
+            result['cases'].append(runCase(name, **kwargs))
+    return result
+
+#-----------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description='udpCom loopback benchmark.')
+    parser.add_argument('-n', '--count', type=int, default=1000, help='messages number of the small message case.')
+    parser.add_argument('-o', '--output', default=None, help='json result file path.')
+    parser.add_argument('-c', '--cases', nargs='*', default=None, help='case name prefixes to run.')
+    args = parser.parse_args()
+    result = runBenchmark(msgCount=args.count, casePrefixes=args.cases)
+    resultStr = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(resultStr)
+    print(resultStr)
+
+if __name__ == '__main__':
+    main()
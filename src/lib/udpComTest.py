@@ -13,6 +13,7 @@
 #-----------------------------------------------------------------------------
 
 import time
+import asyncio
 import random
 import string
 import threading    # create multi-thread test case.
@@ -52,6 +53,43 @@ class testThread(threading.Thread):
         endClient.disconnect()
         endClient = None
 
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class testAsyncThread(testThread):
+    """ Thread to test the asyncio UDP server."""
+    def __init__(self, parent, threadID, name):
+        threading.Thread.__init__(self)
+        self.threadName = name
+        self.server = udpCom.udpAsyncServer(None, UDP_PORT)
+
+    def msgHandler(self, msg):
+        if msg.startswith(b'slow'): time.sleep(1) # simulate a slow handler.
+        return msg
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class lossySocket(object):
+    """ Socket wrapper which drops the big message chunks in the dropSeqList one time
+        to simulate the packet loss.
+    """
+    def __init__(self, sock, dropSeqList):
+        self.sock = sock
+        self.dropSeqList = list(dropSeqList)
+
+    def sendto(self, data, address):
+        if len(data) > udpCom.CHUNK_HEADER.size and data[0] & 0x80:
+            _, seq = udpCom.CHUNK_HEADER.unpack_from(data)
+            if seq in self.dropSeqList:
+                self.dropSeqList.remove(seq)
+                return len(data)
+        return self.sock.sendto(data, address)
+
+    def sendmsg(self, buffers, ancdata, flags, address):
+        return self.sendto(b''.join(buffers), address)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 
@@ -163,6 +201,186 @@ def testCase(mode):
         print(rpl)
         print(" - Message send and receive test passed: %s" %str(msg==rpl))
         servThread.stop()
+    elif mode == '4':
+        print("Start asyncio UDP server concurrent clients test. test mode: %s \n" % str(mode))
+        servThread = testAsyncThread(None, 0, "async server thread")
+        servThread.setBufferSize(100)
+        servThread.start()
+        time.sleep(0.5)
+        results = {}
+        def clientRun(idx):
+            client = udpCom.udpClient(('127.0.0.1', UDP_PORT))
+            client.setBufferSize(100)
+            msg = getRandomStr(400) if idx % 2 else 'Test data %s' % str(idx)
+            if idx == 0: msg = 'slow' + msg
+            rpl = client.sendChunk(msg, resp=True) if len(msg) > 100 else client.sendMsg(msg, resp=True)
+            results[idx] = (rpl == msg.encode('utf-8'), time.time())
+        startT = time.time()
+        clientThreads = [threading.Thread(target=clientRun, args=(i,)) for i in range(6)]
+        for t in clientThreads: t.start()
+        for t in clientThreads: t.join()
+        tPass = len(results) == 6 and all(val[0] for val in results.values())
+        print(" - Concurrent message send and receive test passed: %s" %str(tPass))
+        # the fast clients should not wait for the slow handler.
+        tPass = all(results[i][1] - startT < 1 for i in range(1, 6))
+        print(" - Slow handler no blocking test passed: %s" %str(tPass))
+        servThread.stop()
+    elif mode == '5':
+        print("Start interleaved big message reassembly test. test mode: %s \n" % str(mode))
+        servThread = testThread(None, 0, "server thread")
+        servThread.setBufferSize(100)
+        servThread.start()
+        clients, msgs, chunkLists = [], [], []
+        for i in range(2):
+            client = udpCom.udpClient(('127.0.0.1', UDP_PORT))
+            client.setBufferSize(100)
+            msg = getRandomStr(500).encode('utf-8')
+            transferID = udpCom.newTransferID()
+            header = ';'.join(('BM', 'Send', str(len(msg)), str(transferID), str(client.chunkSize)))
+            client.sendMsg(header)
+            clients.append((client, transferID))
+            msgs.append(msg)
+            # send the chunks in reverse order to test the out of order placement.
+            chunkLists.append(list(reversed(udpCom.buildChunks(msg, transferID, client.chunkSize))))
+        # interleave the 2 clients' chunks.
+        for chunkPair in zip(*chunkLists):
+            for (client, _), chunk in zip(clients, chunkPair): client.sendMsg(chunk)
+        tPass = True
+        for (client, transferID), msg in zip(clients, msgs):
+            rpl = client.sendMsg(';'.join(('BM', 'Sent', 'Finish', str(transferID))), resp=True)
+            tPass = tPass and rpl == msg
+        print(" - Interleaved message send and receive test passed: %s" %str(tPass))
+        servThread.stop()
+    elif mode == '6':
+        print("Start lost chunks selective resend test. test mode: %s \n" % str(mode))
+        servThread = testThread(None, 0, "server thread")
+        servThread.setBufferSize(100)
+        # drop the server reply chunks and client request chunks one time.
+        servThread.server.server = lossySocket(servThread.server.server, [1, 3])
+        received = []
+        servThread.msgHandler = lambda msg: received.append(msg) or msg
+        servThread.start()
+        client = udpCom.udpClient(('127.0.0.1', UDP_PORT))
+        client.client = lossySocket(client.client, [0, 2])
+        client.setBufferSize(100)
+        msg = getRandomStr(600)
+        startT = time.time()
+        rpl = client.sendChunk(msg, resp=True)
+        tPass = rpl == msg.encode('utf-8') and not client.client.dropSeqList
+        print(" - Lost chunks resend test passed: %s" %str(tPass))
+        # the lost reply chunks are NACKed when the finish flag arrives (no idle wait).
+        tPass = time.time() - startT < udpCom.NACK_WAIT
+        print(" - Lost chunks no stall test passed: %s" %str(tPass))
+        # one-way big message without response still recovers the lost chunks.
+        client = udpCom.udpClient(('127.0.0.1', UDP_PORT))
+        client.client = lossySocket(client.client, [1])
+        client.setBufferSize(100)
+        msg = getRandomStr(600)
+        startT = time.time()
+        rpl = client.sendChunk(msg, resp=False)
+        # the server's Ack returns the one-way send without waiting the NACK_WAIT.
+        sendT = time.time() - startT
+        for _ in range(10):
+            if received and received[-1] == msg.encode('utf-8'): break
+            time.sleep(0.05)
+        tPass = rpl is True and received[-1] == msg.encode('utf-8') and not client.client.dropSeqList
+        print(" - Lost chunks resend without response test passed: %s" %str(tPass))
+        tPass = sendT < udpCom.NACK_WAIT
+        print(" - One-way send Ack no wait test passed: %s" %str(tPass))
+        servThread.stop()
+    elif mode == '7':
+        print("Start pipeline client request ID matching test. test mode: %s \n" % str(mode))
+        servThread = testAsyncThread(None, 0, "async server thread")
+        servThread.setBufferSize(100)
+        servThread.start()
+        time.sleep(0.5)
+        client = udpCom.udpPipeClient(('127.0.0.1', UDP_PORT), maxInflight=8)
+        client.setBufferSize(100)
+        # the slow message's reply will arrive after the others.
+        msgs = ['slow' + getRandomStr(10), getRandomStr(400), 'Test data 2', getRandomStr(20)]
+        startT = time.time()
+        futures = [client.sendRequest(msg) for msg in msgs]
+        for future in futures[1:]: future.result(timeout=5)
+        fastT = time.time() - startT
+        tPass = all(f.result(timeout=5) == msg.encode('utf-8') for f, msg in zip(futures, msgs))
+        print(" - Out of order replies matching test passed: %s" %str(tPass))
+        tPass = fastT < 1
+        print(" - Fast replies no blocking test passed: %s" %str(tPass))
+        rpl = client.sendMsg('Test data sync', resp=True)
+        print(" - Blocking send compatible test passed: %s" %str(rpl == b'Test data sync'))
+        async def asyncSend():
+            return await client.sendRequestAsync('Test data async')
+        rpl = asyncio.run(asyncSend())
+        print(" - Asyncio request test passed: %s" %str(rpl == b'Test data async'))
+        # the server push without request ID must not resolve the pending request.
+        future = client.sendRequest('slow push test')
+        time.sleep(0.2)
+        servThread.server.pushMsg(b'push msg', ('127.0.0.1', client.client.getsockname()[1]))
+        print(" - Push message not matched test passed: %s" %str(future.result(timeout=5) == b'slow push test'))
+        client.disconnect()
+        # the request waiting for a full in flight window times out.
+        client = udpCom.udpPipeClient(('127.0.0.1', UDP_PORT + 1), maxInflight=1)
+        client.setTimeOut(timeoutT=3)
+        client.sendRequest('no server')
+        client.setTimeOut(timeoutT=1)
+        startT = time.time()
+        future = client.sendRequest('window full')
+        tPass = isinstance(future.exception(timeout=5), TimeoutError) and time.time() - startT < 2
+        print(" - Full window request time out test passed: %s" %str(tPass))
+        client.disconnect()
+        servThread.stop()
+    elif mode == '8':
+        print("Start chunk size probe and compression test. test mode: %s \n" % str(mode))
+        servThread = testThread(None, 0, "server thread")
+        servThread.setBufferSize(20000)
+        servThread.start()
+        client = udpCom.udpClient(('127.0.0.1', UDP_PORT))
+        client.setBufferSize(1000)
+        chunkSize = client.probeChunkSize()
+        tPass = chunkSize == 16384 - udpCom.CHUNK_HEADER.size and udpCom.CODEC_ZLIB in client.peerCodecs
+        print(" - Chunk size probe test passed: %s" %str(tPass))
+        # repetitive state dump message.
+        msg = 'REP;sensors;' + str({'weline%s' %str(i): [0, 1, 0, 0, 1] * 20 for i in range(200)})
+        rpl = client.sendChunk(msg, resp=True)
+        print(" - Compressed message send and receive test passed: %s" %str(rpl == msg.encode('utf-8')))
+        chunks = list(servThread.server.sendCache.chunksDict.values())[-1]
+        # the reply chunk size is limited by the client buffer size.
+        tPass = len(chunks) < len(msg) // 1000 and len(b''.join(chunks[0])) <= 1000
+        print(" - Compressed reply chunks count test passed: %s" %str(tPass))
+        servThread.stop()
+    elif mode == '9':
+        print("Start udpServer handler worker pool test. test mode: %s \n" % str(mode))
+        servThread = testAsyncThread(None, 0, "server thread")
+        servThread.server = udpCom.udpServer(None, UDP_PORT, workerNum=4, queueSize=2)
+        servThread.start()
+        results = {}
+        def clientRun(idx):
+            client = udpCom.udpClient(('127.0.0.1', UDP_PORT))
+            msgs = ['slow%s' %str(idx)] if idx == 0 else ['Test data %s-%s' %(str(idx), str(i)) for i in range(5)]
+            rplList = [client.sendMsg(msg, resp=True) for msg in msgs]
+            workerIdx = hash(('127.0.0.1', client.client.getsockname()[1])) % 4
+            results[idx] = (rplList == [msg.encode('utf-8') for msg in msgs], time.time(), workerIdx)
+        startT = time.time()
+        clientThreads = [threading.Thread(target=clientRun, args=(i,)) for i in range(4)]
+        for t in clientThreads: t.start()
+        for t in clientThreads: t.join()
+        tPass = all(val[0] for val in results.values())
+        print(" - Worker pool in order reply test passed: %s" %str(tPass))
+        # the clients not sharing the worker with the slow client should not be blocked.
+        tPass = all(results[i][1] - startT < 1 for i in range(1, 4) if results[i][2] != results[0][2])
+        print(" - Slow handler no blocking test passed: %s" %str(tPass))
+        # flood one worker queue to check the drop counter.
+        client = udpCom.udpClient(('127.0.0.1', UDP_PORT))
+        for i in range(10): client.sendMsg('slow flood', resp=False)
+        time.sleep(0.2)
+        stats = servThread.server.getStats()
+        print(" - Worker queue drop counter test passed: %s" %str(stats['dropped'] > 0))
+        print(stats)
+        workers = list(servThread.server.workerThreads)
+        servThread.stop()
+        servThread.join(udpCom.WORKER_STOP_TO + 1)
+        tPass = not servThread.is_alive() and not any(t.is_alive() for t in workers)
+        print(" - Full queue worker stop test passed: %s" %str(tPass))
     else:
         print("Input %s is not valid, program terminate." % str(uInput))
 
@@ -173,6 +391,12 @@ if __name__ == '__main__':
         \t (0) Auto test,\n\
         \t (1) UDP echo server,\n\
         \t (2) UDP client\n\
-        \t (3) Test send big message bigger than buffer")
+        \t (3) Test send big message bigger than buffer\n\
+        \t (4) Test asyncio server with concurrent clients\n\
+        \t (5) Test interleaved big message reassembly\n\
+        \t (6) Test lost chunks selective resend\n\
+        \t (7) Test pipeline client request ID matching\n\
+        \t (8) Test chunk size probe and compression\n\
+        \t (9) Test udpServer handler worker pool")
     uInput = str(input())
     testCase(uInput)
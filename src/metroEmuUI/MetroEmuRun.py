@@ -166,6 +166,8 @@ class UIFrame(wx.Frame):
             self.lastPeriodicTime = now
             # update the manager.
             gv.iMapMgr.periodic(now)
+            # push the state changes to the subscribed PLCs and the UDP workers.
+            if gv.iDataMgr: gv.iDataMgr.periodic()
             # apply the state on the map panel.
             self.mapPanel.periodic(now)
 
@@ -20,21 +20,11 @@ import threading
 import metroEmuGobal as gv
 import Log
 import udpCom
+import realWorldCodec
+import dataMgrPool
 
-# Define all the local untility functions here:
-#-----------------------------------------------------------------------------
-def parseIncomeMsg(msg):
-    """ parse the income message to tuple with 3 elements: request key, type and jsonString
-        Args: msg (str): example: 'GET;dataType;{"user":"<username>"}'
-    """
-    req = msg.decode('UTF-8') if not isinstance(msg, str) else msg
-    try:
-        reqKey, reqType, reqJsonStr = req.split(';', 2)
-        return (reqKey.strip(), reqType.strip(), reqJsonStr)
-    except Exception as err:
-        Log.error('parseIncomeMsg(): The income message format is incorrect.')
-        Log.exception(err)
-        return('','',json.dumps({}))
+SUB_EXPIRE = 6      # subscription will be removed if the PLC doesn't renew it in 6 sec.
+KEYFRAME_INT = 1    # push the full state to the subscriber at least every 1 sec.
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -48,7 +38,13 @@ class DataManager(threading.Thread):
         self.parent = parent
         self.terminate = False
         # Init a udp server to accept all the other plc module's data fetch/set request.
-        self.server = udpCom.udpServer(None, gv.UDP_PORT)
+        # if the worker processes pool is enabled, all the servers bind the UDP port 
+        # with SO_REUSEPORT.
+        self.pool = None
+        if gv.gUdpWorkers > 0 and udpCom.isReusePortSupported():
+            self.pool = dataMgrPool.dataMgrPool(self.handleRequest, gv.UDP_PORT, workerNum=gv.gUdpWorkers)
+        reusePort = self.pool is not None
+        self.server = udpCom.udpAsyncServer(None, gv.UDP_PORT, reusePort=reusePort) if gv.gUdpAsync else udpCom.udpServer(None, gv.UDP_PORT, reusePort=reusePort, workerNum=gv.gUdpHandlerThreads)
         self.daemon = True
         # init the local sensors data record dictionary
         self.sensorsDict = {
@@ -84,58 +80,69 @@ class DataManager(threading.Thread):
             'mtline': None
         }
         self.trainPlcUpdateT= 0
+        self.dataLock = threading.Lock()
+        # PLC state change subscriptions, key: (PLC address, subType), val: dict
+        # {'keys': subscribed track IDs, 'expire': time, 'keyframeT': time, 'seq': int}
+        self.subscribers = {}
+        self.subLock = threading.Lock()
+        self.pubStateDict = {} # last published state, key: subType, val: state dict.
         gv.gDebugPrint("datamanager init finished.", logType=gv.LOG_INFO)
 
     #-----------------------------------------------------------------------------
     # Define all the data fetching request here:
-    # the fetch function will handle the Plc components state fetch request by: convert 
-    # the json string to dict, then fill the input reqDict with the data and return.
-    # return json.dumps({'result': 'failed'}) if process data error.
-    def fetchSensorInfo(self, reqJsonStr):
-        respStr = json.dumps({'result': 'failed'})
+    # the fetch function will handle the Plc components state fetch request by: fill
+    # the input reqDict with the data and return.
+    # return {'result': 'failed'} if process data error.
+    def fetchSensorInfo(self, reqDict):
+        respDict = {'result': 'failed'}
         try:
-            reqDict = json.loads(reqJsonStr)
             self.sensorPlcUpdateT = time.time() 
-            self.updateSensorsData()
-            for key in reqDict.keys():
-                if key in self.sensorsDict.keys(): reqDict[key] = self.sensorsDict[key]
-            respStr = json.dumps(reqDict)
+            with self.dataLock:
+                self.updateSensorsData()
+                for key in reqDict.keys():
+                    if key in self.sensorsDict.keys(): reqDict[key] = self.sensorsDict[key]
+            respDict = reqDict
         except Exception as err:
             gv.gDebugPrint("fetchSensorInfo() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
-        return respStr
+        return respDict
     
     #-----------------------------------------------------------------------------
-    def fetchStationInfo(self, reqJsonStr):
-        respStr = json.dumps({'result': 'failed'})
+    def fetchStationInfo(self, reqDict):
+        respDict = {'result': 'failed'}
         try:
-            reqDict = json.loads(reqJsonStr)
             self.stationPlcUpdateT = time.time()
-            self.updateStationsData()
-            for key in reqDict.keys():
-                if key in self.stationsDict.keys(): reqDict[key] = self.stationsDict[key]
-            respStr = json.dumps(reqDict)
+            with self.dataLock:
+                self.updateStationsData()
+                for key in reqDict.keys():
+                    if key in self.stationsDict.keys(): reqDict[key] = self.stationsDict[key]
+            respDict = reqDict
         except Exception as err:
             gv.gDebugPrint("fetchStationInfo() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
-        return respStr
+        return respDict
 
     #-----------------------------------------------------------------------------
-    def fetchTrainInfo(self, reqJsonStr):
-        respStr = json.dumps({'result': 'failed'})
+    def fetchTrainInfo(self, reqDict):
+        respDict = {'result': 'failed'}
         try:
-            reqDict = json.loads(reqJsonStr)
             self.trainPlcUpdateT = time.time()
-            self.updateTrainsData()
-            for key in reqDict.keys():
-                if key in self.trainsDict.keys(): reqDict[key] = self.trainsDict[key]
-            respStr = json.dumps(reqDict)
+            with self.dataLock:
+                self.updateTrainsData()
+                for key in reqDict.keys():
+                    if key in self.trainsDict.keys(): reqDict[key] = self.trainsDict[key]
+            respDict = reqDict
         except Exception as err:
             gv.gDebugPrint("fetchTrainInfo() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
-        return respStr
+        return respDict
 
     #-----------------------------------------------------------------------------
     def getLastPlcsConnectionState(self):
         #print time.strftime("%b %d %Y %H:%M:%S", time.localtime(time.time))
         crtTime = time.time()
+        if self.pool:
+            # the GET requests may be handled by the worker processes.
+            self.sensorPlcUpdateT = max(self.sensorPlcUpdateT, self.pool.getFetchTime('sensors'))
+            self.stationPlcUpdateT = max(self.stationPlcUpdateT, self.pool.getFetchTime('stations'))
+            self.trainPlcUpdateT = max(self.trainPlcUpdateT, self.pool.getFetchTime('trains'))
         sensorPlcOnline = crtTime - self.sensorPlcUpdateT < gv.gPlcTimeout
         stationPlcOnline = crtTime - self.stationPlcUpdateT < gv.gPlcTimeout
         trainPlcOnline = crtTime - self.trainPlcUpdateT < gv.gPlcTimeout
@@ -146,100 +153,224 @@ class DataManager(threading.Thread):
         }
 
     #-----------------------------------------------------------------------------
-    def msgHandler(self, msg):
-        """ Function to handle the data-fetch/control request from the monitor-hub.
+    def handleRequest(self, reqKey, reqType, reqDict, address=None):
+        """ Handle one data-fetch/control request.
             Args:
-                msg (str/bytes): incoming data from PLC modules though UDP.
+                address (tuple, optional): PLC address, needed by the subscription.
             Returns:
-                bytes: message bytes needs to reply to the PLC.
+                (str, dict): reply type and the reply data dict. reply type 'deny' 
+                    means the request is not supported.
         """
-        gv.gDebugPrint("Incomming message: %s" % str(msg), logType=gv.LOG_INFO)
-        if msg == b'': return None
-        # request message format: 
-        # data fetch: GET:<key>:<val1>:<val2>...
-        # data set: POST:<key>:<val1>:<val2>...
-        resp = b'REP;deny;{}'
-        (reqKey, reqType, reqJsonStr) = parseIncomeMsg(msg)
         if reqKey=='GET':
             if reqType == 'login':
-                resp = ';'.join(('REP', 'login', json.dumps({'state':'ready'})))
+                return ('login', dataMgrPool.buildLoginReply(reqDict))
             elif reqType == 'sensors':
-                respStr = self.fetchSensorInfo(reqJsonStr)
-                resp =';'.join(('REP', 'sensors', respStr))
+                return ('sensors', self.fetchSensorInfo(reqDict))
             elif reqType == 'stations':
-                respStr = self.fetchStationInfo(reqJsonStr)
-                resp =';'.join(('REP', 'stations', respStr))
+                return ('stations', self.fetchStationInfo(reqDict))
             elif reqType == 'trains':
-                respStr = self.fetchTrainInfo(reqJsonStr)
-                resp =';'.join(('REP', 'trains', respStr))
-            pass
+                return ('trains', self.fetchTrainInfo(reqDict))
+        elif reqKey=='SUB':
+            if reqType in ('sensors', 'stations', 'trains') and address:
+                return (reqType, self.addSubscriber(reqType, reqDict, address))
+        elif reqKey=='UNSUB':
+            if reqType in ('sensors', 'stations', 'trains') and address:
+                with self.subLock:
+                    self.subscribers.pop((address, reqType), None)
+                return (reqType, {'result': 'success'})
         elif reqKey=='POST':
-            if reqType == 'signals':
-                respStr = self.setSignals(reqJsonStr)
-                resp =';'.join(('REP', 'signals', respStr))
+            if reqType == 'batch':
+                return ('batch', self.handleBatch(reqDict, address=address))
+            elif reqType == 'signals':
+                return ('signals', self.setSignals(reqDict))
             elif reqType == 'stations':
-                respStr = self.setStationSignals(reqJsonStr)
-                resp =';'.join(('REP', 'stations', respStr))
+                return ('stations', self.setStationSignals(reqDict))
             elif reqType == 'trains':
-                respStr = self.setTrainsPower(reqJsonStr)
-                resp =';'.join(('REP', 'trains', respStr))
-            pass
+                return ('trains', self.setTrainsPower(reqDict))
             # TODO: Handle all the control request here.
-        if isinstance(resp, str): resp = resp.encode('utf-8')
-        #gv.gDebugPrint('reply: %s' %str(resp), logType=gv.LOG_INFO )
-        return resp
+        return ('deny', {})
+
+    #-----------------------------------------------------------------------------
+    def handleBatch(self, reqDict, address=None):
+        """ Handle a batch of GET/POST requests in one message. 
+            Args:
+                reqDict (dict): {'batch': [(reqKey, reqType, reqDict), ...]}
+            Returns:
+                dict: {'batch': [('REP', respType, respDict), ...]} the replies are 
+                    under the same sequence as the requests.
+        """
+        respList = []
+        for item in reqDict.get('batch', []):
+            respType, respDict = 'deny', {}
+            try:
+                subKey, subType, subDict = item
+                if subType != 'batch' and isinstance(subDict, dict):
+                    respType, respDict = self.handleRequest(subKey, subType, subDict, address=address)
+            except Exception as err:
+                gv.gDebugPrint("handleBatch() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
+            respList.append(('REP', respType, respDict))
+        return {'batch': respList}
+
+    #-----------------------------------------------------------------------------
+    def msgHandler(self, msg, address=None):
+        """ Function to handle the data-fetch/control request from the monitor-hub.
+            Args:
+                msg (str/bytes): incoming data from PLC modules though UDP.
+                address (tuple, optional): PLC's UDP address.
+            Returns:
+                bytes: message bytes needs to reply to the PLC.
+        """
+        gv.gDebugPrint("Incomming message: %s" % str(msg), logType=gv.LOG_INFO)
+        if msg == b'': return None
+        return dataMgrPool.buildReply(msg, self.handleRequest, address=address)
 
     #-----------------------------------------------------------------------------
     def run(self):
         """ Thread run() function will be called by start(). """
         time.sleep(1)
         gv.gDebugPrint("datamanager subthread started.", logType=gv.LOG_INFO)
-        self.server.serverStart(handler=self.msgHandler)
+        if self.pool and self.pool.start(): self.updateSnapshot()
+        self.server.serverStart(handler=self.msgHandler, withAddr=True)
         gv.gDebugPrint("DataManager running finished.", logType=gv.LOG_INFO)
 
+    #-----------------------------------------------------------------------------
+    def periodic(self):
+        """ Push the state changes to the subscribers and update the worker processes'
+            state snapshot, this function needs to be called after MapMgr.periodic().
+        """
+        self.publishState()
+        if self.pool: self.updateSnapshot()
+
+    def updateSnapshot(self):
+        """ Write the current state to the worker processes' shared snapshot."""
+        with self.dataLock:
+            self.updateSensorsData()
+            self.updateStationsData()
+            self.updateTrainsData()
+            stateDict = {'sensors': self.sensorsDict, 
+                         'stations': self.stationsDict, 
+                         'trains': self.trainsDict}
+            self.pool.updateSnapshot(stateDict)
+
+    #-----------------------------------------------------------------------------
+    # Define all the subscription (server push) function here:
+    # PLC sends 'SUB;<subType>;{"weline": None, ...}' (renew it before SUB_EXPIRE), 
+    # the reply is the full state keyframe, then every time the state changes in 
+    # the MapMgr.periodic() the changed tracks' state will be pushed to the PLC by 
+    # 'PUB;<subType>;{"seq": <int>, "keyframe": <bool>, "data": {"weline": [...]}}'.
+    # the full state keyframe will be pushed at least every KEYFRAME_INT sec. If the 
+    # PLC adds "codec": ["bin"] in the SUB request, the push is encoded by realWorldCodec.
+
+    def addSubscriber(self, subType, reqDict, address):
+        """ Add (or renew) a PLC's subscription and return the full state keyframe,
+            the fetch function marks the PLC online, the push doesn't.
+        """
+        fetchFunc = {'sensors': self.fetchSensorInfo, 
+                     'stations': self.fetchStationInfo, 
+                     'trains': self.fetchTrainInfo}[subType]
+        reqDict = dict(reqDict)
+        binFlg = realWorldCodec.CODEC_BIN in (reqDict.pop('codec', None) or [])
+        respDict = fetchFunc(reqDict)
+        if respDict.get('result') == 'failed': return respDict
+        crtTime = time.time()
+        with self.subLock:
+            record = self.subscribers.setdefault((address, subType), {'seq': 0})
+            record['codec'] = realWorldCodec.CODEC_BIN if binFlg else None
+            record['keys'] = list(respDict.keys())
+            record['expire'] = crtTime + SUB_EXPIRE
+            record['keyframeT'] = crtTime
+            return {'seq': record['seq'], 'keyframe': True, 'data': respDict}
+
+    #-----------------------------------------------------------------------------
+    def publishState(self):
+        """ Push the changed state to the subscribers, this function needs to be called
+            after the MapMgr.periodic().
+        """
+        crtTime = time.time()
+        with self.subLock:
+            for key in [k for k, v in self.subscribers.items() if v['expire'] < crtTime]:
+                gv.gDebugPrint("Subscription %s expired." %str(key), logType=gv.LOG_INFO)
+                self.subscribers.pop(key)
+            if not self.subscribers: return
+            subTypes = set(subType for (_, subType) in self.subscribers.keys())
+        pushList = []
+        for subType in subTypes:
+            stateDict = {'sensors': self.sensorsDict,
+                         'stations': self.stationsDict,
+                         'trains': self.trainsDict}[subType]
+            with self.dataLock:
+                {'sensors': self.updateSensorsData,
+                 'stations': self.updateStationsData,
+                 'trains': self.updateTrainsData}[subType]()
+                crtState = {k: list(v) for k, v in stateDict.items() if v is not None}
+            lastState = self.pubStateDict.get(subType, {})
+            changedKeys = [k for k in crtState.keys() if crtState[k] != lastState.get(k)]
+            self.pubStateDict[subType] = crtState
+            with self.subLock:
+                for (address, recType), record in self.subscribers.items():
+                    if recType != subType: continue
+                    keyframeFlg = crtTime - record['keyframeT'] >= KEYFRAME_INT
+                    pushKeys = record['keys'] if keyframeFlg else changedKeys
+                    dataDict = {k: crtState[k] for k in pushKeys if k in record['keys'] and k in crtState}
+                    if not dataDict: continue
+                    if keyframeFlg: record['keyframeT'] = crtTime
+                    record['seq'] += 1
+                    pushDict = {'seq': record['seq'], 'keyframe': keyframeFlg, 'data': dataDict}
+                    pushList.append((self.encodePush(subType, pushDict, record['codec']), address))
+        for msg, address in pushList:
+            self.server.pushMsg(msg, address)
+
+    def encodePush(self, subType, pushDict, codec=None):
+        """ Encode the push message with the subscriber's codec, use the text format
+            if the state can not be encoded in binary.
+        """
+        if codec == realWorldCodec.CODEC_BIN:
+            try:
+                return realWorldCodec.encodeMsg('PUB', subType, pushDict)
+            except ValueError:
+                pass
+        return ';'.join(('PUB', subType, json.dumps(pushDict))).encode('utf-8')
+
     #-----------------------------------------------------------------------------
     # define all the set() function here:
-    # set function will handle the Plc components state set request by: convert 
-    # the json string to dict, the change the components state in map manager.
+    # set function will handle the Plc components state set request by: change the 
+    # components state in map manager based on the request dict.
 
-    def setSignals(self, reqJsonStr):
-        respStr = json.dumps({'result': 'failed'})
+    def setSignals(self, reqDict):
+        respDict = {'result': 'failed'}
         try:
-            reqDict = json.loads(reqJsonStr)
             if gv.iMapMgr:
                 if not gv.gJuncAvoid:
                     for key, val in reqDict.items():
                         gv.iMapMgr.setSingals(key, val)
-                respStr = json.dumps({'result': 'success'})
+                respDict = {'result': 'success'}
         except Exception as err:
             gv.gDebugPrint("setSignals() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
-        return respStr
+        return respDict
 
     #-----------------------------------------------------------------------------
-    def setStationSignals(self, reqJsonStr):
-        respStr = json.dumps({'result': 'failed'})
+    def setStationSignals(self, reqDict):
+        respDict = {'result': 'failed'}
         try:
-            reqDict = json.loads(reqJsonStr)
             if gv.iMapMgr:
                 for key, val in reqDict.items():
                     gv.iMapMgr.setStationSignal(key, val)
-                respStr = json.dumps({'result': 'success'})
+                respDict = {'result': 'success'}
         except Exception as err:
             gv.gDebugPrint("setStationSignals() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
-        return respStr
+        return respDict
 
     #-----------------------------------------------------------------------------
-    def setTrainsPower(self, reqJsonStr):
-        respStr = json.dumps({'result': 'failed'})
+    def setTrainsPower(self, reqDict):
+        respDict = {'result': 'failed'}
         try:
-            reqDict = json.loads(reqJsonStr)
             if gv.iMapMgr:
                 for key, val in reqDict.items():
                     gv.iMapMgr.setTainsPower(key, val)
-                respStr = json.dumps({'result': 'success'})
+                respDict = {'result': 'success'}
         except Exception as err:
             gv.gDebugPrint("setTrainsPower() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
-        return respStr
+        return respDict
 
     #-----------------------------------------------------------------------------
     # define() all the update function here, update function will update the local 
@@ -289,6 +420,7 @@ class DataManager(threading.Thread):
     def stop(self):
         """ Stop the thread."""
         self.terminate = True
+        if self.pool: self.pool.stop()
         if self.server: self.server.serverStop()
         endClient = udpCom.udpClient(('127.0.0.1', gv.UDP_PORT))
         endClient.disconnect()
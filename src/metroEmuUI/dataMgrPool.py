@@ -0,0 +1,292 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        dataMgrPool.py
+#
+# Purpose:     This module will provide a multi-process UDP server pool for the
+#              data manager, N worker processes bind the same UDP port with the
+#              SO_REUSEPORT option to handle the PLCs' requests parallel with the
+#              UI/simulation process.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2023/07/31
+# Version:     v_0.1
+# Copyright:   Copyright (c) 2023 Singapore National Cybersecurity R&D Lab LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+""" Program Design:
+
+    The kernel distributes the incoming datagrams to all the sockets bound on the
+    port with SO_REUSEPORT (by the source address hash, so one PLC always talks to
+    the same process).
+    - The read-only GET (login/sensors/stations/trains) requests are answered by the
+        worker from the state snapshot in the shared memory, the simulation process
+        writes the snapshot after every MapMgr.periodic().
+    - The other requests (POST/SUB/UNSUB/batch) are forwarded to the simulation
+        process by a queue and handled by the DataManager.handleRequest(), the worker
+        runs the asyncio UDP server so a forwarded request waiting for its reply
+        doesn't block the other PLCs' requests.
+    The worker processes are started by the 'spawn' method, so they will not copy
+    the wx UI process state.
+"""
+
+import time
+import json
+import queue
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future, TimeoutError
+
+import Log
+import udpCom
+import realWorldCodec
+
+SNAPSHOT_SZ = 1 << 16   # shared memory size for the state snapshot json bytes.
+FORWARD_TO = 2          # worker waits the forwarded request's reply in 2 sec.
+STATE_TYPES = ('sensors', 'stations', 'trains')
+
+# Define all the module local untility functions here:
+#-----------------------------------------------------------------------------
+def parseIncomeMsg(msg):
+    """ parse the income message to tuple with 3 elements: request key, type and jsonString
+        Args: msg (str): example: 'GET;dataType;{"user":"<username>"}'
+    """
+    req = msg.decode('UTF-8') if not isinstance(msg, str) else msg
+    try:
+        reqKey, reqType, reqJsonStr = req.split(';', 2)
+        return (reqKey.strip(), reqType.strip(), reqJsonStr)
+    except Exception as err:
+        Log.error('parseIncomeMsg(): The income message format is incorrect.')
+        Log.exception(err)
+        return('','',json.dumps({}))
+
+def buildLoginReply(reqDict):
+    """ Build the PLC login reply dict and negotiate the message codec."""
+    respDict = {'state':'ready', 'batch': True, 'sub': True}
+    if realWorldCodec.CODEC_BIN in reqDict.get('codec', []):
+        respDict['codec'] = realWorldCodec.CODEC_BIN
+    return respDict
+
+def buildReply(msg, handleFunc, address=None):
+    """ Decode the PLC's request, handle it and encode the reply.
+        Args:
+            msg (bytes): incoming request (text or binary codec message).
+            handleFunc (function): handleFunc(reqKey, reqType, reqDict, address=address)
+                returns (respType, respDict), 'deny' respType means not supported.
+            address (tuple, optional): PLC's UDP address.
+        Returns:
+            bytes: reply message bytes.
+    """
+    # binary codec message: reply in the binary codec, if the reply data can
+    # not be encoded in binary, reply under text format.
+    if realWorldCodec.isBinMsg(msg):
+        try:
+            (reqKey, reqType, reqDict) = realWorldCodec.decodeMsg(msg)
+        except Exception as err:
+            Log.error("buildReply() binary message Error: %s" %str(err))
+            return b'REP;deny;{}'
+        respType, respDict = handleFunc(reqKey, reqType, reqDict, address=address)
+        if respType == 'deny': return b'REP;deny;{}'
+        try:
+            return realWorldCodec.encodeMsg('REP', respType, respDict)
+        except ValueError:
+            return ';'.join(('REP', respType, json.dumps(respDict))).encode('utf-8')
+    # request message format:
+    # data fetch: GET:<key>:<val1>:<val2>...
+    # data set: POST:<key>:<val1>:<val2>...
+    resp = b'REP;deny;{}'
+    (reqKey, reqType, reqJsonStr) = parseIncomeMsg(msg)
+    try:
+        reqDict = json.loads(reqJsonStr)
+    except Exception as err:
+        Log.error("buildReply() Error: %s" %str(err))
+        reqDict = None
+    if isinstance(reqDict, dict):
+        respType, respDict = handleFunc(reqKey, reqType, reqDict, address=address)
+        if respType != 'deny': resp = ';'.join(('REP', respType, json.dumps(respDict)))
+    if isinstance(resp, str): resp = resp.encode('utf-8')
+    return resp
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class stateSnapshot(object):
+    """ Realworld state snapshot in the shared memory, written by the simulation
+        process and read by the worker processes.
+    """
+    def __init__(self, ctx):
+        self.lock = ctx.Lock()
+        self.buffer = ctx.RawArray('B', SNAPSHOT_SZ)
+        self.length = ctx.RawValue('I', 0)
+        self.version = ctx.RawValue('L', 0)
+        # last fetch time of each state type, used to check the PLC online state.
+        self.fetchTimes = ctx.RawArray('d', len(STATE_TYPES))
+        self.cacheVersion = -1  # process local parsed snapshot cache.
+        self.cacheDict = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['cacheVersion'], state['cacheDict'] = -1, {}
+        return state
+
+    def write(self, stateDict):
+        """ Write the state dict {'sensors': {...}, 'stations': {...}, ...}."""
+        data = json.dumps(stateDict).encode('utf-8')
+        if len(data) > SNAPSHOT_SZ:
+            Log.error("stateSnapshot: snapshot size %s is bigger than the buffer." %str(len(data)))
+            return False
+        with self.lock:
+            self.buffer[:len(data)] = data
+            self.length.value = len(data)
+            self.version.value += 1
+        return True
+
+    def read(self):
+        """ Read the state dict, the parsed dict is cached until the next write."""
+        with self.lock:
+            if self.version.value == self.cacheVersion: return self.cacheDict
+            data = bytes(self.buffer[:self.length.value])
+            self.cacheVersion = self.version.value
+        self.cacheDict = json.loads(data) if data else {}
+        return self.cacheDict
+
+    def markFetch(self, stateType):
+        self.fetchTimes[STATE_TYPES.index(stateType)] = time.time()
+
+    def getFetchTime(self, stateType):
+        return self.fetchTimes[STATE_TYPES.index(stateType)]
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class dataWorker(object):
+    """ UDP server worker running in the sub process."""
+    def __init__(self, workerID, port, snapshot, rqstQueue, replyQueue):
+        self.workerID = workerID
+        self.snapshot = snapshot
+        self.rqstQueue = rqstQueue
+        self.replyQueue = replyQueue
+        self.tag = 0    # forwarded request tag, used to match the replies.
+        self.pending = {}   # forwarded requests, key: tag, val: reply future.
+        self.tagLock = threading.Lock()
+        self.replyThread = threading.Thread(target=self._replyLoop, daemon=True)
+        self.server = udpCom.udpAsyncServer(None, port, reusePort=True)
+
+    def handleRequest(self, reqKey, reqType, reqDict, address=None):
+        """ Answer the GET request from the snapshot, forward the others."""
+        if reqKey == 'GET':
+            if reqType == 'login':
+                return ('login', buildLoginReply(reqDict))
+            elif reqType in STATE_TYPES:
+                stateDict = self.snapshot.read().get(reqType)
+                if stateDict is None: return (reqType, {'result': 'failed'})
+                self.snapshot.markFetch(reqType)
+                for key in reqDict.keys():
+                    if key in stateDict.keys(): reqDict[key] = stateDict[key]
+                return (reqType, reqDict)
+        return self.forwardRequest(reqKey, reqType, reqDict, address)
+
+    def forwardRequest(self, reqKey, reqType, reqDict, address):
+        """ Forward the request to the simulation process and wait for the reply (called
+            in the server's handler threads, several requests can be in flight).
+        """
+        future = Future()
+        with self.tagLock:
+            self.tag += 1
+            tag = self.tag
+            self.pending[tag] = future
+        self.rqstQueue.put((self.workerID, tag, reqKey, reqType, reqDict, address))
+        try:
+            return future.result(timeout=FORWARD_TO)
+        except TimeoutError:
+            Log.warning("dataWorker: forwarded request %s time out." %str((reqKey, reqType)))
+            return (reqType, {'result': 'failed'})
+        finally:
+            with self.tagLock:
+                self.pending.pop(tag, None)
+
+    def _replyLoop(self):
+        """ Match the simulation process' replies to the forwarded requests."""
+        while True:
+            item = self.replyQueue.get()
+            if item is None: break
+            tag, respType, respDict = item
+            with self.tagLock:
+                future = self.pending.get(tag)
+            # drop the late reply of the timeout request.
+            if future is not None and not future.done(): future.set_result((respType, respDict))
+
+    def msgHandler(self, msg, address=None):
+        if msg == b'': return None
+        return buildReply(msg, self.handleRequest, address=address)
+
+    def run(self):
+        self.replyThread.start()
+        self.server.serverStart(handler=self.msgHandler, withAddr=True)
+
+def runWorker(workerID, port, snapshot, rqstQueue, replyQueue):
+    """ Sub process entry function."""
+    worker = dataWorker(workerID, port, snapshot, rqstQueue, replyQueue)
+    worker.run()
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class dataMgrPool(object):
+    """ Multi-process UDP server pool, init example:
+        pool = dataMgrPool(dataMgr.handleRequest, 3001, workerNum=4)
+    """
+    def __init__(self, handleFunc, port, workerNum=2):
+        self.handleFunc = handleFunc
+        self.port = port
+        self.workerNum = workerNum
+        self.ctx = mp.get_context('spawn')
+        self.snapshot = stateSnapshot(self.ctx)
+        self.rqstQueue = self.ctx.Queue()
+        self.replyQueues = [self.ctx.Queue() for _ in range(workerNum)]
+        self.workers = []
+        self.terminate = False
+        self.forwardThread = threading.Thread(target=self._forwardLoop, daemon=True)
+
+    def start(self):
+        """ Start the worker processes, returns False if the OS doesn't support
+            SO_REUSEPORT.
+        """
+        if not udpCom.isReusePortSupported():
+            Log.warning("dataMgrPool: SO_REUSEPORT is not supported, pool not started.")
+            return False
+        for i in range(self.workerNum):
+            proc = self.ctx.Process(target=runWorker, daemon=True,
+                                    args=(i, self.port, self.snapshot, self.rqstQueue, self.replyQueues[i]))
+            proc.start()
+            self.workers.append(proc)
+        self.forwardThread.start()
+        Log.info("dataMgrPool: started %s UDP worker processes." %str(self.workerNum))
+        return True
+
+    def _forwardLoop(self):
+        """ Handle the requests forwarded from the workers."""
+        while not self.terminate:
+            try:
+                item = self.rqstQueue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if item is None: break
+            workerID, tag, reqKey, reqType, reqDict, address = item
+            try:
+                respType, respDict = self.handleFunc(reqKey, reqType, reqDict, address=address)
+            except Exception as err:
+                Log.error("dataMgrPool: forwarded request error: %s" %str(err))
+                respType, respDict = 'deny', {}
+            self.replyQueues[workerID].put((tag, respType, respDict))
+
+    def updateSnapshot(self, stateDict):
+        return self.snapshot.write(stateDict)
+
+    def getFetchTime(self, stateType):
+        return self.snapshot.getFetchTime(stateType)
+
+    def stop(self):
+        self.terminate = True
+        self.rqstQueue.put(None)
+        if self.forwardThread.is_alive(): self.forwardThread.join(timeout=2)
+        for proc in self.workers:
+            proc.terminate()
+        self.workers = []
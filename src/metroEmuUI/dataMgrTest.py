@@ -0,0 +1,413 @@
+#-----------------------------------------------------------------------------
+# Name:        dataMgrTest.py
+#
+# Purpose:     testcase program used to test the realworld emulator's data manager
+#              <dataMgr.py> and its UDP worker pool <dataMgrPool.py>.
+#              The config file configFiles/metroConfig.txt needs to be created
+#              (copy from metroConfig_template.txt) before run the test.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2023/08/03
+# Version:     v_0.1
+# Copyright:   Copyright (c) 2023 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+
+import time
+import json
+import queue
+import socket
+import threading
+import multiprocessing as mp
+
+import metroEmuGobal as gv
+import realWorldCodec
+import udpCom
+import plcSimulator
+import dataMgr
+import dataMgrPool
+
+TRACK_IDS = ('weline', 'nsline', 'ccline', 'mtline')
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class testSensorAgent(object):
+    """ Sensors agent fixture which returns the state list of the map manager fixture."""
+    def __init__(self, stateList):
+        self.stateList = stateList
+
+    def getSensorsState(self):
+        return self.stateList
+
+class testRailwayMgr(object):
+    """
+    Map manager fixture used to replace the <railwayMgr.MapMgr> (which needs the wx
+    UI), the components state are kept in the lists which can be changed by the
+    test cases.
+    """
+    def __init__(self):
+        self.sensors = {key: [0]*16 for key in TRACK_IDS}
+        self.signals = {}
+
+    def getSensors(self, trackID=None):
+        return testSensorAgent(self.sensors[trackID])
+
+    def getStations(self, trackID=None):
+        return []
+
+    def getTrains(self, trackID=None):
+        return []
+
+    def setSingals(self, trackID, signalStatList):
+        self.signals[trackID] = signalStatList
+
+class testPlcParent(object):
+    """ PLC fixture which provides the PLC ID to the realworld connector."""
+    def getPlcID(self):
+        return 'PLC-TEST'
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class testDataManager(dataMgr.DataManager):
+    """
+    A subclass that inherits from the dataMgr.DataManager class, the incoming messages
+    are passed to the msgHandler() directly without the UDP server.
+
+    Unit Test Methods:
+        loginCodecTest(): Checks the binary codec negotiation in the login reply.
+        textFallbackTest(): Checks the binary request whose reply can not be encoded in
+            binary is replied under the text format.
+        malformedMsgTest(): Checks the malformed binary request is denied.
+        batchEnvelopeTest(): Sends a batch request by the plcSimulator connector to the 
+            running data manager and checks every sub request's reply.
+        subscribeTest(): Checks the SUB/UNSUB reply and the PLC online time update.
+        publishTest(): Checks the state push (delta/keyframe) after the state changes.
+    """
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.address = ('127.0.0.1', 5000)
+        # subscriber socket to receive the state push.
+        self.subSock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.subSock.bind(('127.0.0.1', 0))
+        self.subSock.settimeout(0.2)
+
+    def request(self, msg):
+        """ Handle the request message and decode the reply to (reqKey, reqType, dataDict)."""
+        resp = self.msgHandler(msg, address=self.address)
+        if realWorldCodec.isBinMsg(resp): return realWorldCodec.decodeMsg(resp)
+        reqKey, reqType, reqJsonStr = dataMgrPool.parseIncomeMsg(resp)
+        return (reqKey, reqType, json.loads(reqJsonStr))
+
+    def loginCodecTest(self, codecList, expectedOutput, testID):
+        """
+        Performs a unit test for the login codec negotiation of the handleRequest().
+        Args:
+            codecList (list): codecs in the PLC's login request, None if not set.
+            expectedOutput (str): expected 'codec' in the login reply, None if not set.
+            testID (int): The third argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        rqstDict = {} if codecList is None else {'codec': codecList}
+        _, respType, respDict = self.request(';'.join(('GET', 'login', json.dumps(rqstDict))).encode('utf-8'))
+        actualOutput = respDict.get('codec')
+        assert respType == 'login' and respDict['state'] == 'ready', f"[ ] Test {testID}: handleRequest() login failed"
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: handleRequest() login failed"
+        print(f"[x] Test {testID}: handleRequest() login passed")
+
+    def textFallbackTest(self, msg, expectedOutput, testID):
+        """
+        Performs a unit test for the buildReply() text format fallback, the binary request's
+        reply is sent under the text format if the realWorldCodec.encodeMsg() raises
+        ValueError.
+        Args:
+            msg (bytes): binary request message.
+            expectedOutput (tuple): expected decoded reply (reqKey, reqType, dataDict).
+            testID (int): The third argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        resp = self.msgHandler(msg, address=self.address)
+        assert not realWorldCodec.isBinMsg(resp), f"[ ] Test {testID}: buildReply() text fallback failed"
+        actualOutput = self.request(msg)
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: buildReply() text fallback failed"
+        print(f"[x] Test {testID}: buildReply() text fallback passed")
+
+    def malformedMsgTest(self, msgList, testID):
+        """
+        Performs a unit test for the malformed binary request, the buildReply() replies
+        'REP;deny;{}' instead of raising the decode error.
+        Args:
+            msgList (list): malformed binary request messages.
+            testID (int): The second argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If a malformed message is not denied.
+        """
+        for msg in msgList:
+            actualOutput = self.msgHandler(msg, address=self.address)
+            assert actualOutput == b'REP;deny;{}', f"[ ] Test {testID}: buildReply() malformed message failed"
+        print(f"[x] Test {testID}: buildReply() malformed message passed")
+
+    def batchEnvelopeTest(self, connector, rqstList, expectedOutput, testID):
+        """
+        Performs an end to end test of the batch request: the plcSimulator connector's 
+        queryBatchAsync() => UDP => DataManager.handleBatch() => reply futures.
+        Args:
+            connector (plcSimulator.RealWorldAsyncConnector): connector logged in the 
+                running data manager.
+            rqstList (list): batch request list [(rqstKey, rqstType, rqstDict), ...].
+            expectedOutput (list): expected reply tuples under the request sequence.
+            testID (int): The fourth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        assert connector.isBatchSupported(), f"[ ] Test {testID}: handleBatch() failed"
+        futureList = connector.queryBatchAsync(rqstList)
+        actualOutput = [future.result(timeout=plcSimulator.RQST_TO * 2) for future in futureList]
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: handleBatch() failed"
+        print(f"[x] Test {testID}: handleBatch() passed")
+
+    def recvPush(self):
+        """ Receive and decode the state push, None if no push."""
+        try:
+            msg, _ = self.subSock.recvfrom(udpCom.BUFFER_SZ)
+        except socket.timeout:
+            return None
+        if realWorldCodec.isBinMsg(msg): return realWorldCodec.decodeMsg(msg)
+        reqKey, reqType, reqJsonStr = dataMgrPool.parseIncomeMsg(msg)
+        return (reqKey, reqType, json.loads(reqJsonStr))
+
+    def subscribeTest(self, reqKey, rqstDict, expectedOutput, testID):
+        """
+        Performs a unit test for the SUB/UNSUB request of the handleRequest(), the SUB
+        (and its renew) marks the sensor PLC online.
+        Args:
+            reqKey (str): SUB/UNSUB.
+            rqstDict (dict): subscription request dict.
+            expectedOutput (tuple): expected reply (respType, respDict).
+            testID (int): The fourth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        preUpdateT = self.sensorPlcUpdateT
+        actualOutput = self.handleRequest(reqKey, 'sensors', dict(rqstDict), address=self.subSock.getsockname())
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: handleRequest() {reqKey} failed"
+        if reqKey == 'SUB':
+            assert self.sensorPlcUpdateT > preUpdateT, f"[ ] Test {testID}: handleRequest() {reqKey} failed"
+        print(f"[x] Test {testID}: handleRequest() {reqKey} passed")
+
+    def publishTest(self, changeDict, expectedOutput, testID, keyframe=False, expire=False):
+        """
+        Performs a unit test for the publishState(), the publish doesn't change the 
+        PLC online time.
+        Args:
+            changeDict (dict): sensors state changes {trackID: {idx: state}}.
+            expectedOutput (tuple): expected push (reqKey, reqType, pushDict), None if 
+                nothing is pushed.
+            testID (int): The third argument representing the ID tagged to this test run.
+            keyframe (bool): make the subscription's keyframe interval time out.
+            expire (bool): make the subscription expired.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        for trackID, stateDict in changeDict.items():
+            for idx, state in stateDict.items(): gv.iMapMgr.sensors[trackID][idx] = state
+        with self.subLock:
+            for record in self.subscribers.values():
+                if keyframe: record['keyframeT'] -= dataMgr.KEYFRAME_INT
+                if expire: record['expire'] = 0
+        preUpdateT = self.sensorPlcUpdateT
+        self.publishState()
+        actualOutput = self.recvPush()
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: publishState() failed"
+        assert self.sensorPlcUpdateT == preUpdateT, f"[ ] Test {testID}: publishState() failed"
+        print(f"[x] Test {testID}: publishState() passed")
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class testDataMgrPool(object):
+    """
+    Test cases of the data manager's UDP worker pool <dataMgrPool.py>.
+
+    Unit Test Methods:
+        snapshotTest(): Checks the state snapshot write/read and the parsed cache.
+        forwardTest(): Checks the forwarded requests are in flight at the same time
+            and every reply is matched to its request by the tag.
+        poolRequestTest(): Sends the request to the running worker processes.
+    """
+    def __init__(self, handleFunc, port):
+        self.handleFunc = handleFunc
+        self.port = port
+        self.pool = None
+        self.client = None
+
+    def snapshotTest(self, stateDict, testID):
+        """
+        Performs a unit test for the stateSnapshot write()/read(), the read() returns 
+        the cached dict until the next write() and the oversize state is not written.
+        Args:
+            stateDict (dict): state dict to write.
+            testID (int): The second argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        snapshot = dataMgrPool.stateSnapshot(mp.get_context('spawn'))
+        assert snapshot.read() == {}, f"[ ] Test {testID}: stateSnapshot() failed"
+        assert snapshot.write(stateDict), f"[ ] Test {testID}: stateSnapshot() failed"
+        actualOutput = snapshot.read()
+        assert actualOutput == stateDict and snapshot.read() is actualOutput, f"[ ] Test {testID}: stateSnapshot() failed"
+        assert not snapshot.write({'sensors': 'x' * dataMgrPool.SNAPSHOT_SZ}), f"[ ] Test {testID}: stateSnapshot() failed"
+        assert snapshot.read() == stateDict, f"[ ] Test {testID}: stateSnapshot() failed"
+        print(f"[x] Test {testID}: stateSnapshot() passed")
+
+    def forwardTest(self, rqstNum, testID):
+        """
+        Performs a unit test for the dataWorker.forwardRequest(), <rqstNum> POST requests
+        are forwarded from several handler threads, the simulation side replies them in 
+        the reverse order after a late reply of an unknown tag.
+        Args:
+            rqstNum (int): number of the forwarded requests.
+            testID (int): The second argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        rqstQueue, replyQueue = queue.Queue(), queue.Queue()
+        worker = dataMgrPool.dataWorker(0, self.port, None, rqstQueue, replyQueue)
+        worker.replyThread.start()
+        results = {}
+        def forward(idx):
+            results[idx] = worker.handleRequest('POST', 'signals', {'weline': [idx]})
+        threads = [threading.Thread(target=forward, args=(i,)) for i in range(rqstNum)]
+        startT = time.monotonic()
+        for t in threads: t.start()
+        rqstList = [rqstQueue.get(timeout=1) for _ in range(rqstNum)]
+        replyQueue.put((-1, 'signals', {'result': 'failed'}))
+        for (_, tag, _, reqType, reqDict, _) in reversed(rqstList):
+            replyQueue.put((tag, reqType, {'result': 'success', 'idx': reqDict['weline'][0]}))
+        for t in threads: t.join()
+        replyQueue.put(None)
+        worker.replyThread.join()
+        actualOutput = [results[i] for i in range(rqstNum)]
+        expectedOutput = [('signals', {'result': 'success', 'idx': i}) for i in range(rqstNum)]
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: forwardRequest() failed"
+        assert time.monotonic() - startT < dataMgrPool.FORWARD_TO, f"[ ] Test {testID}: forwardRequest() failed"
+        assert not worker.pending, f"[ ] Test {testID}: forwardRequest() failed"
+        print(f"[x] Test {testID}: forwardRequest() passed")
+
+    def startPool(self, stateDict, workerNum=2):
+        """ Start the worker processes and wait until they answer the login."""
+        self.pool = dataMgrPool.dataMgrPool(self.handleFunc, self.port, workerNum=workerNum)
+        self.pool.start()
+        self.pool.updateSnapshot(stateDict)
+        self.client = udpCom.udpClient(('127.0.0.1', self.port))
+        self.client.setTimeOut(timeoutT=1)
+        for _ in range(20):
+            if self.client.sendMsg(b'GET;login;{}', resp=True): return True
+        return False
+
+    def poolRequestTest(self, msg, expectedOutput, testID):
+        """
+        Performs a unit test for the worker processes, the GET request is answered from
+        the snapshot and the others are forwarded to the handleFunc.
+        Args:
+            msg (bytes): request message.
+            expectedOutput (tuple): expected reply (reqKey, reqType, dataDict).
+            testID (int): The third argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        resp = self.client.sendMsg(msg, resp=True)
+        reqKey, reqType, reqJsonStr = dataMgrPool.parseIncomeMsg(resp)
+        actualOutput = (reqKey, reqType, json.loads(reqJsonStr))
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: dataWorker() failed"
+        print(f"[x] Test {testID}: dataWorker() passed")
+
+    def stopPool(self):
+        self.client.disconnect()
+        self.pool.stop()
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def createTestObjects():
+    gv.iMapMgr = testRailwayMgr()
+    dataManager = testDataManager(None)
+    return dataManager
+
+def runTestCases(dataManager):
+    print("========================== Running Test Cases for Realworld Data Manager ==========================")
+    print("(Data Manager Message Codec Test Cases)")
+    dataManager.loginCodecTest([realWorldCodec.CODEC_BIN], realWorldCodec.CODEC_BIN, 1)
+    dataManager.loginCodecTest(None, None, 2)
+    dataManager.loginCodecTest(['json'], None, 3)
+    # the login reply dict is not a track state dict, it can not be encoded in binary.
+    dataManager.textFallbackTest(realWorldCodec.encodeMsg('GET', 'login', {}),
+                                 ('REP', 'login', {'state': 'ready', 'batch': True, 'sub': True}), 4)
+    goodMsg = realWorldCodec.encodeMsg('GET', 'sensors', {'weline': None, 'nsline': None})
+    dataManager.malformedMsgTest([goodMsg[:4], goodMsg[:-1],
+                                  bytes([realWorldCodec.BIN_FLG | 0x0F, 1, 0]),
+                                  bytes([realWorldCodec.BIN_FLG | 0x01, 1, 1, 9, 0xFF, 0xFF])], 5)
+    print("\n(Data Manager Subscription Test Cases)")
+    zeroState = [0]*16
+    oneState = [1] + [0]*15
+    dataManager.subscribeTest('SUB', {'weline': None, 'nsline': None}, 
+                              ('sensors', {'seq': 0, 'keyframe': True, 'data': {'weline': zeroState, 'nsline': zeroState}}), 1)
+    # the first publish has no last published state, all the tracks are pushed.
+    dataManager.publishTest({}, ('PUB', 'sensors', {'seq': 1, 'keyframe': False, 
+                                                    'data': {'weline': zeroState, 'nsline': zeroState}}), 2)
+    # only the changed track is pushed.
+    dataManager.publishTest({'weline': {0: 1}}, 
+                            ('PUB', 'sensors', {'seq': 2, 'keyframe': False, 'data': {'weline': oneState}}), 3)
+    # the not subscribed track change is not pushed.
+    dataManager.publishTest({'ccline': {0: 1}}, None, 4)
+    dataManager.publishTest({}, ('PUB', 'sensors', {'seq': 3, 'keyframe': True, 
+                                                    'data': {'weline': oneState, 'nsline': zeroState}}), 5, keyframe=True)
+    # the binary codec SUB renew keeps the seq.
+    dataManager.subscribeTest('SUB', {'weline': None, 'codec': [realWorldCodec.CODEC_BIN]}, 
+                              ('sensors', {'seq': 3, 'keyframe': True, 'data': {'weline': oneState}}), 6)
+    dataManager.publishTest({'weline': {0: 0}}, 
+                            ('PUB', 'sensors', {'seq': 4, 'keyframe': False, 'data': {'weline': zeroState}}), 7)
+    dataManager.publishTest({'weline': {1: 1}}, None, 8, expire=True)
+    dataManager.subscribeTest('SUB', {'weline': None}, 
+                              ('sensors', {'seq': 0, 'keyframe': True, 'data': {'weline': [0, 1] + [0]*14}}), 9)
+    dataManager.subscribeTest('UNSUB', {}, ('sensors', {'result': 'success'}), 10)
+    dataManager.publishTest({'weline': {1: 0}}, None, 11)
+    print("\n(Data Manager Batch Request Test Cases)")
+    dataManager.start()
+    time.sleep(1.5)
+    connector = plcSimulator.RealWorldAsyncConnector(testPlcParent(), ('127.0.0.1', gv.UDP_PORT))
+    sensorsRep = ('REP', 'sensors', {'weline': [0]*16})
+    successRep = ('REP', 'signals', {'result': 'success'})
+    # mixed GET/POST in the binary codec.
+    dataManager.batchEnvelopeTest(connector, [('POST', 'signals', {'weline': [1, 0]}),
+                                              ('GET', 'sensors', {'weline': None})], 
+                                  [successRep, sensorsRep], 1)
+    # the not supported sub request is denied, the others are still handled.
+    dataManager.batchEnvelopeTest(connector, [('GET', 'sensors', {'weline': None}),
+                                              ('GET', 'signals', {'weline': None}),
+                                              ('POST', 'signals', {'nsline': [1]})], 
+                                  [sensorsRep, ('REP', 'deny', {}), successRep], 2)
+    # more than 255 entries can not be encoded in binary, sent under the text format
+    # and the reply is sent by the big message chunks.
+    dataManager.batchEnvelopeTest(connector, [('GET', 'sensors', {'weline': None})]*300,
+                                  [sensorsRep]*300, 3)
+    connector.stop()
+    dataManager.stop()
+    dataManager.subSock.close()
+    print("\n(Data Manager Worker Pool Test Cases)")
+    poolTester = testDataMgrPool(dataManager.handleRequest, gv.UDP_PORT + 1)
+    poolTester.snapshotTest({'sensors': {'weline': [1, 0, 1]}, 'trains': {'weline': [1]}}, 1)
+    poolTester.forwardTest(4, 2)
+    assert poolTester.startPool({'sensors': {'weline': [1, 0, 1]}}), "[ ] Test 3: dataMgrPool() start failed"
+    poolTester.poolRequestTest(b'GET;login;{"codec": ["bin"]}', 
+                               ('REP', 'login', {'state': 'ready', 'batch': True, 'sub': True, 'codec': 'bin'}), 3)
+    poolTester.poolRequestTest(b'GET;sensors;{"weline": null, "nsline": null}', 
+                               ('REP', 'sensors', {'weline': [1, 0, 1], 'nsline': None}), 4)
+    # the POST is forwarded to the data manager.
+    poolTester.poolRequestTest(b'POST;signals;{"weline": [1, 0]}', ('REP', 'signals', {'result': 'success'}), 5)
+    poolTester.poolRequestTest(b'GET;signals;{}', ('REP', 'deny', {}), 6)
+    poolTester.stopPool()
+
+if __name__ == '__main__':
+    dataManager = createTestObjects()
+    runTestCases(dataManager)
@@ -123,6 +123,12 @@ gJuncAvoid = CONFIG_DICT['JUNC_AVOID']      # Auto correct juction state.
 gDockTime = int(CONFIG_DICT['DOCK_TIME'])
 
 gPlcTimeout = int(CONFIG_DICT['PLC_TIMEOUT'])
+# Use the asyncio UDP server to handle the PLCs' request concurrently.
+gUdpAsync = CONFIG_DICT['UDP_ASYNC'] if 'UDP_ASYNC' in CONFIG_DICT.keys() else False
+# Number of the UDP worker processes (bind the UDP port with SO_REUSEPORT), 0: disable.
+gUdpWorkers = int(CONFIG_DICT['UDP_WORKERS']) if 'UDP_WORKERS' in CONFIG_DICT.keys() else 0
+# Number of the blocking UDP server's handler threads, 0: handle in the receive loop.
+gUdpHandlerThreads = int(CONFIG_DICT['UDP_HANDLER_THREADS']) if 'UDP_HANDLER_THREADS' in CONFIG_DICT.keys() else 0
 
 gTrackConfig = OrderedDict()
 #gCollsionTestFlg = CONFIG_DICT['TEST_JC_COLLISION'] # flag used to enable test the train collision at the junction.
@@ -25,6 +25,7 @@ from collections import OrderedDict
 import plcSimGlobalSignal as gv
 import modbusTcpCom
 import plcSimulator
+import ladderCompiler
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -75,26 +76,8 @@ class tFlipFlopLadderLogic(modbusTcpCom.ladderLogic):
             {'coilIdx': 17, 'onRegIdx': (weIdxOffSet+3, weIdxOffSet+13), 'offRegIdx': (weIdxOffSet+4, weIdxOffSet+14)},
             {'coilIdx': 18, 'onRegIdx': (weIdxOffSet+1, weIdxOffSet+15), 'offRegIdx': (weIdxOffSet+2, weIdxOffSet+16)}
         ]
-
-#-----------------------------------------------------------------------------
-    def _tfligFlogRun(self, coilState, toggleOnList, toggleOffList):
-        """ Function to simulate a normal t-flip-flop latching replay to take input
-            and calculate the output based on the current state. If there is N register
-            state changed, this ladder logic will execute N times.
-            Args:
-                coilState (int/bool): Current output State. 
-                toggleOnList (list(int/bool)): input registers's state list which can toggle
-                    the relay on.
-                toggleOffList (list(int/bool)): input registers's state list which can toggle
-                    the relay off.
-            Returns:
-                bool: the filp-flop positive output.
-        """
-        if coilState: 
-            if 1 in toggleOffList or True in toggleOffList: return False 
-        else:
-            if 1 in toggleOnList or True in toggleOnList: return True
-        return coilState
+        # compile the flip-flop config to the bitmasks engine.
+        self.ffEngine = ladderCompiler.flipFlopEngine(self.ffConfig, self.holdingRegsInfo['offset'])
 
 #-----------------------------------------------------------------------------
     def runLadderLogic(self, regsList, coilList=None):
@@ -104,11 +87,7 @@ class tFlipFlopLadderLogic(modbusTcpCom.ladderLogic):
             gv.gDebugPrint("Input registers list: %s" %str(regsList), logType=gv.LOG_INFO)
             gv.gDebugPrint("Input coils list: %s" %str(coilList), logType=gv.LOG_INFO)
         else:
-            for item in self.ffConfig:
-               coilState = coilList[item['coilIdx']]
-               onRegListState = [regsList[i] for i in item['onRegIdx']]
-               offRegListState = [regsList[i] for i in item['offRegIdx']]
-               coilsRsl.append(self._tfligFlogRun(coilState, onRegListState, offRegListState) ) 
+            coilsRsl = self.ffEngine.run(regsList, coilList)
         gv.gDebugPrint('Finished calculate all coils: %s' %str(coilsRsl), logType=gv.LOG_INFO)
         return coilsRsl
         
@@ -116,8 +95,8 @@ class tFlipFlopLadderLogic(modbusTcpCom.ladderLogic):
 #-----------------------------------------------------------------------------
 class signalPlcSet(plcSimulator.plcSimuInterface):
 
-    def __init__(self, parent, plcID, addressInfoDict, ladderObj, updateInt=0.6):
-        super().__init__(parent, plcID, addressInfoDict, ladderObj, updateInt=updateInt)
+    def __init__(self, parent, plcID, addressInfoDict, ladderObj, updateInt=0.6, **kwargs):
+        super().__init__(parent, plcID, addressInfoDict, ladderObj, updateInt=updateInt, **kwargs)
 
     def initInputState(self):
         self.regsAddrs = (0, 39)
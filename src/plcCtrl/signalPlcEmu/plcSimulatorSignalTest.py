@@ -0,0 +1,133 @@
+#-----------------------------------------------------------------------------
+# Name:        plcSimulatorSignalTest.py
+#
+# Purpose:     testcase program used to test the signal PLC's T-flip-flop ladder
+#              logic <plcSimulatorSignal.py>, the compiled lib<ladderCompiler.py>
+#              engine's result is compared with the original item by item ladder
+#              calculation on the signal PLC's flip-flop config.
+#              The config file plcConfig.txt needs to be created (copy from
+#              plcConfig_template.txt) before run the test.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2023/08/03
+# Version:     v_0.1
+# Copyright:   Copyright (c) 2023 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+
+import random
+
+import plcSimGlobalSignal as gv
+import plcSimulatorSignal
+
+REGS_NUM = 39
+COILS_NUM = 19
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class testFlipFlopLadderLogic(plcSimulatorSignal.tFlipFlopLadderLogic):
+    """
+    A subclass that inherits from the plcSimulatorSignal.tFlipFlopLadderLogic class,
+    the original (before the ladder compiler) item by item flip-flop calculation is
+    kept as the reference.
+
+    Unit Test Methods:
+        singleRegTest(): Checks every single register pulse under all the coils off
+            and all the coils on state.
+        randomScanTest(): Checks the random registers and coils states.
+        ladderRunTest(): Checks the runLadderLogic() uses the compiled engine result.
+    """
+    def __init__(self, parent, ladderName) -> None:
+        super().__init__(parent, ladderName=ladderName)
+
+    def _tfligFlogRun(self, coilState, toggleOnList, toggleOffList):
+        if coilState:
+            if 1 in toggleOffList or True in toggleOffList: return False
+        else:
+            if 1 in toggleOnList or True in toggleOnList: return True
+        return coilState
+
+    def runLadderLogicRef(self, regsList, coilList):
+        coilsRsl = []
+        for item in self.ffConfig:
+            coilState = coilList[item['coilIdx']]
+            onRegListState = [regsList[i] for i in item['onRegIdx']]
+            offRegListState = [regsList[i] for i in item['offRegIdx']]
+            coilsRsl.append(self._tfligFlogRun(coilState, onRegListState, offRegListState))
+        return coilsRsl
+
+    def singleRegTest(self, testID):
+        """
+        Performs a unit test for the flipFlopEngine.run(), every register is set alone
+        with all the coils off and all the coils on.
+        Args:
+            testID (int): The first argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        for coilState in (False, True):
+            coilList = [coilState]*COILS_NUM
+            for regIdx in range(REGS_NUM):
+                regsList = [0]*REGS_NUM
+                regsList[regIdx] = 1
+                expectedOutput = self.runLadderLogicRef(regsList, coilList)
+                actualOutput = self.ffEngine.run(regsList, coilList)
+                assert actualOutput == expectedOutput, f"[ ] Test {testID}: flipFlopEngine single register {regIdx} failed"
+        print(f"[x] Test {testID}: flipFlopEngine single register passed")
+
+    def randomScanTest(self, loopNum, testID):
+        """
+        Performs a unit test for the flipFlopEngine.run() with random registers/coils
+        states (registers in int, coils in bool as the PLC data handler passes them).
+        Args:
+            loopNum (int): number of the random scans.
+            testID (int): The second argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        for _ in range(loopNum):
+            regsList = [random.randint(0, 1) for _ in range(REGS_NUM)]
+            coilList = [random.random() < 0.5 for _ in range(COILS_NUM)]
+            expectedOutput = self.runLadderLogicRef(regsList, coilList)
+            actualOutput = self.ffEngine.run(regsList, coilList)
+            assert actualOutput == expectedOutput, f"[ ] Test {testID}: flipFlopEngine random scan failed"
+        print(f"[x] Test {testID}: flipFlopEngine random scan passed")
+
+    def ladderRunTest(self, regsList, coilList, testID):
+        """
+        Performs a unit test for the runLadderLogic(), the valid input is calculated
+        by the compiled engine and the invalid input returns an empty list.
+        Args:
+            regsList (list): holding registers list.
+            coilList (list): source coils list.
+            testID (int): The third argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        expectedOutput = self.runLadderLogicRef(regsList, coilList)
+        actualOutput = self.runLadderLogic(regsList, coilList=coilList)
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: runLadderLogic() failed"
+        assert self.runLadderLogic(regsList[:-1], coilList=coilList) == [], f"[ ] Test {testID}: runLadderLogic() failed"
+        print(f"[x] Test {testID}: runLadderLogic() passed")
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def createTestObjects():
+    print("======================================= Creating Test Objects ========================================")
+    return testFlipFlopLadderLogic(None, ladderName='T_flipflop_logic_set')
+
+def runTestCases(ladderLogic):
+    print("========================== Running Test Cases for Signal PLC Ladder Logic ==========================")
+    print("(T-Flip-Flop Ladder Test Cases)")
+    ladderLogic.singleRegTest(1)
+    ladderLogic.randomScanTest(5000, 2)
+    # weline sensors 7, 9 (coil 15 on) and ccline sensors 12, 13 (coil 0 turned off).
+    regsList = [0]*REGS_NUM
+    for idx in (7, 9, 37, 38): regsList[idx] = 1
+    coilList = [True] + [False]*(COILS_NUM-1)
+    ladderLogic.ladderRunTest(regsList, coilList, 3)
+
+if __name__ == '__main__':
+    ladderLogic = createTestObjects()
+    runTestCases(ladderLogic)
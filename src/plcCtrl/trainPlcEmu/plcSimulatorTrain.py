@@ -65,9 +65,9 @@ class trainPowerPlcSet(plcSimulator.plcSimuInterface):
             the output coils state based on the ladder logic. 
         - Send the signal setup request to the real world emulator to change the signal.
     """
-    def __init__(self, parent, plcID, addressInfoDict, ladderObj, updateInt=0.6):
+    def __init__(self, parent, plcID, addressInfoDict, ladderObj, updateInt=0.6, **kwargs):
         super().__init__(parent, plcID, addressInfoDict, ladderObj,
-                        updateInt=updateInt)
+                        updateInt=updateInt, **kwargs)
 
     def initInputState(self):
         self.regsAddrs = (0, 10)
@@ -21,8 +21,11 @@ import hmiPanel as pnlFunction
 import hmiMgr as mapMgr
 import hmiPanelMap as pnlMap
 import scadaDataMgr as dataMgr
+import modbusTcpCom
 
 FRAME_SIZE = (1800, 1030)
+SENSOR_PLC_ID = 'PLC-00'    # junction sensors-signals PLC set.
+STATION_PLC_ID = 'PLC-03'   # station sensors-signals PLC set.
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -79,7 +82,23 @@ class UIFrame(wx.Frame):
         # Init the display manager
         gv.iMapMgr = mapMgr.MapMgr(self)
         # Init the data manager if we are under real mode.(need to connect to PLC module.)
-        if not gv.TEST_MD: gv.idataMgr = dataMgr.DataManager(self, gv.gPlcInfo)
+        if not gv.TEST_MD: 
+            gv.idataMgr = dataMgr.DataManager(self, gv.gPlcInfo)
+            self._initReadRanges()
+
+#-----------------------------------------------------------------------------
+    def _initReadRanges(self):
+        """ Subscribe all the PLC registers/coils ranges the UI panels need, the data 
+            manager will merge them to the minimal modbus read requests.
+        """
+        for key, pnlInfo in gv.gPlcPnlInfo.items():
+            gv.idataMgr.addReadRange(pnlInfo['tgt'], key+':hRegs', modbusTcpCom.MEM_HREGS, *pnlInfo['hRegsInfo'])
+            gv.idataMgr.addReadRange(pnlInfo['tgt'], key+':coils', modbusTcpCom.MEM_COILS, *pnlInfo['coilsInfo'])
+        for key, trackInfo in gv.gTrackConfig.items():
+            gv.idataMgr.addReadRange(SENSOR_PLC_ID, key+':sensors', modbusTcpCom.MEM_HREGS, *trackInfo['sensorIdx'])
+            gv.idataMgr.addReadRange(SENSOR_PLC_ID, key+':signals', modbusTcpCom.MEM_COILS, *trackInfo['signalIdx'])
+            gv.idataMgr.addReadRange(STATION_PLC_ID, key+':stationSensors', modbusTcpCom.MEM_HREGS, *trackInfo['stationSensorIdx'])
+            gv.idataMgr.addReadRange(STATION_PLC_ID, key+':stationSignals', modbusTcpCom.MEM_COILS, *trackInfo['stationSignalIdx'])
 
 #-----------------------------------------------------------------------------
     def _initElectricalLbs(self):
@@ -279,12 +298,10 @@ class UIFrame(wx.Frame):
         for key in self.plcPnls.keys():
             # update the holding registers
             tgtPlcID = gv.gPlcPnlInfo[key]['tgt']
-            rsIdx, reIdx = gv.gPlcPnlInfo[key]['hRegsInfo']
-            registList = gv.idataMgr.getPlcHRegsData(tgtPlcID, rsIdx, reIdx)
+            registList = gv.idataMgr.getReadRangeData(tgtPlcID, key+':hRegs')
             # print(registList)
             self.plcPnls[key].updateHoldingRegs(registList)
-            csIdx, ceIdx = gv.gPlcPnlInfo[key]['coilsInfo']
-            coilsList = gv.idataMgr.getPlcCoilsData(tgtPlcID, csIdx, ceIdx)
+            coilsList = gv.idataMgr.getReadRangeData(tgtPlcID, key+':coils')
             # print(coilsList)
             self.plcPnls[key].updateCoils(coilsList)
             self.plcPnls[key].updateDisplay()
@@ -293,28 +310,22 @@ class UIFrame(wx.Frame):
     def updateMapJunctionData(self):
         if gv.idataMgr is None: return False
         # update all the map junction sensor and signals
-        signalTgtPlcID = 'PLC-00'
         for key in gv.gTrackConfig.keys():
-            rsIdx, reIdx = gv.gTrackConfig[key]['sensorIdx']
-            registList = gv.idataMgr.getPlcHRegsData(signalTgtPlcID, rsIdx, reIdx)
+            registList = gv.idataMgr.getReadRangeData(SENSOR_PLC_ID, key+':sensors')
             #print(key)
             gv.iMapMgr.setSensors(key, registList)
-            csIdx, ceIdx = gv.gTrackConfig[key]['signalIdx']
-            coilsList = gv.idataMgr.getPlcCoilsData(signalTgtPlcID, csIdx, ceIdx)
+            coilsList = gv.idataMgr.getReadRangeData(SENSOR_PLC_ID, key+':signals')
             gv.iMapMgr.setSingals(key, coilsList)
 
 #-----------------------------------------------------------------------------
     def updateMapStationData(self):
         if gv.idataMgr is None: return False
         # update all the station sensros and signals
-        tgtPlcID = 'PLC-03'
         for key in gv.gTrackConfig.keys():
-            rsIdx, reIdx = gv.gTrackConfig[key]['stationSensorIdx']
-            registList = gv.idataMgr.getPlcHRegsData(tgtPlcID, rsIdx, reIdx)
+            registList = gv.idataMgr.getReadRangeData(STATION_PLC_ID, key+':stationSensors')
             #print(key)
             gv.iMapMgr.setStationsSensors(key, registList)
-            csIdx, ceIdx = gv.gTrackConfig[key]['stationSignalIdx']
-            coilsList = gv.idataMgr.getPlcCoilsData(tgtPlcID, csIdx, ceIdx)
+            coilsList = gv.idataMgr.getReadRangeData(STATION_PLC_ID, key+':stationSignals')
             gv.iMapMgr.setStationsSignals(key, coilsList)
 
 #-----------------------------------------------------------------------------
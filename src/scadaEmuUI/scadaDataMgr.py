@@ -13,12 +13,91 @@
 # License:     MIT License
 #-----------------------------------------------------------------------------
 
-import time
+import threading
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 
+import wx
 import scadaGobal as gv
 import modbusTcpCom
 
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class plcPoller(threading.Thread):
+    """ Thread to read all the PLCs' holding registers and coils in parallel (one 
+        thread pool worker per PLC) so the wx UI timer callback will not be blocked 
+        by a slow/dead PLC. Every poll cycle waits the PLCs' reply until the deadline, 
+        the PLC which doesn't reply in time is marked as disconnected and it will not 
+        be polled again until its in-flight read returns. The UI's coils writes are 
+        queued and sent by the PLC's poll worker before the read, so the UI thread 
+        never waits for the modbus client. The poll results are posted to the UI 
+        thread with wx.CallAfter().
+    """
+    def __init__(self, parent, deadline):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.parent = parent
+        self.deadline = deadline
+        self.pollPool = ThreadPoolExecutor(max_workers=max(1, len(parent.plcClients)))
+        self.pollFutures = {}   # in-flight read futures {plcID: future}
+        self.writeDict = {}     # queued coils writes {plcID: {coil idx: val}}
+        self.writeLock = threading.Lock()
+        self.pollEvent = threading.Event()
+        self.terminate = False
+
+    def run(self):
+        while not self.terminate:
+            self.pollEvent.wait()
+            self.pollEvent.clear()
+            if self.terminate: break
+            self.pollOnce()
+
+    def trigger(self):
+        """ Start a poll cycle, ignored if the previous cycle is still running."""
+        self.pollEvent.set()
+
+    def addWrite(self, plcID, changeDict):
+        """ Queue the coils changes {idx: val} to the PLC, the later change of a coil 
+            overwrites the not sent one. The changes are sent in the next poll cycle
+            which is started immediately.
+        """
+        with self.writeLock: self.writeDict.setdefault(plcID, {}).update(changeDict)
+        self.trigger()
+
+    def pollPlc(self, plcID):
+        """ Send the PLC's queued coils changes then read its data (in the PLC's 
+            thread pool worker).
+        """
+        with self.writeLock: changeDict = self.writeDict.pop(plcID, None)
+        if changeDict and not self.parent.plcClients[plcID].applyCoilsChanges(changeDict):
+            gv.gDebugPrint('DataManager: PLC %s set coils failed: %s' %(plcID, str(changeDict)), 
+                           logType=gv.LOG_WARN)
+        return self.parent.readPlcData(plcID)
+
+    def pollOnce(self):
+        """ Read all the PLCs in parallel and publish the results in the parent."""
+        for key in self.parent.plcClients.keys():
+            if key in self.pollFutures and not self.pollFutures[key].done(): continue
+            self.pollFutures[key] = self.pollPool.submit(self.pollPlc, key)
+        wait(list(self.pollFutures.values()), timeout=self.deadline)
+        resultDict = {}
+        for key, future in self.pollFutures.items():
+            if not future.done():
+                gv.gDebugPrint('DataManager: PLC %s poll time out' %str(key), logType=gv.LOG_WARN)
+                resultDict[key] = None
+                continue
+            try:
+                resultDict[key] = future.result()
+            except Exception as err:
+                gv.gDebugPrint('DataManager: PLC %s poll error: %s' %(key, str(err)), logType=gv.LOG_ERR)
+                resultDict[key] = None
+        if not self.terminate: wx.CallAfter(self.parent.publishPlcData, resultDict)
+
+    def stop(self):
+        self.terminate = True
+        self.pollEvent.set()
+        self.pollPool.shutdown(wait=False)
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class DataManager(object):
@@ -30,35 +109,89 @@ class DataManager(object):
         self.plcClients = OrderedDict()
         self.regsDict = {}
         self.coilsDict = {}
+        self.rangeDataDict = {} # subscribed read ranges data {plcID: {rangeKey: data}}
+        self.readPlanners = {}
         self.plcInfo = plcInfo
         self.plcConnectionState = {}
+        # the PLC connections are opened/reconnected by the connection manager in 
+        # background, so the HMI will not be blocked by the offline PLCs.
+        self.connMgr = modbusTcpCom.modbusConnMgr(stateCallback=self.onPlcConnState)
         for key, val in plcInfo.items():
             plcIpaddr = val['ipaddress']
             plcPort = val['port']
-            self.plcClients[key] = modbusTcpCom.modbusTcpClient(plcIpaddr, tgtPort=plcPort)
-            if self.plcClients[key].checkConn():
-                gv.gDebugPrint('DataManager: Connected to PLC', logType=gv.LOG_INFO)
-                self.plcConnectionState[key] = True
-            else:
-                gv.gDebugPrint('DataManager: Fail to connect to PLC', logType=gv.LOG_INFO)
-                self.plcConnectionState[key] = False
+            # the client time out is not longer than the poll deadline, so a dead PLC's 
+            # read will release its worker before the next poll cycle.
+            self.plcClients[key] = modbusTcpCom.modbusTcpClient(plcIpaddr, tgtPort=plcPort, 
+                                                                defaultTO=gv.gPlcPollTO, connect=False)
+            self.connMgr.addClient(key, self.plcClients[key])
+            self.plcConnectionState[key] = False
+            # the PLC's whole registers/coils range, the UI ranges added by addReadRange()
+            # will be merged with them in the read requests.
+            self.readPlanners[key] = modbusTcpCom.modbusReadPlanner(self.plcClients[key])
+            hRegsAddr, hRegsNum = val['hRegsInfo']
+            self.readPlanners[key].addRange(modbusTcpCom.MEM_HREGS, modbusTcpCom.MEM_HREGS, 
+                                            hRegsAddr, hRegsAddr + hRegsNum)
+            coilsAddr, coilsNum = val['coilsInfo']
+            self.readPlanners[key].addRange(modbusTcpCom.MEM_COILS, modbusTcpCom.MEM_COILS, 
+                                            coilsAddr, coilsAddr + coilsNum)
+            self.rangeDataDict[key] = {}
             self.regsDict[key] = []
             self.coilsDict[key] = []
+        self.poller = plcPoller(self, gv.gPlcPollTO)
+        self.poller.start()
+        self.connMgr.start()
         gv.gDebugPrint('ScadaHMI dataMgr inited', logType=gv.LOG_INFO)
 
+    #-----------------------------------------------------------------------------
+    def onPlcConnState(self, plcID, oldState, newState):
+        """ PLC connection state change call back (from the connection manager)."""
+        logType = gv.LOG_WARN if newState == modbusTcpCom.STATE_DISCONNECTED else gv.LOG_INFO
+        gv.gDebugPrint('DataManager: PLC %s connection %s -> %s' %(plcID, oldState, newState), 
+                       logType=logType)
+
     #-----------------------------------------------------------------------------
     def periodic(self, now):
-        """ Call back every periodic time."""
+        """ Call back every periodic time, trigger the background PLC poll cycle, 
+            the UI will get the last published PLCs data.
+        """
         gv.gDebugPrint('DataManager: get PLC information', logType=gv.LOG_INFO)
-        for key, val in self.plcClients.items():
-            hRegsAddr, hRegsNum = self.plcInfo[key]['hRegsInfo']
-            self.regsDict[key] = self.plcClients[key].getHoldingRegs(hRegsAddr, hRegsNum)
-            coilsAddr, coilsNum = self.plcInfo[key]['coilsInfo']
-            self.coilsDict[key] = self.plcClients[key].getCoilsBits(coilsAddr, coilsNum)
-            if self.regsDict[key] is None or self.coilsDict[key] is None:
-                self.plcConnectionState[key] = False
-            else:
-                self.plcConnectionState[key] = True
+        self.poller.trigger()
+
+    #-----------------------------------------------------------------------------
+    def addReadRange(self, plcID, rangeKey, memType, startIdx, endIdx):
+        """ Subscribe a PLC registers/coils [startIdx, endIdx) range, the data can be 
+            get by getReadRangeData() after the next poll cycle.
+            Args:
+                plcID (str): PLC ID
+                rangeKey (str): range subscriber's unique key.
+                memType (str): modbusTcpCom.MEM_HREGS or modbusTcpCom.MEM_COILS
+        """
+        if plcID in self.readPlanners.keys():
+            return self.readPlanners[plcID].addRange(rangeKey, memType, startIdx, endIdx)
+        return False
+
+    #-----------------------------------------------------------------------------
+    def readPlcData(self, plcID):
+        """ Read one PLC's subscribed registers and coils ranges with the minimal
+            requests (called in the poller's thread pool worker).
+            Returns: {rangeKey: data list or None if read failed}
+        """
+        return self.readPlanners[plcID].readAll()
+
+    def publishPlcData(self, resultDict):
+        """ Swap in the new PLCs data dicts (called in the UI thread), resultDict: 
+            {plcID: {rangeKey: data}}.
+        """
+        regsDict, coilsDict, stateDict, rangeDataDict = {}, {}, {}, {}
+        for key, rangeData in resultDict.items():
+            rangeData = rangeData or {}
+            regsDict[key] = rangeData.get(modbusTcpCom.MEM_HREGS)
+            coilsDict[key] = rangeData.get(modbusTcpCom.MEM_COILS)
+            stateDict[key] = bool(rangeData) and all(val is not None for val in rangeData.values())
+            rangeDataDict[key] = rangeData
+        self.regsDict, self.coilsDict = regsDict, coilsDict
+        self.plcConnectionState = stateDict
+        self.rangeDataDict = rangeDataDict
 
     #-----------------------------------------------------------------------------
     # define all the get() function here.
@@ -69,18 +202,24 @@ class DataManager(object):
 
     #-----------------------------------------------------------------------------
     def getPlcHRegsData(self, plcid, startIdx, endIdx):
-        if plcid in self.regsDict.keys():
-            if not self.regsDict[plcid] is None:
-                return self.regsDict[plcid][startIdx:endIdx]
+        regsList = self.regsDict.get(plcid)
+        if not regsList is None: return regsList[startIdx:endIdx]
         return None
 
     #-----------------------------------------------------------------------------
     def getPlcCoilsData(self, plcid, startIdx, endIdx):
-        if plcid in self.coilsDict.keys():
-            if not self.coilsDict[plcid] is None:
-                return self.coilsDict[plcid][startIdx:endIdx]
+        coilsList = self.coilsDict.get(plcid)
+        if not coilsList is None: return coilsList[startIdx:endIdx]
         return None
 
+    #-----------------------------------------------------------------------------
+    def getReadRangeData(self, plcID, rangeKey):
+        """ Return the last polled data list of the subscribed range, None if the 
+            range is not subscribed or read failed.
+        """
+        rangeData = self.rangeDataDict.get(plcID)
+        return None if rangeData is None else rangeData.get(rangeKey)
+
     #-----------------------------------------------------------------------------
     def setPlcCoilsData(self, plcid, idx, val):
         """ Set the PLC coils state
@@ -88,14 +227,31 @@ class DataManager(object):
                 plcid (str): PLC ID
                 idx (int): coils address index.
                 val (bool): coil on/off state.
+            Returns:
+                bool: True if the coil change is queued.
         """
-        if plcid in self.plcClients.keys():
-            gv.gDebugPrint('DataManager: set PLC coil:%s' %str((plcid, idx, val)), 
+        return self.setPlcCoilsBatch(plcid, {idx: val})
+
+    #-----------------------------------------------------------------------------
+    def setPlcCoilsBatch(self, plcid, changeDict):
+        """ Set several PLC coils state, the changes are queued and sent by the poller, 
+            the contiguous coils are set in one modbus request (FC15).
+            Args:
+                plcid (str): PLC ID
+                changeDict (dict): {coils address index: coil on/off state}
+            Returns:
+                bool: True if the coils changes are queued.
+        """
+        if plcid in self.plcClients.keys() and changeDict:
+            gv.gDebugPrint('DataManager: set PLC coils:%s' %str((plcid, changeDict)), 
                            logType=gv.LOG_INFO)
-            self.plcClients[plcid].setCoilsBit(idx, val)
-            time.sleep(0.1)
+            self.poller.addWrite(plcid, changeDict)
+            return True
+        return False
 
     def stop(self):
+        self.poller.stop()
+        self.connMgr.stop()
         for client in self.plcClients.values():
             client.close()
         gv.gDebugPrint('DataManager: Stopped all PLC clients', logType=gv.LOG_INFO)
\ No newline at end of file
@@ -0,0 +1,176 @@
+#-----------------------------------------------------------------------------
+# Name:        scadaDataMgrTest.py
+#
+# Purpose:     testcase program used to test the SCADA HMI data manager's PLC
+#              poller <scadaDataMgr.py>, the PLC is emulated by the modbus server
+#              fixture of the lib<modbusTcpComTest.py>.
+#              The config file scadaHMIConfig.txt needs to be created (copy from
+#              scadaHMIConfig_template.txt) before run the test.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2023/08/03
+# Version:     v_0.1
+# Copyright:   Copyright (c) 2023 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+
+import time
+import socket
+import threading
+
+import wx
+import scadaGobal as gv
+import modbusTcpComTest
+import scadaDataMgr
+
+LIVE_PLC_ID = 'PLC-00'
+DEAD_PLC_ID = 'PLC-01'
+DEAD_PLC_PORT = 5030
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class deadPlcServerThread(threading.Thread):
+    """
+    TCP server which accepts the connections but never replies, used to emulate a
+    PLC which stops responding.
+    """
+    def __init__(self, port):
+        super().__init__(daemon=True)
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', port))
+        self.server.listen(5)
+        self.connList = []
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                break
+            self.connList.append(conn)
+
+    def closeServer(self):
+        for conn in self.connList: conn.close()
+        self.server.close()
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class testScadaDataManager(scadaDataMgr.DataManager):
+    """
+    A subclass that inherits from the scadaDataMgr.DataManager class, the published
+    poll results are recorded so the test can wait for the poll cycle.
+
+    Unit Test Methods:
+        deadPlcTest(): Checks the dead PLC's poll times out at the deadline while the
+            live PLC's data is still published.
+        writeFlushTest(): Checks the queued coils writes are sent before the read in
+            the same poll cycle.
+    """
+    def __init__(self, parent, plcInfo):
+        self.publishList = []
+        super().__init__(parent, plcInfo)
+
+    def publishPlcData(self, resultDict):
+        super().publishPlcData(resultDict)
+        self.publishList.append(resultDict)
+
+    def waitPublish(self, app, timeout):
+        """ Process the wx.CallAfter() events until a poll result is published."""
+        publishCount = len(self.publishList)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            app.ProcessPendingEvents()
+            if len(self.publishList) > publishCount: return True
+            time.sleep(0.01)
+        return False
+
+    def waitConnected(self, plcID, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.plcClients[plcID].checkConn(): return True
+            time.sleep(0.1)
+        return False
+
+    def deadPlcTest(self, app, expectedOutput, testID):
+        """
+        Performs a unit test for the plcPoller.pollOnce(), the dead PLC's read doesn't
+        block the live PLC's data publish longer than the poll deadline.
+        Args:
+            app (wx.App): wx app to run the wx.CallAfter() publish.
+            expectedOutput (list): expected live PLC's holding registers.
+            testID (int): The third argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        startT = time.monotonic()
+        self.periodic(startT)
+        assert self.waitPublish(app, gv.gPlcPollTO * 2), f"[ ] Test {testID}: plcPoller() dead PLC failed"
+        pollT = time.monotonic() - startT
+        actualOutput = self.getPlcHRegsData(LIVE_PLC_ID, 0, 4)
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: plcPoller() dead PLC failed"
+        assert self.getConntionState(LIVE_PLC_ID), f"[ ] Test {testID}: plcPoller() dead PLC failed"
+        assert not self.getConntionState(DEAD_PLC_ID), f"[ ] Test {testID}: plcPoller() dead PLC failed"
+        assert self.getPlcHRegsData(DEAD_PLC_ID, 0, 4) is None, f"[ ] Test {testID}: plcPoller() dead PLC failed"
+        assert pollT < gv.gPlcPollTO * 1.5, f"[ ] Test {testID}: plcPoller() dead PLC failed"
+        print(f"[x] Test {testID}: plcPoller() dead PLC passed")
+
+    def writeFlushTest(self, app, changeDict, expectedOutput, testID):
+        """
+        Performs a unit test for the plcPoller.addWrite(), the queued coils changes are
+        sent by the PLC's poll worker before its read, so the poll result published
+        after the write already shows the changed coils.
+        Args:
+            app (wx.App): wx app to run the wx.CallAfter() publish.
+            changeDict (dict): coils changes {coil idx: val}.
+            expectedOutput (list): expected live PLC's coils.
+            testID (int): The fourth argument representing the ID tagged to this test run.
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        """
+        assert self.setPlcCoilsBatch(LIVE_PLC_ID, changeDict), f"[ ] Test {testID}: plcPoller() write failed"
+        assert self.waitPublish(app, gv.gPlcPollTO * 2), f"[ ] Test {testID}: plcPoller() write failed"
+        actualOutput = self.getPlcCoilsData(LIVE_PLC_ID, 0, 4)
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: plcPoller() write failed"
+        with self.poller.writeLock:
+            assert not LIVE_PLC_ID in self.poller.writeDict, f"[ ] Test {testID}: plcPoller() write failed"
+        print(f"[x] Test {testID}: plcPoller() write passed")
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def createTestObjects():
+    print("======================================= Creating Test Objects ========================================")
+    app = wx.App(False)
+    ladderLogic = modbusTcpComTest.stubLadderLogic(None)
+    plcHandler = modbusTcpComTest.testPLCDataHandler(['127.0.0.1'], ['127.0.0.1'], ladderLogic)
+    server = modbusTcpComTest.testModbusServerThread(None, 1, "Server Thread", plcHandler)
+    server.start()
+    time.sleep(0.5)
+    plcHandler.presetConfigurations(server.getServer().getServerInfo())
+    deadServer = deadPlcServerThread(DEAD_PLC_PORT)
+    deadServer.start()
+    plcInfo = {
+        LIVE_PLC_ID: {'ipaddress': '127.0.0.1', 'port': 502, 'hRegsInfo': (0, 4), 'coilsInfo': (0, 4)},
+        DEAD_PLC_ID: {'ipaddress': '127.0.0.1', 'port': DEAD_PLC_PORT, 'hRegsInfo': (0, 4), 'coilsInfo': (0, 4)}
+    }
+    dataMgr = testScadaDataManager(None, plcInfo)
+    return (app, server, deadServer, dataMgr)
+
+def runTestCases(app, server, deadServer, dataMgr):
+    print("========================== Running Test Cases for SCADA HMI Data Manager ==========================")
+    print("(PLC Poller Test Cases)")
+    assert dataMgr.waitConnected(LIVE_PLC_ID, 5), "[ ] Test 1: PLC connection failed"
+    assert dataMgr.waitConnected(DEAD_PLC_ID, 5), "[ ] Test 1: PLC connection failed"
+    dataMgr.deadPlcTest(app, [0, 0, 1, 1], 1)
+    # the dead PLC's read may be still in flight, it is not polled again.
+    dataMgr.deadPlcTest(app, [0, 0, 1, 1], 2)
+    # the stub ladder sets the coils to the reverse of the holding registers [0, 0, 1, 1].
+    dataMgr.writeFlushTest(app, {2: True, 3: True}, [True, True, True, True], 3)
+    dataMgr.stop()
+    server.closeServer()
+    deadServer.closeServer()
+
+if __name__ == '__main__':
+    app, server, deadServer, dataMgr = createTestObjects()
+    runTestCases(app, server, deadServer, dataMgr)
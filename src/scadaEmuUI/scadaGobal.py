@@ -141,6 +141,8 @@ gPlcPnlInfo['PLC-05'] = {'id': 'PLC-05', 'label': 'PLC-05[Slave:slot-2]',
                          'tgt': 'PLC-03', 'hRegsInfo': (16, 22), 'coilsInfo': (16, 22)}
 
 gUpdateRate = float(CONFIG_DICT['CLK_INT'])    # main frame update rate 1 sec.
+# PLC poll deadline (sec), the PLC doesn't reply in time is marked as disconnected.
+gPlcPollTO = float(CONFIG_DICT['PLC_POLL_TO']) if 'PLC_POLL_TO' in CONFIG_DICT.keys() else 1.5
 
 #-------<GLOBAL PARAMTERS>-----------------------------------------------------
 iMainFrame = None   # UI MainFrame.
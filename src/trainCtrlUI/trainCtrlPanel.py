@@ -291,7 +291,7 @@ class PanelTrain(wx.Panel):
             dlg = wx.MessageDialog(None, "Confirm Power on %s" %'-'.join((self.trackId, str(self.trainId))),
                                    'Train Pwr Change',wx.YES_NO | wx.ICON_WARNING)
             result = dlg.ShowModal()
-            if result == wx.ID_YES: gv.idataMgr.setPlcCoilsData(TrainTgtPlcID, idx, True)
+            if result == wx.ID_YES: gv.idataMgr.setPlcCoilsBatch(TrainTgtPlcID, {idx: True})
 
     #-----------------------------------------------------------------------------
     def turnOffTrain(self, event):
@@ -304,7 +304,7 @@ class PanelTrain(wx.Panel):
             dlg = wx.MessageDialog(None, "Confirm Power on %s" %'-'.join((self.trackId, str(self.trainId))),
                                    'Train Pwr Change',wx.YES_NO | wx.ICON_WARNING)
             result = dlg.ShowModal()
-            if result == wx.ID_YES: gv.idataMgr.setPlcCoilsData(TrainTgtPlcID, idx, False)
+            if result == wx.ID_YES: gv.idataMgr.setPlcCoilsBatch(TrainTgtPlcID, {idx: False})
 
 
 #-----------------------------------------------------------------------------
@@ -22,6 +22,7 @@ import wx
 import trainCtrlGlobal as gv
 import trainCtrlPanel as pnlFunction
 import trainDataMgr as dataMgr
+import modbusTcpCom
 
 FRAME_SIZE = (1860, 1000)
 
@@ -79,7 +80,18 @@ class UIFrame(wx.Frame):
         # Init the display manager 
         gv.iMapMgr = dataMgr.MapManager(self)
         # Init the data manager if we are under real mode.(need to connect to PLC module.)
-        if not gv.TEST_MD: gv.idataMgr = dataMgr.DataManager(self, gv.gPlcInfo)
+        if not gv.TEST_MD: 
+            gv.idataMgr = dataMgr.DataManager(self, gv.gPlcInfo)
+            self._initReadRanges()
+
+#-----------------------------------------------------------------------------
+    def _initReadRanges(self):
+        """ Subscribe all the PLC registers/coils ranges the PLC panels need, the data 
+            manager will merge them to the minimal modbus read requests.
+        """
+        for key, pnlInfo in gv.gPlcPnlInfo.items():
+            gv.idataMgr.addReadRange(pnlInfo['tgt'], key+':hRegs', modbusTcpCom.MEM_HREGS, *pnlInfo['hRegsInfo'])
+            gv.idataMgr.addReadRange(pnlInfo['tgt'], key+':coils', modbusTcpCom.MEM_COILS, *pnlInfo['coilsInfo'])
 
 #-----------------------------------------------------------------------------
     def _initElectricalLbs(self):
@@ -296,9 +308,10 @@ class UIFrame(wx.Frame):
         if gv.idataMgr is None: return False
         gv.gDebugPrint('Power all the trains power state to PLC', logType=gv.LOG_INFO)
         csIdx, ceIdx = (0, 10)
+        changeDict = {}
         for idx in range(csIdx, ceIdx):
-            state = gv.gTrainsPwrList[idx] if idx < len(gv.gTrainsPwrList) else False
-            gv.idataMgr.setPlcCoilsData(gv.PLC_ID, idx, state)
+            changeDict[idx] = gv.gTrainsPwrList[idx] if idx < len(gv.gTrainsPwrList) else False
+        gv.idataMgr.setPlcCoilsBatch(gv.PLC_ID, changeDict)
         return True
 
 #-----------------------------------------------------------------------------
@@ -308,7 +321,7 @@ class UIFrame(wx.Frame):
         if gv.idataMgr is None: return False
         gv.gDebugPrint('Chage the collision avoidance config', logType=gv.LOG_INFO)
         idx = 10
-        gv.idataMgr.setPlcCoilsData(gv.PLC_ID, idx, gv.gAutoCA)
+        gv.idataMgr.setPlcCoilsBatch(gv.PLC_ID, {idx: gv.gAutoCA})
         return True
 
 #-----------------------------------------------------------------------------
@@ -349,12 +362,10 @@ class UIFrame(wx.Frame):
         for key in self.plcPnls.keys():
             tgtPlcID = gv.gPlcPnlInfo[key]['tgt']
             # update the holding registers
-            rsIdx, reIdx = gv.gPlcPnlInfo[key]['hRegsInfo']
-            registList = gv.idataMgr.getPlcHRegsData(tgtPlcID, rsIdx, reIdx)
+            registList = gv.idataMgr.getReadRangeData(tgtPlcID, key+':hRegs')
             self.plcPnls[key].updateHoldingRegs(registList)
             # update the coils
-            csIdx, ceIdx = gv.gPlcPnlInfo[key]['coilsInfo']
-            coilsList = gv.idataMgr.getPlcCoilsData(tgtPlcID, csIdx, ceIdx)
+            coilsList = gv.idataMgr.getReadRangeData(tgtPlcID, key+':coils')
             self.plcPnls[key].updateCoils(coilsList)
             # update the UI display
             self.plcPnls[key].updateDisplay()
@@ -402,7 +413,7 @@ class UIFrame(wx.Frame):
             if result == wx.ID_YES:
                 val = self.caCombo.GetSelection() == 0
                 TrainTgtPlcID = 'PLC-06'
-                gv.idataMgr.setPlcCoilsData(TrainTgtPlcID, 10, val)
+                gv.idataMgr.setPlcCoilsBatch(TrainTgtPlcID, {10: val})
 
 #-----------------------------------------------------------------------------
     def onClose(self, evt):
@@ -13,7 +13,6 @@
 # License:     MIT License  
 #-----------------------------------------------------------------------------
 
-import time
 from collections import OrderedDict
 from random import randint
 
@@ -164,35 +163,64 @@ class DataManager(object):
         self.plcClients = OrderedDict()
         self.regsDict = {}
         self.coilsDict = {}
+        self.rangeDataDict = {} # subscribed read ranges data {plcID: {rangeKey: data}}
+        self.readPlanners = {}
         self.plcInfo = plcInfo
         self.plcConnectionState = {}
+        # the PLC connections are opened/reconnected by the connection manager in 
+        # background, so the HMI will not be blocked by the offline PLCs.
+        self.connMgr = modbusTcpCom.modbusConnMgr(stateCallback=self.onPlcConnState)
         for key, val in plcInfo.items():
             plcIpaddr = val['ipaddress']
             plcPort = val['port']
-            self.plcClients[key] = modbusTcpCom.modbusTcpClient(plcIpaddr, tgtPort=plcPort)
-            if self.plcClients[key].checkConn():
-                gv.gDebugPrint('DataManager: Connected to PLC.', logType=gv.LOG_INFO)
-                self.plcConnectionState[key] = True
-            else:
-                gv.gDebugPrint('DataManager: Failed to connect to PLC.', logType=gv.LOG_INFO)
-                self.plcConnectionState[key] = False
+            self.plcClients[key] = modbusTcpCom.modbusTcpClient(plcIpaddr, tgtPort=plcPort, connect=False)
+            self.connMgr.addClient(key, self.plcClients[key])
+            self.plcConnectionState[key] = False
+            # the PLC's whole registers/coils range, the UI ranges added by addReadRange()
+            # will be merged with them in the read requests.
+            self.readPlanners[key] = modbusTcpCom.modbusReadPlanner(self.plcClients[key])
+            hRegsAddr, hRegsNum = val['hRegsInfo']
+            self.readPlanners[key].addRange(modbusTcpCom.MEM_HREGS, modbusTcpCom.MEM_HREGS, 
+                                            hRegsAddr, hRegsAddr + hRegsNum)
+            coilsAddr, coilsNum = val['coilsInfo']
+            self.readPlanners[key].addRange(modbusTcpCom.MEM_COILS, modbusTcpCom.MEM_COILS, 
+                                            coilsAddr, coilsAddr + coilsNum)
+            self.rangeDataDict[key] = {}
             self.regsDict[key] = []
             self.coilsDict[key] = []
+        self.connMgr.start()
         gv.gDebugPrint('TrainsHMI dataMgr inited', logType=gv.LOG_INFO)
 
+    #-----------------------------------------------------------------------------
+    def onPlcConnState(self, plcID, oldState, newState):
+        """ PLC connection state change call back (from the connection manager)."""
+        logType = gv.LOG_WARN if newState == modbusTcpCom.STATE_DISCONNECTED else gv.LOG_INFO
+        gv.gDebugPrint('DataManager: PLC %s connection %s -> %s' %(plcID, oldState, newState), 
+                       logType=logType)
+
     #-----------------------------------------------------------------------------
     def periodic(self, now):
         """ Call back every periodic time."""
         gv.gDebugPrint('DataManager: try to get PLC information', logType=gv.LOG_INFO)
-        for key, val in self.plcClients.items():
-            hRegsAddr, hRegsNum = self.plcInfo[key]['hRegsInfo']
-            self.regsDict[key] = self.plcClients[key].getHoldingRegs(hRegsAddr, hRegsNum)
-            coilsAddr, coilsNum = self.plcInfo[key]['coilsInfo']
-            self.coilsDict[key] = self.plcClients[key].getCoilsBits(coilsAddr, coilsNum)
-            if self.regsDict[key] is None or self.coilsDict[key] is None:
-                self.plcConnectionState[key] = False
-            else:
-                self.plcConnectionState[key] = True
+        for key, planner in self.readPlanners.items():
+            rangeData = planner.readAll()
+            self.rangeDataDict[key] = rangeData
+            self.regsDict[key] = rangeData.get(modbusTcpCom.MEM_HREGS)
+            self.coilsDict[key] = rangeData.get(modbusTcpCom.MEM_COILS)
+            self.plcConnectionState[key] = all(val is not None for val in rangeData.values())
+
+    #-----------------------------------------------------------------------------
+    def addReadRange(self, plcID, rangeKey, memType, startIdx, endIdx):
+        """ Subscribe a PLC registers/coils [startIdx, endIdx) range, the data can be 
+            get by getReadRangeData() after the next periodic().
+            Args:
+                plcID (str): PLC ID
+                rangeKey (str): range subscriber's unique key.
+                memType (str): modbusTcpCom.MEM_HREGS or modbusTcpCom.MEM_COILS
+        """
+        if plcID in self.readPlanners.keys():
+            return self.readPlanners[plcID].addRange(rangeKey, memType, startIdx, endIdx)
+        return False
     #-----------------------------------------------------------------------------
     # define all the get() function here.
     def getPlcHRegsData(self, plcid, startIdx, endIdx):
@@ -208,6 +236,15 @@ class DataManager(object):
                 return self.coilsDict[plcid][startIdx:endIdx]
         return None
 
+    #-----------------------------------------------------------------------------
+    def getReadRangeData(self, plcID, rangeKey):
+        """ Return the last read data list of the subscribed range, None if the range 
+            is not subscribed or read failed.
+        """
+        if plcID in self.rangeDataDict.keys():
+            return self.rangeDataDict[plcID].get(rangeKey)
+        return None
+
     #-----------------------------------------------------------------------------
     def getConntionState(self, plcID):
         if plcID in self.plcClients.keys():
@@ -239,15 +276,30 @@ class DataManager(object):
                 plcid (str): PLC ID
                 idx (int): coils address index.
                 val (bool): coil on/off state.
+            Returns:
+                bool: True if the coil is set.
         """
-        if plcid in self.plcClients.keys():
-            gv.gDebugPrint('DataManager: set PLC coil:%s' %str((plcid, idx, val)), 
+        return self.setPlcCoilsBatch(plcid, {idx: val})
+
+    #-----------------------------------------------------------------------------
+    def setPlcCoilsBatch(self, plcid, changeDict):
+        """ Set several PLC coils state, the contiguous coils are set in one modbus 
+            request (FC15).
+            Args:
+                plcid (str): PLC ID
+                changeDict (dict): {coils address index: coil on/off state}
+            Returns:
+                bool: True if all the coils are set.
+        """
+        if plcid in self.plcClients.keys() and changeDict:
+            gv.gDebugPrint('DataManager: set PLC coils:%s' %str((plcid, changeDict)), 
                            logType=gv.LOG_INFO)
-            self.plcClients[plcid].setCoilsBit(idx, val)
-            time.sleep(0.1)
+            return bool(self.plcClients[plcid].applyCoilsChanges(changeDict))
+        return False
     
     #-----------------------------------------------------------------------------
     def stop(self):
+        self.connMgr.stop()
         for client in self.plcClients.values():
             client.close()
         gv.gDebugPrint('DataManager: Stopped all PLC clients', logType=gv.LOG_INFO)
\ No newline at end of file